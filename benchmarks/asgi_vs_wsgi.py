@@ -0,0 +1,80 @@
+"""Side-by-side load test of the gunicorn (WSGI) and uvicorn (ASGI) deployments.
+
+Starts each server from web_flask/ with the same worker count, drives
+POST /api/v1/register over keep-alive connections at the given concurrency
+and prints throughput and latency percentiles. Needs the settings module
+and a reachable broker (or the stand-ins from the benchmark suite).
+
+    python benchmarks/asgi_vs_wsgi.py --workers 2 --concurrency 200 --duration 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from loadgen import http_load, rotating_client_ip
+
+WEB_FLASK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'web_flask')
+
+SERVERS = {
+    # gunicorn.conf.py in web_flask/ is picked up too; flags here take precedence
+    'gunicorn-sync': ['gunicorn', '--workers', '{workers}', '--worker-class', 'sync',
+                      '--bind', '127.0.0.1:{port}', 'run:app'],
+    'gunicorn-gthread': ['gunicorn', '--workers', '{workers}', '--threads', '16', '--worker-class', 'gthread',
+                         '--bind', '127.0.0.1:{port}', 'run:app'],
+    'uvicorn-asgi': ['uvicorn', '--workers', '{workers}', '--host', '127.0.0.1', '--port', '{port}',
+                     '--log-level', 'warning', 'asgi:app'],
+}
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(('127.0.0.1', port)) == 0:
+                return
+        time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start within {timeout}s")
+
+
+def run_server(name, workers, port, concurrency, duration):
+    command = [part.format(workers=workers, port=port) for part in SERVERS[name]]
+    process = subprocess.Popen(command, cwd=WEB_FLASK_DIR)
+    try:
+        wait_for_port(port)
+        return asyncio.run(http_load('127.0.0.1', port, concurrency, duration=duration, headers=rotating_client_ip))
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--servers', nargs='+', default=list(SERVERS), choices=list(SERVERS))
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.servers:
+        results[name] = run_server(name, args.workers, args.port, args.concurrency, args.duration)
+
+    print(f"{'server':<18}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  statuses")
+    for name, result in results.items():
+        print(f"{name:<18}{result['throughput_rps']:>10.1f}{result['p50_ms']:>10.2f}"
+              f"{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}  {result['statuses']}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
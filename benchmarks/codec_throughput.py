@@ -0,0 +1,48 @@
+"""Encode/decode throughput of the registration message codecs.
+
+Uses a registration message as published by web_flask and reports
+operations per second and body size for every codec that is installed.
+
+    python benchmarks/codec_throughput.py --number 200000
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'web_flask'))
+
+from core.connector.message_codec import available_codecs, decode  # noqa: E402
+
+MESSAGE = {
+    'full_name': 'Ковалёв Евгений',
+    'email': 'john.doe@example.com',
+    'accept_license': True,
+    'accept_age': True,
+    'timestamp': '2024-12-18T21:08:49.865883',
+    'registration_id': '0b8f9a3e-5d1c-4a7e-9a52-1f0c2d3e4b5a',
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'codec':<10}{'bytes':>8}{'encode/s':>14}{'decode/s':>14}{'header decode/s':>18}")
+    for name, codec in available_codecs().items():
+        body = codec.encode(MESSAGE)
+        assert decode(body, codec.content_type) == MESSAGE
+        encode_time = min(timeit.repeat(lambda: codec.encode(MESSAGE), number=args.number, repeat=args.repeat))
+        decode_time = min(timeit.repeat(lambda: codec.decode(body), number=args.number, repeat=args.repeat))
+        # What the consumer pays, including the content-type dispatch
+        header_time = min(timeit.repeat(lambda: decode(body, codec.content_type),
+                                        number=args.number, repeat=args.repeat))
+        print(f"{name:<10}{len(body):>8}{args.number / encode_time:>14,.0f}"
+              f"{args.number / decode_time:>14,.0f}{args.number / header_time:>18,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Worker cold-start time of web_flask.
+
+Imports ``run`` in fresh interpreters, the way a gunicorn worker without
+preload_app does, and reports how long it takes until the app object is
+ready, plus the schema bootstrap (init_db) on its own. Run it against a
+database whose schema is already current to see the steady-state cost
+every restart pays.
+
+    python benchmarks/cold_start.py --runs 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+WEB_FLASK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'web_flask')
+
+PROBES = {
+    'app import': (
+        "import time; started = time.perf_counter(); import run; "
+        "print(time.perf_counter() - started)"
+    ),
+    'schema bootstrap': (
+        "import time, settings; from core.db.utils import init_db; started = time.perf_counter(); "
+        "init_db(settings.DATABASE_URL); print(time.perf_counter() - started)"
+    ),
+}
+
+
+def measure(probe, runs):
+    """Seconds per fresh-interpreter run; the first run may apply migrations and is dropped"""
+    samples = []
+    for _ in range(runs + 1):
+        output = subprocess.run(
+            [sys.executable, '-c', probe], cwd=WEB_FLASK_DIR, check=True, capture_output=True, text=True
+        ).stdout
+        samples.append(float(output.strip().splitlines()[-1]))
+    return samples[1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    results = {}
+    for name, probe in PROBES.items():
+        samples = measure(probe, args.runs)
+        results[name] = {
+            'runs': len(samples),
+            'mean_ms': statistics.mean(samples) * 1000,
+            'median_ms': statistics.median(samples) * 1000,
+            'min_ms': min(samples) * 1000,
+        }
+        print(f"{name:<18} median {results[name]['median_ms']:8.1f} ms   min {results[name]['min_ms']:8.1f} ms")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
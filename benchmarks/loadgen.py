@@ -0,0 +1,100 @@
+"""Shared load generation and latency statistics for the benchmark scripts."""
+
+import asyncio
+import itertools
+import json
+import time
+
+_sequence = itertools.count()
+
+
+def registration_payload():
+    """A valid registration with an address no earlier request used"""
+    return {
+        'full_name': 'Bench User',
+        'email': f'bench{next(_sequence)}@example.com',
+        'accept_license': True,
+        'accept_age': True,
+    }
+
+
+def rotating_client_ip():
+    """X-Real-IP header from a spread of addresses, so per-IP rate limits stay out of the way"""
+    n = next(_sequence)
+    return f'X-Real-IP: 10.{n % 250}.{n // 250 % 250}.1\r\n'
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summarize(latencies, elapsed, statuses):
+    """Throughput and latency percentiles (ms) for one run"""
+    return {
+        'requests': len(latencies),
+        'throughput_rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': max(latencies, default=0.0) * 1000,
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+async def _client(host, port, path, deadline, remaining, latencies, statuses, headers):
+    reader = writer = None
+    try:
+        while time.monotonic() < deadline and remaining[0] > 0:
+            remaining[0] -= 1
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            body = json.dumps(registration_payload()).encode('utf-8')
+            request = (
+                f'POST {path} HTTP/1.1\r\nHost: {host}\r\n'
+                f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+                f'{headers() if callable(headers) else headers}\r\n'
+            ).encode('latin-1') + body
+            started = time.perf_counter()
+            writer.write(request)
+            status_line = await reader.readline()
+            length, close = 0, False
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                name = name.lower()
+                if name == 'content-length':
+                    length = int(value)
+                elif name == 'connection':
+                    close = value.strip().lower() == 'close'
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+            status = int(status_line.split()[1]) if status_line else 0
+            statuses[status] = statuses.get(status, 0) + 1
+            # Servers without keep-alive (werkzeug's) close after every response
+            if close or not status_line:
+                writer.close()
+                writer = None
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def http_load(host, port, concurrency, duration=None, requests=None, path='/api/v1/register', headers=''):
+    """POST registrations over keep-alive connections until duration or request count runs out.
+
+    headers is extra raw header text, or a callable returning it per request.
+    """
+    latencies, statuses = [], {}
+    deadline = time.monotonic() + (duration if duration is not None else float('inf'))
+    remaining = [requests if requests is not None else float('inf')]
+    started = time.monotonic()
+    await asyncio.gather(*(
+        _client(host, port, path, deadline, remaining, latencies, statuses, headers)
+        for _ in range(concurrency)
+    ))
+    return summarize(latencies, time.monotonic() - started, statuses)
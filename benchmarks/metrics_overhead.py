@@ -0,0 +1,78 @@
+"""Cost of one metrics observation and of a /metrics scrape.
+
+Observations go to a registry in a temporary directory; the scrape is
+timed with as many process files as gunicorn workers would write. The
+"middleware" case is RequestMetrics' after_request hook inside a request
+context for a blueprint route, i.e. what every request pays.
+
+    python benchmarks/metrics_overhead.py --number 1000000 --workers 9
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'web_flask'))
+
+from core.metrics.registry import MetricsRegistry, metrics  # noqa: E402
+
+LABELS = ('api_bluep', '/api/v1/register', 'POST', 200)
+
+
+def time_middleware(number, repeat):
+    """Seconds per RequestMetrics._observe call for a matched blueprint route"""
+    from flask import Blueprint, Flask, Response
+    from core.metrics.middleware import RequestMetrics
+
+    app = Flask(__name__)
+    blueprint = Blueprint('api_bluep', __name__)
+    blueprint.add_url_rule('/api/v1/register', 'register', lambda: '', methods=['POST'])
+    app.register_blueprint(blueprint)
+    request_metrics = RequestMetrics(app)
+    response = Response('ok')
+    with app.test_request_context('/api/v1/register', method='POST'):
+        app.preprocess_request()
+        return min(timeit.repeat(lambda: request_metrics._observe(response), number=number, repeat=repeat)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=9, help='process files summed per scrape')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        registry = MetricsRegistry(directory=directory)
+        counter = registry.counter('bench_total', 'Counter', ('mode',))
+        histogram = registry.histogram('bench_seconds', 'Histogram', ('blueprint', 'route', 'method', 'status'))
+        cases = {
+            'counter.inc': counter.labels('sync').inc,
+            'histogram.observe': lambda child=histogram.labels(*LABELS): child.observe(0.012),
+            # Resolving the child on every observation
+            'labels().observe': lambda: histogram.labels(*LABELS).observe(0.012),
+        }
+        for name, fn in cases.items():
+            seconds = min(timeit.repeat(fn, number=args.number, repeat=args.repeat))
+            print(f"{name:<20}{seconds / args.number * 1e9:>10.0f} ns")
+
+        for pid in range(args.workers - 1):
+            # Copies of this process's table stand in for other workers
+            with open(os.path.join(directory, f'obo-metrics-{os.getpid()}.shm'), 'rb') as src, \
+                    open(os.path.join(directory, f'obo-metrics-0{pid}.shm'), 'wb') as dst:
+                dst.write(src.read())
+        seconds = min(timeit.repeat(registry.render, number=100, repeat=args.repeat)) / 100
+        print(f"{'render':<20}{seconds * 1e3:>10.2f} ms  ({args.workers} process files)")
+
+    # The middleware observes into the process-wide registry, which would
+    # otherwise share this process's file with the one above
+    with tempfile.TemporaryDirectory() as directory:
+        metrics.configure({'directory': directory})
+        seconds = time_middleware(args.number, args.repeat)
+        print(f"{'middleware':<20}{seconds * 1e9:>10.0f} ns")
+
+
+if __name__ == '__main__':
+    main()
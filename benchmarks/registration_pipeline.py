@@ -0,0 +1,285 @@
+"""Reproducible benchmark of the registration pipeline with local stand-ins.
+
+Drives POST /api/v1/register through the Flask app in-process (test client)
+and over a real socket (threaded werkzeug server), at one or more
+concurrency levels. RabbitMQ is replaced by the in-memory broker from
+standins.py and, for the email stage, SMTP by the aiosmtpd sink, so runs
+need no external services and are comparable between commits.
+
+Reports throughput, p50/p95/p99 latency and per-request memory allocation
+(tracemalloc peak and retained bytes), and writes everything to JSON:
+
+    python benchmarks/registration_pipeline.py --concurrency 1 8 32 --requests 2000
+    python benchmarks/registration_pipeline.py --compare benchmarks/results/registration_pipeline-abc1234.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from loadgen import http_load, registration_payload, rotating_client_ip, summarize
+from standins import InMemoryBroker, SMTPSink
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEB_FLASK_DIR = os.path.join(ROOT, 'web_flask')
+NOTIFICATION_DIR = os.path.join(ROOT, 'notification_service')
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+QUEUE = 'web.registration.queue'
+
+SETTINGS = '''\
+DATABASE_URL = 'sqlite:///{directory}/bench.sqlite'
+ASYNC_DATABASE_URL = 'sqlite+aiosqlite:///{directory}/bench.sqlite'
+SECRET_KEY = 'bench'
+RABBITMQ_CONFIG = {{'host': 'localhost', 'port': 5672, 'username': 'guest', 'password': 'guest',
+                   'queue_name': {queue!r}, 'publish_mode': {publish_mode!r}}}
+DEDUP_CONFIG = {{'directory': {directory!r}, 'name': 'bench-dedup'}}
+METRICS_CONFIG = {{'directory': {directory!r}}}
+RATE_LIMITS = {{}}
+OUTBOX_CONFIG = {outbox}
+SMTP_SERVER = '127.0.0.1'
+SMTP_PORT = {smtp_port}
+SMTP_USERNAME = 'bench'
+SMTP_PASSWORD = 'bench'
+SENDER_EMAIL = 'noreply@example.com'
+BASE_URL = 'http://localhost'
+'''
+
+# Sends through the real EmailSender in a separate interpreter: the services
+# both have a top-level ``core`` package, so they cannot share a process
+EMAIL_PROBE = '''
+import json, sys, time
+from concurrent.futures import ThreadPoolExecutor
+from core.email.email_sender import EmailSender
+sender = EmailSender()
+def send(i):
+    started = time.perf_counter()
+    ok = sender.send_registration_email(f'bench{i}@example.com', 'uuid-%d' % i)
+    return ok, time.perf_counter() - started
+started = time.perf_counter()
+with ThreadPoolExecutor(int(sys.argv[2])) as pool:
+    results = list(pool.map(send, range(int(sys.argv[1]))))
+print(json.dumps({'elapsed': time.perf_counter() - started, 'results': results}))
+'''
+
+
+def write_settings(args, directory):
+    outbox = f"{{'path': {os.path.join(directory, 'outbox.sqlite')!r}}}" if args.outbox else 'None'
+    with open(os.path.join(directory, 'settings.py'), 'w') as f:
+        f.write(SETTINGS.format(
+            directory=directory, queue=QUEUE, publish_mode=args.publish_mode,
+            outbox=outbox, smtp_port=args.smtp_port,
+        ))
+
+
+def load_app(settings_dir):
+    sys.path[:0] = [settings_dir, WEB_FLASK_DIR]
+    import logging
+    logging.disable(logging.INFO)
+    from run import app
+    return app
+
+
+def run_inprocess(app, concurrency, requests):
+    """Threads sharing the app, one test client each, like gthread workers"""
+    latencies, statuses, lock = [], {}, threading.Lock()
+    remaining = [requests]
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            started = time.perf_counter()
+            response = client.post('/api/v1/register', json=registration_payload())
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, time.monotonic() - started, statuses)
+
+
+def run_socket(app, concurrency, requests):
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        return asyncio.run(http_load(
+            '127.0.0.1', server.server_port, concurrency, requests=requests, headers=rotating_client_ip
+        ))
+    finally:
+        server.shutdown()
+
+
+def measure_allocations(app, samples):
+    """Per-request tracemalloc peak and retained bytes, measured sequentially"""
+    client = app.test_client()
+    for _ in range(20):
+        client.post('/api/v1/register', json=registration_payload())
+    peaks, retained = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(samples):
+            payload = registration_payload()
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            client.post('/api/v1/register', json=payload)
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(current - before)
+    finally:
+        tracemalloc.stop()
+    return {
+        'samples': samples,
+        'peak_kib_p50': statistics.median(peaks) / 1024,
+        'peak_kib_max': max(peaks) / 1024,
+        'retained_bytes_mean': statistics.mean(retained),
+    }
+
+
+def run_email(args, settings_dir):
+    """EmailSender throughput against the SMTP sink"""
+    with SMTPSink(port=args.smtp_port) as sink:
+        output = subprocess.run(
+            [sys.executable, '-c', EMAIL_PROBE, str(args.email), str(args.email_concurrency)],
+            cwd=NOTIFICATION_DIR, env={**os.environ, 'PYTHONPATH': settings_dir},
+            check=True, capture_output=True, text=True,
+        ).stdout
+        probe = json.loads(output.strip().splitlines()[-1])
+        statuses = {}
+        for ok, _ in probe['results']:
+            statuses[200 if ok else 500] = statuses.get(200 if ok else 500, 0) + 1
+        result = summarize([latency for _, latency in probe['results']], probe['elapsed'], statuses)
+        result['sink_received'] = sink.received
+    return result
+
+
+def git_revision():
+    try:
+        sha = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return sha, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+
+
+def print_results(results):
+    print(f"{'mode':<12}{'conc':>6}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  statuses")
+    for mode in ('inprocess', 'socket', 'email'):
+        for concurrency, result in results.get(mode, {}).items():
+            print(f"{mode:<12}{concurrency:>6}{result['throughput_rps']:>10.1f}{result['p50_ms']:>9.2f}"
+                  f"{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}  {result['statuses']}")
+    allocations = results.get('allocations')
+    if allocations:
+        print(f"allocations: peak {allocations['peak_kib_p50']:.1f} KiB/request (p50), "
+              f"{allocations['peak_kib_max']:.1f} KiB max, "
+              f"{allocations['retained_bytes_mean']:.0f} B retained/request")
+
+
+def compare(baseline_path, current):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nvs {baseline['meta']['git_sha']} ({baseline_path})")
+    for mode in ('inprocess', 'socket', 'email'):
+        for concurrency, result in current['results'].get(mode, {}).items():
+            old = baseline['results'].get(mode, {}).get(concurrency)
+            if not old:
+                continue
+            throughput = (result['throughput_rps'] / old['throughput_rps'] - 1) * 100 if old['throughput_rps'] else 0
+            p99 = (result['p99_ms'] / old['p99_ms'] - 1) * 100 if old['p99_ms'] else 0
+            print(f"{mode:<12}{concurrency:>6}  throughput {throughput:+6.1f}%   p99 {p99:+6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', default=['inprocess', 'socket'], choices=['inprocess', 'socket'])
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=2000, help='requests per mode and concurrency level')
+    parser.add_argument('--alloc-samples', type=int, default=200, help='0 skips the allocation pass')
+    parser.add_argument('--publish-mode', default='sync', choices=['sync', 'async'])
+    parser.add_argument('--publish-latency', type=float, default=0.0,
+                        help='seconds the fake broker waits per publish, to approximate a network round trip')
+    parser.add_argument('--outbox', action='store_true', help='spool registrations through the outbox')
+    parser.add_argument('--email', type=int, default=0, help='also send this many emails to the SMTP sink')
+    parser.add_argument('--email-concurrency', type=int, default=4)
+    parser.add_argument('--smtp-port', type=int, default=8025)
+    parser.add_argument('--output', help='JSON results path (default: benchmarks/results/<name>-<git sha>.json)')
+    parser.add_argument('--compare', help='earlier JSON results to diff against')
+    args = parser.parse_args()
+
+    settings_dir = tempfile.mkdtemp(prefix='obo-bench-')
+    write_settings(args, settings_dir)
+    broker = InMemoryBroker(publish_latency=args.publish_latency).install()
+    app = load_app(settings_dir)
+
+    results = {}
+    runners = {'inprocess': run_inprocess, 'socket': run_socket}
+    for mode in args.modes:
+        results[mode] = {}
+        for concurrency in args.concurrency:
+            results[mode][str(concurrency)] = runners[mode](app, concurrency, args.requests)
+    if args.alloc_samples:
+        results['allocations'] = measure_allocations(app, args.alloc_samples)
+    if args.email:
+        results['email'] = {str(args.email_concurrency): run_email(args, settings_dir)}
+
+    # Let the async publisher or outbox replayer hand over what was accepted
+    deadline = time.monotonic() + 10
+    accepted = sum(
+        int(result['statuses'].get('200', 0))
+        for mode in args.modes for result in results[mode].values()
+    ) + 20 * bool(args.alloc_samples) + args.alloc_samples
+    while broker.published < accepted and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    sha, dirty = git_revision()
+    report = {
+        'meta': {
+            'git_sha': sha,
+            'git_dirty': dirty,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'args': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        },
+        'broker': {'published': broker.published, 'accepted': accepted, 'connections': broker.connections},
+        'results': results,
+    }
+
+    print_results(results)
+    print(f"broker: {broker.published}/{accepted} accepted registrations published "
+          f"over {broker.connections} connection(s)")
+    output = args.output or os.path.join(RESULTS_DIR, f"registration_pipeline-{sha}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"results written to {output}")
+    if args.compare:
+        compare(args.compare, report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""Local stand-ins for RabbitMQ and SMTP used by the benchmark suite.
+
+InMemoryBroker replaces pika.BlockingConnection inside the current process,
+so RabbitMQClient publishes (pooled, confirm-mode and transactional) land in
+in-memory queues instead of a broker. SMTPSink is an aiosmtpd server that
+accepts and counts every message; point SMTP_SERVER/SMTP_PORT at it.
+
+    python benchmarks/standins.py smtp --port 8025
+"""
+
+import argparse
+import collections
+import os
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+
+
+class FakeChannel:
+    """The subset of pika's BlockingChannel the services use"""
+
+    def __init__(self, broker, connection):
+        self.broker = broker
+        self.connection = connection
+        self.is_open = True
+        self._tx = None
+
+    @property
+    def is_closed(self):
+        return not self.is_open
+
+    def queue_declare(self, queue, durable=False, **kwargs):
+        self.broker.declare(queue)
+
+    def confirm_delivery(self):
+        pass
+
+    def tx_select(self):
+        self._tx = []
+
+    def tx_commit(self):
+        pending, self._tx = self._tx or [], []
+        self.broker.deliver_many(pending)
+
+    def tx_rollback(self):
+        self._tx = []
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        if not self.is_open:
+            raise RuntimeError('Channel is closed')
+        if self._tx is not None:
+            self._tx.append((routing_key, body, properties))
+        else:
+            self.broker.deliver(routing_key, body, properties)
+
+    def close(self):
+        self.is_open = False
+
+
+class FakeConnection:
+    def __init__(self, broker, parameters=None):
+        self.broker = broker
+        self.is_open = True
+        broker.connections += 1
+
+    @property
+    def is_closed(self):
+        return not self.is_open
+
+    def channel(self):
+        return FakeChannel(self.broker, self)
+
+    def close(self):
+        self.is_open = False
+
+
+class InMemoryBroker:
+    """
+    In-process AMQP fake with one FIFO per queue
+
+    >>> broker = InMemoryBroker().install()
+    >>> rabbitmq_client.publish({'email': 'john@example.com'})
+    True
+    >>> broker.depth('web.registration.queue')
+    1
+
+    """
+    def __init__(self, publish_latency=0.0):
+        # Optional delay per publish (per commit in a transaction) to
+        # approximate a broker round trip
+        self.publish_latency = publish_latency
+        self.queues = collections.defaultdict(collections.deque)
+        self.connections = 0
+        self.published = 0
+        self._lock = threading.Lock()
+        self._saved = None
+
+    def declare(self, queue):
+        with self._lock:
+            self.queues[queue]
+
+    def deliver(self, routing_key, body, properties):
+        if self.publish_latency:
+            time.sleep(self.publish_latency)
+        with self._lock:
+            self.queues[routing_key].append((body, properties))
+            self.published += 1
+
+    def deliver_many(self, messages):
+        """A committed transaction: one round trip for all of its messages"""
+        if self.publish_latency:
+            time.sleep(self.publish_latency)
+        with self._lock:
+            for routing_key, body, properties in messages:
+                self.queues[routing_key].append((body, properties))
+            self.published += len(messages)
+
+    def depth(self, queue):
+        with self._lock:
+            return len(self.queues[queue])
+
+    def drain(self, queue):
+        """Remove and return every (body, properties) waiting on queue"""
+        with self._lock:
+            messages = list(self.queues[queue])
+            self.queues[queue].clear()
+        return messages
+
+    def install(self):
+        """Route pika.BlockingConnection in this process to the fake"""
+        import pika
+        self._saved = pika.BlockingConnection
+        pika.BlockingConnection = lambda parameters=None: FakeConnection(self, parameters)
+        return self
+
+    def uninstall(self):
+        if self._saved is not None:
+            import pika
+            pika.BlockingConnection = self._saved
+            self._saved = None
+
+
+class SMTPSink:
+    """
+    aiosmtpd server on localhost that accepts and counts every message
+
+    EmailSender always issues STARTTLS and LOGIN, so the sink offers TLS
+    with a throwaway self-signed certificate (generated with the openssl
+    CLI) and accepts any credentials.
+
+    >>> with SMTPSink(port=8025) as sink:
+    ...     email_sender.send_registration_email('john@example.com', 'uuid')
+    >>> sink.received
+    1
+
+    """
+    def __init__(self, host='127.0.0.1', port=8025):
+        from aiosmtpd.controller import Controller
+
+        self.received = 0
+        self.bytes = 0
+        # (time.monotonic(), recipient) per accepted message
+        self.deliveries = []
+        self._lock = threading.Lock()
+        self.controller = Controller(
+            self,
+            hostname=host,
+            port=port,
+            tls_context=self._tls_context(),
+            authenticator=self._accept_any,
+            auth_require_tls=False,
+        )
+
+    @staticmethod
+    def _tls_context():
+        directory = tempfile.mkdtemp(prefix='smtp-sink-')
+        cert, key = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+        subprocess.run(
+            ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+             '-subj', '/CN=localhost', '-keyout', key, '-out', cert],
+            check=True, capture_output=True
+        )
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(cert, key)
+        return context
+
+    @staticmethod
+    def _accept_any(server, session, envelope, mechanism, auth_data):
+        from aiosmtpd.smtp import AuthResult
+        return AuthResult(success=True)
+
+    async def handle_DATA(self, server, session, envelope):
+        with self._lock:
+            self.received += 1
+            self.bytes += len(envelope.content)
+            self.deliveries.extend((time.monotonic(), recipient) for recipient in envelope.rcpt_tos)
+        return '250 Message accepted for delivery'
+
+    def start(self):
+        self.controller.start()
+        return self
+
+    def stop(self):
+        self.controller.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a benchmark stand-in as its own process')
+    parser.add_argument('service', choices=['smtp'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8025)
+    args = parser.parse_args()
+
+    with SMTPSink(args.host, args.port) as sink:
+        print(f"SMTP sink listening on {args.host}:{args.port}, Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(5)
+                print(f"received {sink.received} message(s), {sink.bytes} bytes")
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
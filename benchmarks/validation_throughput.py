@@ -0,0 +1,55 @@
+"""Throughput of registration payload validation.
+
+Compares the compiled registration schema against the previous
+``all(payload.get(field) ...)`` presence check on valid, invalid and
+oversized payloads.
+
+    python benchmarks/validation_throughput.py --number 100000
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'web_flask'))
+
+from core.validation.schema import Boolean, Email, Schema, String  # noqa: E402
+
+# Same limits as the UserData columns used by api_bluep
+SCHEMA = Schema({
+    'full_name': String(max_length=100),
+    'email': Email(max_length=255),
+    'accept_license': Boolean(accept=True),
+    'accept_age': Boolean(accept=True),
+})
+FIELDS = ('full_name', 'email', 'accept_license', 'accept_age')
+
+PAYLOADS = {
+    'valid': {'full_name': 'John Doe', 'email': 'john.doe@example.com', 'accept_license': True, 'accept_age': True},
+    'missing': {'full_name': '', 'email': 'john.doe@example.com', 'accept_license': True, 'accept_age': True},
+    'bad email': {'full_name': 'John Doe', 'email': 'john.doe@', 'accept_license': True, 'accept_age': True},
+    'oversized': {'full_name': 'x' * 10000, 'email': 'john.doe@example.com', 'accept_license': True, 'accept_age': True},
+}
+
+
+def presence_check(payload):
+    data = {field: payload.get(field) for field in FIELDS}
+    return data if all(data[field] for field in FIELDS) else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'payload':<12}{'schema/s':>14}{'presence/s':>14}")
+    for name, payload in PAYLOADS.items():
+        schema_time = min(timeit.repeat(lambda: SCHEMA.validate(payload), number=args.number, repeat=args.repeat))
+        presence_time = min(timeit.repeat(lambda: presence_check(payload), number=args.number, repeat=args.repeat))
+        print(f"{name:<12}{args.number / schema_time:>14,.0f}{args.number / presence_time:>14,.0f}")
+
+
+if __name__ == '__main__':
+    main()
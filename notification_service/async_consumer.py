@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import time
+import traceback
+from typing import Any, Dict, Optional
+
+from core.connector.postgresql_connector import PostgreSQLConnector, engines
+from core.db.utils import register_message
+from consumer import CONSUMER_CONFIG, PENDING_STATUS_ID, db_write_latency, decode_message
+from settings import RABBITMQ_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncEmailConsumer:
+    """
+    asyncio consumer for the registration queue on the scheduler's event loop
+
+    Deliveries come from aio-pika and are stored through the async engine,
+    so no thread handoffs are involved. Up to ``concurrency`` messages are
+    written at once (keep it within DB_POOL_CONFIG's pool_size); ``prefetch_count``
+    lets the broker stream the next messages while those writes are in
+    flight. Each message is acked on its own once its transaction commits.
+
+    >>> consumer = AsyncEmailConsumer({'concurrency': 16, 'prefetch_count': 64})
+    >>> await consumer.start_consuming()  # until cancelled, then drains in-flight writes
+
+    """
+    def __init__(self, config=None, session_factory=None):
+        config = CONSUMER_CONFIG if config is None else config
+        self.concurrency = max(1, int(config.get('concurrency', 5)))
+        self.prefetch_count = int(config.get('prefetch_count', 4 * self.concurrency))
+        self.drain_timeout = float(config.get('drain_timeout', 30))
+        self.session_factory = session_factory or PostgreSQLConnector()
+        if self.concurrency > engines.pool_options['pool_size']:
+            # Overflow connections are closed on return, so every write past
+            # the pool size would open a new connection
+            logger.warning(f"Consumer concurrency {self.concurrency} exceeds DB pool_size "
+                           f"{engines.pool_options['pool_size']}, raise DB_POOL_CONFIG['pool_size']")
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._in_flight = set()
+
+    async def process_message(self, message_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Store one registration in its own transaction; same statement as EmailConsumer"""
+        if not message_data.get('email'):
+            logger.error(f"Invalid message format: {message_data}")
+            return None
+        started = time.perf_counter()
+        async with self.session_factory.get_async_db() as session:
+            # register_message is written against a sync Session; run_sync
+            # drives it on the async connection without leaving the loop
+            result = await session.run_sync(
+                lambda sync_session: register_message(message_data, PENDING_STATUS_ID, session=sync_session)
+            )
+        db_write_latency.labels('async').observe(time.perf_counter() - started)
+        if not result['created']:
+            logger.info(f"Registration {message_data.get('registration_id')} already processed")
+        return result
+
+    async def on_message(self, message):
+        """aio-pika callback; runs as its own task for every delivery"""
+        task = asyncio.current_task()
+        self._in_flight.add(task)
+        try:
+            async with self._slots:
+                await self._handle(message)
+        finally:
+            self._in_flight.discard(task)
+
+    async def _handle(self, message):
+        try:
+            message_data = decode_message(message.body, message.content_type)
+        except ValueError as e:
+            logger.error(f"Undecodable message ({message.content_type}): {message.body!r} {str(e)}")
+            await message.reject(requeue=False)
+            return
+        try:
+            await self.process_message(message_data)
+            await message.ack()
+        except Exception as e:
+            logger.error(f"Error processing message: "+("\n".join([
+                    "-"*10,
+                    str(e),
+                    str(traceback.format_exc()),
+                    "-"*10,
+                ])))
+            await message.nack(requeue=True)
+
+    async def _drain(self):
+        if self._in_flight:
+            logger.info(f"Waiting for {len(self._in_flight)} in-flight message(s)")
+            await asyncio.wait(set(self._in_flight), timeout=self.drain_timeout)
+
+    async def start_consuming(self):
+        """Consume until cancelled; the robust connection reconnects and resubscribes by itself"""
+        import aio_pika
+        while True:
+            try:
+                connection = await aio_pika.connect_robust(
+                    host=RABBITMQ_CONFIG['host'],
+                    port=RABBITMQ_CONFIG['port'],
+                    login=RABBITMQ_CONFIG['username'],
+                    password=RABBITMQ_CONFIG['password'],
+                )
+            except Exception as e:
+                logger.error(f"Connection to RabbitMQ failed: {str(e)}. Retrying in 5 seconds...")
+                await asyncio.sleep(5)
+                continue
+            try:
+                channel = await connection.channel()
+                await channel.set_qos(prefetch_count=self.prefetch_count)
+                queue = await channel.declare_queue(RABBITMQ_CONFIG['queue_name'], durable=True)
+                consumer_tag = await queue.consume(self.on_message)
+                logger.info(f"Started consuming messages (concurrency {self.concurrency}, prefetch {self.prefetch_count})...")
+                try:
+                    await asyncio.Future()
+                finally:
+                    # Stop new deliveries, then let started writes commit and ack
+                    await asyncio.shield(queue.cancel(consumer_tag))
+                    await asyncio.shield(self._drain())
+            finally:
+                await asyncio.shield(connection.close())
@@ -1,23 +1,43 @@
-import json
 import logging
 import time
 import traceback
-from typing import Dict, Any
-import uuid  # Add this import at the top
+from typing import Dict, Any, List, Optional
 
 from pika import PlainCredentials, BlockingConnection, ConnectionParameters
 from pika.exceptions import AMQPConnectionError
 
+import settings
 from core.connector.postgresql_connector import db_operation
+from core.connector.message_codec import decode
 from core.email.email_sender import EmailSender
 from settings import RABBITMQ_CONFIG
 from sqlalchemy.orm import Session
-from core.db.models import UserData, CopyShared, Notifications
-from core.db.utils import create_user, get_user_by_email
+from core.db.utils import register_message, save_registrations
+from core.metrics.registry import metrics
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# batch_size 1 restores one transaction and one ack per message
+CONSUMER_CONFIG = getattr(settings, 'CONSUMER_CONFIG', {})
+PENDING_STATUS_ID = 1
+
+db_write_latency = metrics.histogram(
+    'consumer_db_write_seconds',
+    'Database time to store one registration message, including commit',
+    ('mode',)
+)
+
+
+def decode_message(body, content_type):
+    """Registration message from a delivery; ValueError for anything else"""
+    # Decode by header so old JSON and new msgpack messages coexist during a rollout
+    message_data = decode(body, content_type)
+    if not isinstance(message_data, dict):
+        raise ValueError(f"Expected an object, got {type(message_data).__name__}")
+    return message_data
+
+
 class EmailConsumer:
     """
     Email consumer for processing messages from RabbitMQ
@@ -29,14 +49,30 @@ class EmailConsumer:
     >>> consumer.channel.basic_consume(queue=RABBITMQ_CONFIG['queue_name'], on_message_callback=consumer.callback)
     >>> consumer.channel.start_consuming()
     >>> consumer.connection.close()
+
+    Messages are written in micro-batches: deliveries are collected until
+    ``batch_size`` arrive or ``batch_timeout_ms`` passes since the first,
+    then written with set-based upserts in one transaction and acked with
+    a single ``basic_ack(multiple=True)``. If the batch write fails, its
+    messages are retried one by one so a single bad message is isolated.
+
+    >>> consumer = EmailConsumer({'batch_size': 100, 'batch_timeout_ms': 50})
     
     """
 
-    def __init__(self):
+    def __init__(self, config=None):
+        config = CONSUMER_CONFIG if config is None else config
         self.email_sender = EmailSender()
         self.connection = None
         self.channel = None
         self.retry_delay = 60  # 1 minute between retries
+        self.batch_size = max(1, int(config.get('batch_size', 100)))
+        self.batch_timeout = float(config.get('batch_timeout_ms', 50)) / 1000
+        # Enough unacked deliveries to fill the next batch while one is written
+        self.prefetch_count = int(config.get('prefetch_count', 2 * self.batch_size))
+        self._batch = []
+        self._flush_timer = None
+        self._stopping = False
 
     def connect(self):
         """Establish connection to RabbitMQ"""
@@ -59,58 +95,124 @@ class EmailConsumer:
             )
 
     @db_operation(is_async=False)
-    def process_message(self, message_data: Dict[str, Any], session: Session) -> None:
+    def process_message(self, message_data: Dict[str, Any], session: Session) -> Optional[Dict[str, Any]]:
         """Process received message and handle email sending with retries"""
 
         
         """
         sample message_data:
-        {'full_name': 'Ковалёв Евгений', 'email': 'ao.200390@gmail.com', 'accept_license': True, 'accept_age': True, 'timestamp': '2024-12-18T21:08:49.865883'}
+        {'full_name': 'Ковалёв Евгений', 'email': 'ao.200390@gmail.com', 'accept_license': True, 'accept_age': True, 'timestamp': '2024-12-18T21:08:49.865883', 'registration_id': '0b8f9a3e-5d1c-4a7e-9a52-1f0c2d3e4b5a'}
         """
 
         email = message_data.get('email')
-        full_name = message_data.get('full_name')
-        
+        registration_id = message_data.get('registration_id')
+
         if not email:
             logger.error(f"Invalid message format: {message_data}")
             return
 
-        # Check for existing user or create new one
-        user = get_user_by_email(email, session)
-        if not user:
-            user = create_user(
-                user_data={
-                    'email': email,
-                    'nickname': full_name
-                },
-                session=session
-            )
-            session.add(user)
-            session.flush()  # Flush to get the user.id
-
-        # Check for existing CopyShared or create new one
-        copy_share = session.query(CopyShared).filter(CopyShared.id_user == user.id).first()
-        if not copy_share:
-            copy_share = CopyShared(
-                id_user=user.id,
-                name_file_uuid=str(uuid.uuid4())
-            )
-            session.add(copy_share)
-            session.commit()
-        
-        notification = Notifications(
-            id_copy_shared=copy_share.id,
-            id_status_sending=1
-        )
-        session.add(notification)
+        # User, copy and notification in one statement; commit here so the
+        # latency covers the whole write, the decorator's commit is then a no-op
+        started = time.perf_counter()
+        result = register_message(message_data, PENDING_STATUS_ID, session=session)
         session.commit()
+        db_write_latency.labels('single').observe(time.perf_counter() - started)
+
+        if not result['created']:
+            # Redelivered message whose notification was already written
+            logger.info(f"Registration {registration_id} already processed")
+        return result
+
+    @db_operation(is_async=False)
+    def process_batch(self, messages: List[Dict[str, Any]], session: Session) -> None:
+        """Write a batch of decoded messages in one transaction"""
+        started = time.perf_counter()
+        save_registrations(messages, PENDING_STATUS_ID, session=session)
+        session.commit()
+        # Amortised per message, so the histogram counts messages in both modes
+        elapsed = (time.perf_counter() - started) / len(messages)
+        observe = db_write_latency.labels('batch').observe
+        for _ in messages:
+            observe(elapsed)
+
+    @staticmethod
+    def _decode(ch, delivery_tag, properties, body):
+        """Decoded message, or None after rejecting it without requeue"""
+        try:
+            return decode_message(body, properties.content_type)
+        except ValueError as e:
+            logger.error(f"Undecodable message ({properties.content_type}): {body!r}"+("\n".join([
+                    "-"*10,
+                    str(e),
+                    str(traceback.format_exc()),
+                    "-"*10,
+                ])))
+            ch.basic_nack(delivery_tag=delivery_tag, requeue=False)
+            return None
+
+    def on_message(self, ch, method, properties, body):
+        """Batching callback: buffer the delivery and flush when the batch is full or due"""
+        self._batch.append((method.delivery_tag, properties, body))
+        if len(self._batch) >= self.batch_size:
+            self.flush_batch(ch)
+        elif self._flush_timer is None:
+            self._flush_timer = self.connection.call_later(self.batch_timeout, lambda: self.flush_batch(ch))
 
-        # return copy_share.uuid
+    def flush_batch(self, ch):
+        """Write and ack everything buffered so far"""
+        if self._flush_timer is not None:
+            self.connection.remove_timeout(self._flush_timer)
+            self._flush_timer = None
+        batch, self._batch = self._batch, []
+
+        decoded = []
+        for delivery_tag, properties, body in batch:
+            message_data = self._decode(ch, delivery_tag, properties, body)
+            if message_data is not None:
+                decoded.append((delivery_tag, message_data))
+        if not decoded:
+            return
+
+        valid = {}
+        for _, message_data in decoded:
+            if not message_data.get('email'):
+                # Acked with the batch, like process_message does
+                logger.error(f"Invalid message format: {message_data}")
+                continue
+            # The same registration delivered twice in one batch is written once
+            valid.setdefault(message_data.get('registration_id') or id(message_data), message_data)
+
+        try:
+            if valid:
+                self.process_batch(list(valid.values()))
+        except Exception as e:
+            logger.error(f"Batch of {len(decoded)} failed, retrying one by one: {str(e)}")
+            for delivery_tag, message_data in decoded:
+                self._process_and_ack(ch, delivery_tag, message_data)
+            return
+        # Earlier rejects are already settled, so this acks exactly the batch
+        ch.basic_ack(delivery_tag=max(delivery_tag for delivery_tag, _ in decoded), multiple=True)
+        logger.info(f"Stored batch of {len(valid)} registration(s)")
+
+    def _process_and_ack(self, ch, delivery_tag, message_data):
+        try:
+            self.process_message(message_data)
+            ch.basic_ack(delivery_tag=delivery_tag)
+        except Exception as e:
+            logger.error(f"Error processing message: "+("\n".join([
+                    "-"*10,
+                    str(e),
+                    str(traceback.format_exc()),
+                    "-"*10,
+                ])))
+            ch.basic_nack(delivery_tag=delivery_tag, requeue=True)
 
     def callback(self, ch, method, properties, body):
         """Callback function for processing received messages"""
         try:
-            message_data = json.loads(body)
+            message_data = self._decode(ch, method.delivery_tag, properties, body)
+            if message_data is None:
+                return
             logger.info(f"Received message: {message_data}")
             
             self.process_message(message_data)
@@ -118,14 +220,6 @@ class EmailConsumer:
             # Acknowledge the message
             ch.basic_ack(delivery_tag=method.delivery_tag)
             
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON format: {body}"+("\n".join([
-                    "-"*10,
-                    str(e),
-                    str(traceback.format_exc()),
-                    "-"*10,
-                ])))
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
         except Exception as e:
             logger.error(f"Error processing message: "+("\n".join([
                     "-"*10,
@@ -135,19 +229,33 @@ class EmailConsumer:
                 ])))
             ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
 
+    def stop(self):
+        """Stop consuming after the current message; safe to call from a signal handler"""
+        self._stopping = True
+        if self.connection is not None and not self.connection.is_closed:
+            self.connection.add_callback_threadsafe(self._stop_consuming)
+
+    def _stop_consuming(self):
+        # Store and ack what is buffered; unacked prefetched deliveries go back on close
+        if self._batch:
+            self.flush_batch(self.channel)
+        self.channel.stop_consuming()
+
     def start_consuming(self):
-        """Start consuming messages from the queue"""
-        while True:
+        """Start consuming messages from the queue; returns once stop() was called"""
+        while not self._stopping:
             try:
                 self.connect()
-                self.channel.basic_qos(prefetch_count=1)
+                batching = self.batch_size > 1
+                self.channel.basic_qos(prefetch_count=self.prefetch_count if batching else 1)
                 self.channel.basic_consume(
                     queue=RABBITMQ_CONFIG['queue_name'],
-                    on_message_callback=self.callback
+                    on_message_callback=self.on_message if batching else self.callback
                 )
                 
                 logger.info("Started consuming messages...")
-                self.channel.start_consuming()
+                if not self._stopping:
+                    self.channel.start_consuming()
                 
             except AMQPConnectionError:
                 logger.error("Connection to RabbitMQ failed. Retrying in 5 seconds...")
@@ -161,6 +269,9 @@ class EmailConsumer:
                 ])))
                 time.sleep(5)
             finally:
+                # Unacked deliveries are requeued by the broker with the connection
+                self._batch = []
+                self._flush_timer = None
                 if self.connection and not self.connection.is_closed:
                     self.connection.close()
 
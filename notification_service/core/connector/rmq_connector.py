@@ -1,16 +1,17 @@
-import json
 import uuid
-from pika import PlainCredentials, BlockingConnection, ConnectionParameters, BasicProperties
-from pika.exchange_type import ExchangeType
+from core.connector.message_codec import get_codec
 
 class RabbitMQClient:
     def __init__(self, config):
         self.config = config
+        self.codec = get_codec(config.get('codec'))
         self.connection = None
         self.channel = None
 
     def connect(self):
         """Establish connection to RabbitMQ"""
+        # Deferred so importing the client does not load pika
+        from pika import PlainCredentials, BlockingConnection, ConnectionParameters
         if not self.connection or self.connection.is_closed:
             credentials = PlainCredentials(
                 self.config['username'], 
@@ -31,13 +32,15 @@ class RabbitMQClient:
 
     def publish(self, message):
         """Publish message to queue"""
+        from pika import BasicProperties
         try:
             self.connect()
             self.channel.basic_publish(
                 exchange='',
                 routing_key=self.config['queue_name'],
-                body=json.dumps(message),
+                body=self.codec.encode(message),
                 properties=BasicProperties(
+                    content_type=self.codec.content_type,
                     delivery_mode=2,  # make message persistent
                     message_id=str(uuid.uuid4())
                 )
@@ -33,7 +33,8 @@ class UserData(Base, BaseMixin, TimestampMixin):
 
 class CopyShared(Base, BaseMixin, TimestampMixin):
     """Copy shared model with enhanced tracking"""
-    id_user = Column(Integer, ForeignKey('userdata.id', ondelete='CASCADE'), nullable=False)
+    # One copy per user; the consumer relies on it for ON CONFLICT (id_user)
+    id_user = Column(Integer, ForeignKey('userdata.id', ondelete='CASCADE'), nullable=False, unique=True, index=True)
     name_file_uuid = Column(String(255), nullable=False, index=True)
     
     user = relationship('UserData', back_populates='copies_shared')
@@ -46,6 +47,8 @@ class Notifications(Base, BaseMixin):
     """Notifications model with enhanced tracking"""
     id_copy_shared = Column(Integer, ForeignKey('copyshared.id', ondelete='CASCADE'), nullable=False)
     id_status_sending = Column(Integer, ForeignKey('statuses.id'), nullable=False)
+    # Id handed to the client by /api/v1/register and carried in the message
+    registration_id = Column(String(36), unique=True, index=True)
     dt_sent = Column(DateTime, default=datetime.now, server_default=func.now(), nullable=False)
     attempts = Column(Integer, default=0, server_default='0', nullable=False)
     max_attempts = Column(Integer, default=3, server_default='3', nullable=False)
@@ -1,9 +1,9 @@
+import uuid
+from datetime import datetime
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.ext.asyncio import async_sessionmaker
-from sqlalchemy import select
-from core.db.models import UserData, Base
+from sqlalchemy import select, text
+from core.db.models import UserData, Base, CopyShared, Notifications
 from settings import DATABASE_URL, ASYNC_DATABASE_URL
 from sqlalchemy.orm import Session
 from core.connector.postgresql_connector import db_operation
@@ -38,6 +38,153 @@ def create_user(user_data: dict, session: Session):
 def get_user_by_email(email: str, session: Session):
     return session.query(UserData).filter(UserData.email == email).first()
 
+
+# One round trip per registration on Postgres. Data-modifying CTEs share a
+# snapshot, so rows they insert are only visible through RETURNING: each
+# *_row CTE takes the freshly inserted row or else the one already there.
+REGISTER_MESSAGE_SQL = text("""
+WITH new_user AS (
+    INSERT INTO userdata (email, nickname, is_active, created_at, updated_at)
+    VALUES (:email, :nickname, true, :now, :now)
+    ON CONFLICT (email) DO NOTHING
+    RETURNING id
+), user_row AS (
+    SELECT id FROM new_user
+    UNION ALL
+    SELECT id FROM userdata WHERE email = :email
+    LIMIT 1
+), new_copy AS (
+    INSERT INTO copyshared (id_user, name_file_uuid, created_at, updated_at)
+    SELECT id, :name_file_uuid, :now, :now FROM user_row
+    ON CONFLICT (id_user) DO NOTHING
+    RETURNING id, name_file_uuid
+), copy_row AS (
+    SELECT id, name_file_uuid FROM new_copy
+    UNION ALL
+    SELECT copyshared.id, copyshared.name_file_uuid
+    FROM copyshared JOIN user_row ON copyshared.id_user = user_row.id
+    LIMIT 1
+), new_notification AS (
+    INSERT INTO notifications (id_copy_shared, id_status_sending, registration_id, dt_sent, attempts, max_attempts)
+    SELECT id, :status_id, :registration_id, :dt_sent, 0, :max_attempts FROM copy_row
+    ON CONFLICT (registration_id) DO NOTHING
+    RETURNING id
+)
+SELECT
+    (SELECT id FROM user_row) AS user_id,
+    (SELECT name_file_uuid FROM copy_row) AS copy_uuid,
+    COALESCE(
+        (SELECT id FROM new_notification),
+        (SELECT id FROM notifications WHERE registration_id = :registration_id)
+    ) AS notification_id,
+    EXISTS (SELECT 1 FROM new_notification) AS created
+""")
+
+
+def register_message(message: dict, status_id: int, session: Session) -> dict:
+    """Upsert user, copy and notification for one registration message.
+
+    Returns ``user_id``, ``copy_uuid``, ``notification_id`` and ``created``,
+    which is False when the registration id already had a notification
+    (a redelivery). The caller owns the transaction.
+    """
+    if session.get_bind().dialect.name != 'postgresql':
+        return _register_message_portable(message, status_id, session)
+    params = {
+        'email': message['email'],
+        'nickname': message.get('full_name'),
+        'name_file_uuid': str(uuid.uuid4()),
+        'registration_id': message.get('registration_id'),
+        'status_id': status_id,
+        'now': datetime.utcnow(),
+        'dt_sent': datetime.now(),
+        'max_attempts': Notifications.max_attempts.default.arg,
+    }
+    row = session.execute(REGISTER_MESSAGE_SQL, params).one()
+    if row.user_id is None or row.notification_id is None:
+        # ON CONFLICT waited for a concurrent transaction that committed the
+        # same email or registration after this statement's snapshot was
+        # taken; a second statement gets a fresh snapshot and sees it
+        row = session.execute(REGISTER_MESSAGE_SQL, params).one()
+    return dict(row._mapping)
+
+
+def _register_message_portable(message: dict, status_id: int, session: Session) -> dict:
+    """register_message for SQLite, which has no data-modifying CTEs"""
+    registration_id = message.get('registration_id')
+    existing = session.execute(
+        select(Notifications.id).where(Notifications.registration_id == registration_id)
+    ).scalar() if registration_id else None
+    if existing is None:
+        save_registrations([message], status_id, session=session)
+    user_id, copy_uuid = session.execute(
+        select(UserData.id, CopyShared.name_file_uuid)
+        .join(CopyShared, CopyShared.id_user == UserData.id)
+        .where(UserData.email == message['email'])
+    ).one()
+    notification_id = existing
+    if notification_id is None and registration_id:
+        notification_id = session.execute(
+            select(Notifications.id).where(Notifications.registration_id == registration_id)
+        ).scalar()
+    return {
+        'user_id': user_id,
+        'copy_uuid': copy_uuid,
+        'notification_id': notification_id,
+        'created': existing is None,
+    }
+
+
+def _insert(session: Session, model):
+    """Dialect INSERT, which offers on_conflict_do_nothing (SQLite for local runs and tests)"""
+    if session.get_bind().dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert(model)
+
+
+def save_registrations(registrations: list, status_id: int, session: Session):
+    """Write users, copies and notifications for a batch of registration messages.
+
+    Five statements per batch, whatever its size: an INSERT ... ON CONFLICT
+    DO NOTHING per table plus two lookups of the ids they resolved to.
+    Existing users and copies are reused and registration ids that already
+    have a notification are skipped, so a redelivered batch is a no-op. The
+    caller owns the transaction.
+    """
+    nicknames = {}
+    for registration in registrations:
+        nicknames.setdefault(registration['email'], registration.get('full_name'))
+
+    session.execute(
+        _insert(session, UserData).on_conflict_do_nothing(index_elements=['email']),
+        [{'email': email, 'nickname': nickname} for email, nickname in nicknames.items()]
+    )
+    user_ids = dict(session.execute(
+        select(UserData.email, UserData.id).where(UserData.email.in_(nicknames))
+    ).all())
+
+    session.execute(
+        _insert(session, CopyShared).on_conflict_do_nothing(index_elements=['id_user']),
+        [{'id_user': user_id, 'name_file_uuid': str(uuid.uuid4())} for user_id in user_ids.values()]
+    )
+    copy_ids = dict(session.execute(
+        select(CopyShared.id_user, CopyShared.id).where(CopyShared.id_user.in_(user_ids.values()))
+    ).all())
+
+    session.execute(
+        _insert(session, Notifications).on_conflict_do_nothing(index_elements=['registration_id']),
+        [
+            {
+                'id_copy_shared': copy_ids[user_ids[registration['email']]],
+                'id_status_sending': status_id,
+                'registration_id': registration.get('registration_id'),
+            }
+            for registration in registrations
+        ]
+    )
+
 # # Direct connector usage
 # with db.get_db() as session:
 #     users = session.query(UserData).all()
@@ -0,0 +1,94 @@
+import json
+import logging
+import os
+import threading
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Started servers; a forked child closes its copy of their listening sockets
+_servers = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    for server in list(_servers):
+        server._after_fork()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+class MetricsServer:
+    """
+    Serves a MetricsRegistry on GET /metrics from a daemon thread
+
+    The service has no web framework, so this is a bare http.server; a
+    scrape only reads the /dev/shm files and never touches the consumers.
+    With ``health``, a callable returning ``(healthy, details)``, GET /health
+    answers 200 or 503 with the details as JSON. Forked children (supervised
+    workers) close their inherited copy of the listening socket, so only the
+    process that started the server accepts scrapes.
+
+    >>> server = MetricsServer(metrics, port=9100, health=supervisor.health)
+    >>> server.start()
+    >>> server.stop()
+
+    """
+    def __init__(self, registry, host='0.0.0.0', port=9100, path='/metrics', health=None, health_path='/health'):
+        self.registry = registry
+        self.address = (host, port)
+        self.path = path
+        self.health = health
+        self.health_path = health_path
+        self._server = None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if server.health is not None and path == server.health_path:
+                    healthy, details = server.health()
+                    body = json.dumps(details).encode('utf-8')
+                    self.send_response(200 if healthy else 503)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                if path != server.path:
+                    self.send_error(404)
+                    return
+                body = server.registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
+
+    def start(self):
+        self._server = ThreadingHTTPServer(self.address, self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True).start()
+        _servers.add(self)
+        logger.info(f"Serving metrics on {self.address[0]}:{self.address[1]}{self.path}")
+
+    def _after_fork(self):
+        # The serving thread does not exist here; just release the socket
+        if self._server is not None:
+            self._server.socket.close()
+            self._server = None
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
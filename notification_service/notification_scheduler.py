@@ -1,40 +1,146 @@
 import asyncio
+import json
 import traceback
 from datetime import datetime, timedelta
 from typing import Dict, Set
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, text
+from sqlalchemy.engine import make_url
 from core.db.models import Notifications, Statuses
 from core.connector.postgresql_connector import PostgreSQLConnector
+from core.metrics.registry import metrics
+from settings import ASYNC_DATABASE_URL
 import logging
+import settings
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# web_flask LISTENs on this channel to push status changes over SSE
+STATUS_CHANNEL = 'registration_status'
+# NOTIFYed by a trigger on notifications inserts (web_flask schema migration 4)
+PENDING_CHANNEL = 'notifications_pending'
+
+# e.g. {'listen': True, 'fallback_interval': 60, 'coalesce_ms': 20}
+SCHEDULER_CONFIG = getattr(settings, 'SCHEDULER_CONFIG', {})
+
+scheduler_scans = metrics.counter(
+    'scheduler_scans_total',
+    'Scans for pending notifications, by what woke the scheduler',
+    ('reason',)
+)
+
 
 class NotificationSchedulerService:
-    def __init__(self, email_sender, session_factory=None):
+    """
+    Scans pending notifications and sends them
+
+    On Postgres the scheduler holds a dedicated asyncpg connection that
+    LISTENs on ``notifications_pending`` and scans as soon as new rows are
+    committed. Wakeups arriving within ``coalesce_ms`` of each other, or
+    while a scan runs, are folded into one scan. A slow fallback poll
+    (``fallback_interval``) picks up anything a lost connection missed.
+    Without LISTEN it polls every ``poll_interval`` seconds as before.
+
+    With several sender processes each one owns the notifications whose
+    id falls in its partition, ``(index, count)``, so a notification is
+    only ever picked up by one of them.
+
+    >>> scheduler = NotificationSchedulerService(EmailSender(), partition=(0, 2))
+    >>> scheduler = NotificationSchedulerService(EmailSender(), config={'listen': False, 'poll_interval': 10})
+
+    """
+    def __init__(self, email_sender, session_factory=None, partition=(0, 1), config=None):
         if session_factory is None:
             session_factory = PostgreSQLConnector()
+        config = SCHEDULER_CONFIG if config is None else config
         self.email_sender = email_sender
         self.session_factory = session_factory
+        self.partition = partition
         self.scheduled_tasks: Dict[int, Set[asyncio.Task]] = {}  # notification_id -> set of scheduled tasks
+        self.sending: Set[asyncio.Task] = set()  # process_notification calls in progress
         self.retry_delay = 30  # seconds
+        self.listen = config.get('listen', make_url(ASYNC_DATABASE_URL).get_backend_name() == 'postgresql')
+        self.poll_interval = float(config.get('poll_interval', 10))
+        self.fallback_interval = float(config.get('fallback_interval', 60))
+        self.coalesce = float(config.get('coalesce_ms', 20)) / 1000
+        self.reconnect_delay = float(config.get('reconnect_delay', 2))
+        self._wakeup = asyncio.Event()
+        self._listening = False
 
     async def start(self):
         """Start the notification scheduler service"""
+        listener = asyncio.create_task(self.listen_for_notifications()) if self.listen else None
+        reason = 'startup'
+        try:
+            while True:
+                scheduler_scans.labels(reason).inc()
+                try:
+                    await self.process_pending_notifications()
+                    # await self.execute_tasks()
+                except Exception as e:
+                    logger.error(f"Error in notification scheduler: "+("\n".join([
+                        "-"*10,
+                        str(e),
+                        str(traceback.format_exc()),
+                        "-"*10,
+                    ])))
+                reason = await self.wait_for_work()
+        finally:
+            if listener is not None:
+                listener.cancel()
+
+    async def wait_for_work(self) -> str:
+        """Sleep until a NOTIFY arrives or the poll interval passes; returns which one"""
+        # The fast interval applies whenever the LISTEN connection is down
+        interval = self.fallback_interval if self._listening else self.poll_interval
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            return 'poll'
+        # Let the rest of a burst arrive; everything up to here is one scan
+        if self.coalesce:
+            await asyncio.sleep(self.coalesce)
+        self._wakeup.clear()
+        return 'notify'
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self._wakeup.set()
+
+    async def listen_for_notifications(self):
+        """Hold the LISTEN connection, reconnecting until cancelled"""
+        import asyncpg
+
+        # asyncpg takes a plain libpq URL, without SQLAlchemy's driver suffix
+        dsn = make_url(ASYNC_DATABASE_URL).set(drivername='postgresql').render_as_string(hide_password=False)
         while True:
+            connection = None
             try:
-                await self.process_pending_notifications()
-                # await self.execute_tasks()
+                connection = await asyncpg.connect(dsn)
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda connection: closed.set())
+                await connection.add_listener(PENDING_CHANNEL, self._on_notify)
+                self._listening = True
+                # Rows committed while nobody was listening
+                self._wakeup.set()
+                logger.info(f"Listening on {PENDING_CHANNEL}")
+                while True:
+                    try:
+                        await asyncio.wait_for(closed.wait(), timeout=30)
+                    except asyncio.TimeoutError:
+                        # A silently dropped socket only shows up on the next query
+                        await connection.execute('SELECT 1')
+                        continue
+                    raise ConnectionError('LISTEN connection closed')
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                logger.error(f"Error in notification scheduler: "+("\n".join([
-                    "-"*10,
-                    str(e),
-                    str(traceback.format_exc()),
-                    "-"*10,
-                ])))
-            await asyncio.sleep(10)  # Check for new notifications every 10 seconds
+                logger.warning(f"Notification listener disconnected, reconnecting: {str(e)}")
+            finally:
+                self._listening = False
+                if connection is not None:
+                    connection.terminate()
+            await asyncio.sleep(self.reconnect_delay)
 
     async def execute_tasks(self):
         logger.info(f"Executing tasks: {self.scheduled_tasks}")
@@ -58,6 +164,9 @@ class NotificationSchedulerService:
                 Notifications.id_status_sending == pending_status.id,
                 Notifications.attempts < Notifications.max_attempts
             )
+            index, count = self.partition
+            if count > 1:
+                query = query.where(Notifications.id % count == index)
             result = await session.execute(query)
             notifications = result.scalars().all()
 
@@ -68,6 +177,20 @@ class NotificationSchedulerService:
                     self.scheduled_tasks[notification.id].add(task)
 
     async def process_notification(self, notification_id: int):
+        task = asyncio.current_task()
+        self.sending.add(task)
+        try:
+            return await self._process_notification(notification_id)
+        finally:
+            self.sending.discard(task)
+
+    async def drain(self, timeout: float):
+        """Wait for sends in progress, e.g. after start() was cancelled on shutdown"""
+        if self.sending:
+            logger.info(f"Waiting for {len(self.sending)} notification(s) being sent")
+            await asyncio.wait(set(self.sending), timeout=timeout)
+
+    async def _process_notification(self, notification_id: int):
         try:
             async with self.session_factory.get_async_db() as session:
                 notification = await session.get(Notifications, notification_id)
@@ -107,6 +230,7 @@ class NotificationSchedulerService:
         success_status = await self.get_status_by_name(session, 'success')
         notification.id_status_sending = success_status.id
         notification.dt_sent = datetime.utcnow()
+        await self.notify_status(session, notification, 'success')
         await session.commit()
         print(notification.id_status_sending)
         self.cancel_scheduled_tasks(notification.id)
@@ -118,17 +242,19 @@ class NotificationSchedulerService:
 
         await session.commit()
         print(notification.attempts >= notification.max_attempts, notification.attempts, notification.max_attempts)
-        if notification.attempts < notification.max_attempts:
+        if notification.attempts >= notification.max_attempts:
             print("ay")
             failed_status = await self.get_status_by_name(session, 'failed')
             notification.id_status_sending = failed_status.id
+            await self.notify_status(session, notification, 'failed')
+            # Commit before cancelling: this task is one of the scheduled ones
+            await session.commit()
             self.cancel_scheduled_tasks(notification.id)
         else:
             # Schedule retry
             task = asyncio.create_task(self.schedule_retry(notification.id))
-            self.scheduled_tasks[notification.id].add(task)
-
-        await session.commit()
+            self.scheduled_tasks.setdefault(notification.id, set()).add(task)
+            await session.commit()
 
     async def schedule_retry(self, notification_id: int):
         """Schedule a retry for failed notification"""
@@ -137,13 +263,25 @@ class NotificationSchedulerService:
         self.scheduled_tasks[notification_id].add(task)
 
     def cancel_scheduled_tasks(self, notification_id: int):
-        """Cancel all scheduled tasks for a notification"""
+        """Cancel all scheduled tasks for a notification, except the one calling this"""
+        current = asyncio.current_task()
         if notification_id in self.scheduled_tasks:
             for task in self.scheduled_tasks[notification_id]:
-                if not task.done():
+                if task is not current and not task.done():
                     task.cancel()
             self.scheduled_tasks.pop(notification_id)
 
+    @staticmethod
+    async def notify_status(session: AsyncSession, notification: Notifications, status_name: str):
+        """Queue a NOTIFY for the status change; Postgres delivers it on commit"""
+        if not notification.registration_id:
+            return
+        payload = json.dumps({'registration_id': notification.registration_id, 'status': status_name})
+        await session.execute(
+            text('SELECT pg_notify(:channel, :payload)'),
+            {'channel': STATUS_CHANNEL, 'payload': payload}
+        )
+
     @staticmethod
     async def get_status_by_name(session: AsyncSession, status_name: str) -> Statuses:
         """Get status by name"""
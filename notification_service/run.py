@@ -1,23 +1,37 @@
-from consumer import EmailConsumer
+from consumer import CONSUMER_CONFIG, EmailConsumer
 from notification_scheduler import NotificationSchedulerService
 from settings import RABBITMQ_CONFIG
+from core.metrics.registry import metrics
+from core.metrics.server import MetricsServer
+from supervisor import SUPERVISOR_CONFIG, Supervisor
 import asyncio
 import logging
+import settings
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Optional Prometheus endpoint, e.g. {'port': 9100}
+METRICS_CONFIG = getattr(settings, 'METRICS_CONFIG', {})
+
 async def main():
     while True:
         try:
             # Initialize and start the email consumer
-            consumer = EmailConsumer()
-            # consumer.start_consuming()
-            async_thread = asyncio.to_thread(consumer.start_consuming)
-            task_consumer = asyncio.create_task(async_thread)
+            if CONSUMER_CONFIG.get('mode') == 'asyncio':
+                # Same event loop and async engine as the scheduler, no consumer thread
+                from async_consumer import AsyncEmailConsumer
+                from core.email.email_sender import EmailSender
+                email_sender = EmailSender()
+                task_consumer = asyncio.create_task(AsyncEmailConsumer().start_consuming())
+            else:
+                consumer = EmailConsumer()
+                email_sender = consumer.email_sender
+                async_thread = asyncio.to_thread(consumer.start_consuming)
+                task_consumer = asyncio.create_task(async_thread)
 
             # Initialize and start the notification scheduler
-            notification_scheduler = NotificationSchedulerService(consumer.email_sender)
+            notification_scheduler = NotificationSchedulerService(email_sender)
             task_notification_scheduler = asyncio.create_task(notification_scheduler.start())
             res = await asyncio.gather(task_consumer, task_notification_scheduler, return_exceptions=True)
             logger.info(res)
@@ -26,7 +40,26 @@ async def main():
 
 
 if __name__ == "__main__":
-    try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        print("Processor stopped.")
\ No newline at end of file
+    # Own file prefix, so clearing one service's samples never unlinks the other's
+    metrics.configure({'prefix': 'obo-metrics-notify', **METRICS_CONFIG})
+    # Counters start from zero with the service, not with the container
+    metrics.clear()
+    # One process per worker instead of a consumer thread and the scheduler in this one
+    supervisor = Supervisor() if SUPERVISOR_CONFIG.get('enabled') else None
+    metrics_server = MetricsServer(
+        metrics,
+        host=METRICS_CONFIG.get('host', '0.0.0.0'),
+        port=int(METRICS_CONFIG['port']),
+        path=METRICS_CONFIG.get('path', '/metrics'),
+        health=supervisor.health if supervisor else None
+    ) if METRICS_CONFIG.get('port') else None
+    if supervisor:
+        # Started once the workers are forked, so they do not inherit its socket and threads
+        supervisor.run(on_started=metrics_server.start if metrics_server else None)
+    else:
+        if metrics_server:
+            metrics_server.start()
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            print("Processor stopped.")
\ No newline at end of file
@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import os
+import signal
+import time
+import traceback
+
+import settings
+from core.metrics.registry import metrics
+
+logger = logging.getLogger(__name__)
+
+# e.g. {'enabled': True, 'consumers': 4, 'senders': 2, 'stop_timeout': 30}
+SUPERVISOR_CONFIG = getattr(settings, 'SUPERVISOR_CONFIG', {})
+
+worker_restarts = metrics.counter(
+    'notification_worker_restarts_total',
+    'Worker processes restarted by the supervisor after they exited',
+    ('role',)
+)
+
+
+# Same function as web_flask/gunicorn.conf.py; the services do not share code, and
+# tests/test_shared_copies.py keeps the two copies identical
+def available_cpus():
+    """CPUs this container may use: affinity mask capped by the cgroup CPU quota"""
+    try:
+        cpus = float(len(os.sched_getaffinity(0)))
+    except AttributeError:
+        cpus = float(os.cpu_count() or 1)
+
+    quota = None
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            limit, period = f.read().split()
+        if limit != 'max':
+            quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+                limit = int(f.read())
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+                period = int(f.read())
+            if limit > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+    return min(cpus, quota) if quota else cpus
+
+
+def default_workers(cpus):
+    """(consumers, senders) for a CPU budget"""
+    # Consumers spend their CPU decoding and in the DB driver, one per core;
+    # senders mostly wait on SMTP, so one per two cores is enough. A
+    # fractional quota still gets one of each.
+    return max(1, int(cpus)), max(1, int(cpus) // 2)
+
+
+async def _until_terminated(coroutine):
+    """Run coroutine until SIGTERM cancels it"""
+    task = asyncio.ensure_future(coroutine)
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+def run_consumer(index, count, drain_timeout):
+    """Consumer worker: the queue is shared, the broker spreads deliveries over the workers"""
+    from consumer import CONSUMER_CONFIG, EmailConsumer
+    if CONSUMER_CONFIG.get('mode') == 'asyncio':
+        from async_consumer import AsyncEmailConsumer
+        consumer = AsyncEmailConsumer({**CONSUMER_CONFIG, 'drain_timeout': drain_timeout})
+        asyncio.run(_until_terminated(consumer.start_consuming()))
+    else:
+        consumer = EmailConsumer()
+        signal.signal(signal.SIGTERM, lambda signum, frame: consumer.stop())
+        consumer.start_consuming()
+
+
+def run_sender(index, count, drain_timeout):
+    """Sender worker for its partition of the pending notifications"""
+    from core.email.email_sender import EmailSender
+    from notification_scheduler import NotificationSchedulerService
+    scheduler = NotificationSchedulerService(EmailSender(), partition=(index, count))
+
+    async def main():
+        await _until_terminated(scheduler.start())
+        await scheduler.drain(drain_timeout)
+
+    asyncio.run(main())
+
+
+class Worker:
+    """One supervised slot; the process in it is replaced when it exits"""
+
+    def __init__(self, role, index, count, target):
+        self.role = role
+        self.index = index
+        self.count = count
+        self.target = target
+        self.pid = None
+        self.started = None
+        self.restarts = 0
+        self.failures = 0
+        self.restart_at = 0.0
+
+
+class Supervisor:
+    """
+    Forks consumer and sender worker processes and keeps them running
+
+    Worker counts default to the CPUs the container may use (affinity and
+    cgroup quota). A worker that exits is restarted after an exponential
+    backoff, reset once a worker has stayed up for ``backoff_reset``
+    seconds. SIGTERM or SIGINT is forwarded to the workers as SIGTERM:
+    consumers stop taking deliveries and finish the ones in hand, senders
+    finish the emails being sent; whatever is still running after
+    ``stop_timeout`` is killed. Workers write metrics to their own shm
+    files, which the supervisor's MetricsServer sums on scrape, and
+    health() reports every slot.
+
+    >>> supervisor = Supervisor({'consumers': 4, 'senders': 2})
+    >>> supervisor.run(on_started=metrics_server.start)  # until SIGTERM
+
+    """
+    def __init__(self, config=None, roles=None):
+        config = SUPERVISOR_CONFIG if config is None else config
+        cpus = available_cpus()
+        consumers, senders = default_workers(cpus)
+        if roles is None:
+            roles = {
+                'consumer': (run_consumer, int(config.get('consumers', consumers))),
+                'sender': (run_sender, int(config.get('senders', senders))),
+            }
+        self.backoff_initial = float(config.get('backoff_initial', 1))
+        self.backoff_max = float(config.get('backoff_max', 60))
+        self.backoff_reset = float(config.get('backoff_reset', 60))
+        self.stop_timeout = float(config.get('stop_timeout', 30))
+        self.workers = [
+            Worker(role, index, count, target)
+            for role, (target, count) in roles.items()
+            for index in range(count)
+        ]
+        self._stopping = False
+        logger.info(f"Supervising {', '.join(f'{count} {role}(s)' for role, (_, count) in roles.items())} "
+                    f"for {cpus:g} CPU(s)")
+
+    def _spawn(self, worker):
+        pid = os.fork()
+        if pid:
+            worker.pid = pid
+            worker.started = time.monotonic()
+            logger.info(f"Started {worker.role} {worker.index} (pid {pid})")
+            return
+        # Child: ^C reaches the whole process group, the supervisor decides how to stop
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        code = 0
+        try:
+            # Workers drain a little before the supervisor kills them
+            worker.target(worker.index, worker.count, max(1.0, self.stop_timeout - 5))
+        except Exception as e:
+            logger.error(f"{worker.role} {worker.index} failed: "+("\n".join([
+                    "-"*10,
+                    str(e),
+                    str(traceback.format_exc()),
+                    "-"*10,
+                ])))
+            code = 1
+        finally:
+            logging.shutdown()
+            os._exit(code)
+
+    def _reap(self):
+        """Collect exited workers and schedule their restart"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            worker = next((worker for worker in self.workers if worker.pid == pid), None)
+            if worker is None:
+                continue
+            worker.pid = None
+            if self._stopping:
+                logger.info(f"{worker.role} {worker.index} stopped")
+                continue
+            now = time.monotonic()
+            if now - worker.started >= self.backoff_reset:
+                worker.failures = 0
+            delay = min(self.backoff_max, self.backoff_initial * 2 ** worker.failures)
+            worker.failures += 1
+            worker.restart_at = now + delay
+            logger.error(f"{worker.role} {worker.index} (pid {pid}) exited with status "
+                         f"{os.waitstatus_to_exitcode(status)}, restarting in {delay:g}s")
+
+    def _stop(self, signum, frame):
+        if self._stopping:
+            return
+        self._stopping = True
+        logger.info(f"Received {signal.Signals(signum).name}, stopping workers")
+        self._signal_workers(signal.SIGTERM)
+
+    def _signal_workers(self, signum):
+        for worker in self.workers:
+            if worker.pid is not None:
+                try:
+                    os.kill(worker.pid, signum)
+                except ProcessLookupError:
+                    pass
+
+    def health(self):
+        """(all workers up, per-worker details) for the /health endpoint"""
+        now = time.monotonic()
+        details = [{
+            'role': worker.role,
+            'index': worker.index,
+            'pid': worker.pid,
+            'alive': worker.pid is not None,
+            'uptime': round(now - worker.started, 1) if worker.pid is not None else None,
+            'restarts': worker.restarts,
+        } for worker in self.workers]
+        healthy = not self._stopping and all(worker['alive'] for worker in details)
+        return healthy, {'status': 'ok' if healthy else 'degraded', 'workers': details}
+
+    def run(self, on_started=None):
+        """Supervise until stopped; on_started runs once the first workers are forked"""
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for worker in self.workers:
+            self._spawn(worker)
+        if on_started is not None:
+            on_started()
+        deadline = None
+        while True:
+            self._reap()
+            if self._stopping:
+                if all(worker.pid is None for worker in self.workers):
+                    break
+                deadline = deadline or time.monotonic() + self.stop_timeout
+                if time.monotonic() >= deadline:
+                    logger.warning("Workers did not stop in time, killing them")
+                    self._signal_workers(signal.SIGKILL)
+                    deadline = float('inf')
+            else:
+                now = time.monotonic()
+                for worker in self.workers:
+                    if worker.pid is None and now >= worker.restart_at:
+                        worker.restarts += 1
+                        worker_restarts.labels(worker.role).inc()
+                        self._spawn(worker)
+            time.sleep(0.2)
+        logger.info("All workers stopped")
@@ -0,0 +1,6 @@
+"""Make the web_flask packages importable from the test suite."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'web_flask'))
@@ -0,0 +1,35 @@
+"""Smoke tests for the benchmarks and their local stand-ins.
+
+Each runs a tiny pass in a fresh interpreter, so the benchmarks keep
+working as the services change; the numbers are not checked.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_registration_pipeline_benchmark(tmp_path):
+    """Every accepted registration reaches the in-memory broker and results are written as JSON"""
+    output = tmp_path / 'results.json'
+    subprocess.run(
+        [sys.executable, os.path.join(ROOT, 'benchmarks', 'registration_pipeline.py'),
+         '--concurrency', '1', '4', '--requests', '40', '--alloc-samples', '10', '--output', str(output)],
+        cwd=str(tmp_path), check=True, capture_output=True, timeout=120,
+    )
+    report = json.loads(output.read_text())
+    assert set(report['results']) == {'inprocess', 'socket', 'allocations'}
+    assert report['results']['socket']['4']['statuses'] == {'200': 40}
+    assert report['broker']['published'] == report['broker']['accepted']
+
+def test_consumer_batching_benchmark():
+    """Batched, per-message and asyncio consumers store every unique registration and ack every delivery"""
+    result = subprocess.run(
+        [sys.executable, os.path.join(ROOT, 'benchmarks', 'consumer_batching.py'),
+         '--messages', '200', '--batch-sizes', '1', '7', '50', '--concurrency', '1', '4'],
+        check=True, capture_output=True, text=True, timeout=120,
+    )
+    assert len(result.stdout.strip().splitlines()) == 10
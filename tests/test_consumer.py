@@ -0,0 +1,99 @@
+"""Registration consumers dead-letter bodies that are not a JSON object.
+
+The consumers import notification_service's settings, so they run in a
+subprocess from that directory against a throwaway settings module.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = '''
+import asyncio, json, sys
+from types import SimpleNamespace
+from consumer import EmailConsumer
+from async_consumer import AsyncEmailConsumer
+
+BODIES = [b'[1, 2]', b'"john@example.com"', b'{"email": "john@example.com"}']
+
+
+class Channel:
+    def __init__(self):
+        self.calls = []
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.calls.append(['ack', delivery_tag, multiple])
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        self.calls.append(['nack', delivery_tag, requeue])
+
+
+class Message:
+    content_type = 'application/json'
+
+    def __init__(self, body, calls):
+        self.body, self.calls = body, calls
+
+    async def ack(self):
+        self.calls.append(['ack', self.body.decode()])
+
+    async def reject(self, requeue=True):
+        self.calls.append(['reject', self.body.decode(), requeue])
+
+    async def nack(self, requeue=True):
+        self.calls.append(['nack', self.body.decode(), requeue])
+
+
+consumer = EmailConsumer({'batch_size': 100})
+stored = []
+consumer.process_batch = stored.extend
+channel = Channel()
+for delivery_tag, body in enumerate(BODIES, 1):
+    consumer._batch.append((delivery_tag, SimpleNamespace(content_type='application/json'), body))
+consumer.flush_batch(channel)
+
+
+async def handle_all():
+    async_consumer = AsyncEmailConsumer({'concurrency': 1}, session_factory=object())
+    async def process_message(message_data):
+        return {'created': True}
+    async_consumer.process_message = process_message
+    calls = []
+    for body in BODIES:
+        await async_consumer._handle(Message(body, calls))
+    return calls
+
+with open(sys.argv[1], 'w') as f:
+    json.dump({'sync': channel.calls, 'stored': stored, 'async': asyncio.run(handle_all())}, f)
+'''
+
+
+def test_non_object_bodies_are_dead_lettered(tmp_path):
+    (tmp_path / 'settings.py').write_text(
+        "DATABASE_URL = 'sqlite://'\n"
+        "ASYNC_DATABASE_URL = 'sqlite+aiosqlite://'\n"
+        "RABBITMQ_CONFIG = {}\n"
+        "SMTP_SERVER = SMTP_USERNAME = SMTP_PASSWORD = SENDER_EMAIL = BASE_URL = ''\n"
+        "SMTP_PORT = 0\n"
+    )
+    out = tmp_path / 'out.json'
+    result = subprocess.run(
+        [sys.executable, '-c', SCRIPT, str(out)],
+        cwd=os.path.join(ROOT, 'notification_service'),
+        env={**os.environ, 'PYTHONPATH': str(tmp_path)},
+        capture_output=True, text=True, timeout=30,
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+
+    report = json.loads(out.read_text())
+    # Rejected without requeue, and the rest of the batch still goes through
+    assert report['sync'] == [['nack', 1, False], ['nack', 2, False], ['ack', 3, True]]
+    assert report['stored'] == [{'email': 'john@example.com'}]
+    assert report['async'] == [
+        ['reject', '[1, 2]', False],
+        ['reject', '"john@example.com"', False],
+        ['ack', '{"email": "john@example.com"}'],
+    ]
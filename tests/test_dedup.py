@@ -0,0 +1,79 @@
+"""Unit tests for the pre-publish registration dedup filter.
+
+These tests run without a broker: the shared Bloom filter is backed by a
+file in pytest's temporary directory instead of /dev/shm.
+"""
+
+import os
+import time
+import uuid
+
+import pytest
+
+from core.guard.dedup import RegistrationDeduplicator, normalize_email
+from core.metrics.registry import metrics
+
+
+@pytest.fixture(autouse=True)
+def metrics_directory(tmp_path):
+    """The dedup counters go to the process-wide registry; keep its files out of /dev/shm too"""
+    directory = metrics.directory
+    metrics.configure({'directory': str(tmp_path)})
+    metrics.clear()
+    yield
+    metrics.clear()
+    metrics.directory = directory
+
+@pytest.fixture
+def dedup(tmp_path):
+    """Deduplicator with a short window and a small filter"""
+    return RegistrationDeduplicator({
+        'window': 0.2,
+        'initial_capacity': 1000,
+        'directory': str(tmp_path),
+    })
+
+def test_normalize_email():
+    """Case and whitespace do not create distinct addresses, +tags do"""
+    assert normalize_email(' John@Example.COM ') == 'john@example.com'
+    assert normalize_email('John+promo@Example.com') == 'john+promo@example.com'
+    assert normalize_email('not-an-email') == 'not-an-email'
+
+def test_repeat_is_detected(dedup):
+    """An address is only reported as seen after it was remembered"""
+    assert dedup.seen('john@example.com') is False
+    dedup.remember('john@example.com')
+    assert dedup.seen('JOHN@example.com') is True
+    assert dedup.stats()['lru_hits'] == 1
+
+def test_repeat_returns_original_id(dedup):
+    """The registration id remembered with an address comes back on a repeat"""
+    registration_id = str(uuid.uuid4())
+    dedup.remember('john@example.com', registration_id)
+    assert dedup.lookup(' John@example.com') == (True, registration_id)
+    assert dedup.lookup('john+promo@example.com') == (False, None)
+
+def test_repeat_from_other_worker(dedup):
+    """A forked worker sees addresses and ids remembered by its parent via shared memory"""
+    registration_id = str(uuid.uuid4())
+    dedup.remember('john@example.com', registration_id)
+    pid = os.fork()
+    if pid == 0:
+        dedup.lru._items.clear()
+        os._exit(0 if dedup.lookup('john@example.com') == (True, registration_id) else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+def test_window_expires(dedup):
+    """Addresses are forgotten once two windows have passed"""
+    dedup.remember('john@example.com')
+    time.sleep(0.45)
+    assert dedup.seen('john@example.com') is False
+
+def test_false_positive_rate_is_low(dedup):
+    """Unseen addresses are almost never reported as duplicates"""
+    for i in range(1000):
+        dedup.remember(f'user{i}@example.com')
+    false_positives = sum(dedup.seen(f'other{i}@example.com') for i in range(5000))
+    assert false_positives == 0
+    assert dedup.stats()['false_positive_rate'] < 1e-5
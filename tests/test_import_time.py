@@ -0,0 +1,69 @@
+"""Cold-import checks for both services, measured with ``python -X importtime``.
+
+Each import runs in a fresh interpreter against a throwaway settings module
+(SQLite, no broker), so nothing is cached between measurements. The budget
+for importing the web app can be tuned with IMPORT_TIME_BUDGET_MS.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEB_APP_BUDGET_MS = float(os.environ.get('IMPORT_TIME_BUDGET_MS', 1500))
+
+# Only loaded once a process opens an async session or a broker connection
+ASYNC_DRIVERS = ('asyncpg', 'aiosqlite', 'sqlalchemy.dialects.postgresql.asyncpg')
+BROKER = ('pika',)
+
+
+@pytest.fixture
+def settings_dir(tmp_path):
+    """Minimal settings module pointing at a temporary SQLite database"""
+    database = tmp_path / 'app.sqlite'
+    (tmp_path / 'settings.py').write_text(
+        f"DATABASE_URL = 'sqlite:///{database}'\n"
+        f"ASYNC_DATABASE_URL = 'sqlite+aiosqlite:///{database}'\n"
+        "SECRET_KEY = 'test'\n"
+        "RABBITMQ_CONFIG = {'host': 'localhost', 'port': 5672, 'username': 'guest',\n"
+        "                   'password': 'guest', 'queue_name': 'test'}\n"
+        f"DEDUP_CONFIG = {{'directory': {str(tmp_path)!r}}}\n"
+        f"METRICS_CONFIG = {{'directory': {str(tmp_path)!r}}}\n"
+        "RATE_LIMITS = {}\n"
+        "SMTP_SERVER = 'localhost'\nSMTP_PORT = 25\nSMTP_USERNAME = ''\nSMTP_PASSWORD = ''\n"
+        "SENDER_EMAIL = 'noreply@example.com'\nBASE_URL = 'http://localhost'\n"
+    )
+    return str(tmp_path)
+
+
+def import_profile(service, module, settings_dir):
+    """Cumulative import time in milliseconds per module loaded by ``import module``"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.join(ROOT, service),
+        env={**os.environ, 'PYTHONPATH': settings_dir},
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        profile[name.strip()] = int(cumulative) / 1000
+    return profile
+
+@pytest.mark.parametrize('service', ['web_flask', 'notification_service'])
+def test_connector_import_is_lazy(service, settings_dir):
+    """Importing the DB connector creates no engines and loads no async driver or pika"""
+    profile = import_profile(service, 'core.connector.postgresql_connector', settings_dir)
+    assert not set(ASYNC_DRIVERS + BROKER) & set(profile)
+
+def test_web_app_import_budget(settings_dir):
+    """The gunicorn entry point imports within budget and defers async drivers and pika"""
+    profile = import_profile('web_flask', 'run', settings_dir)
+    assert not set(ASYNC_DRIVERS + BROKER + ('sqlalchemy.ext.asyncio',)) & set(profile)
+    assert profile['run'] < WEB_APP_BUDGET_MS, f"importing run took {profile['run']:.0f} ms"
@@ -0,0 +1,31 @@
+"""Unit tests for the RabbitMQ message codecs shared by publisher and consumer."""
+
+import pytest
+
+from core.connector import message_codec
+from core.connector.message_codec import UnsupportedContentType, available_codecs, decode, get_codec
+
+MESSAGE = {'full_name': 'Ковалёв Евгений', 'email': 'john@example.com', 'accept_license': True}
+
+
+@pytest.mark.parametrize('name', sorted(available_codecs()))
+def test_round_trip_by_header(name):
+    """Every codec's body decodes back through its own content_type header"""
+    codec = available_codecs()[name]
+    assert decode(codec.encode(MESSAGE), codec.content_type) == MESSAGE
+
+def test_legacy_message_without_header():
+    """Bodies from publishers that predate the codec are treated as JSON"""
+    assert decode(b'{"email": "john@example.com"}', None) == {'email': 'john@example.com'}
+    # and before the charset moved into content_type
+    assert decode(b'{"email": "john@example.com"}', 'application/json') == {'email': 'john@example.com'}
+
+def test_unknown_content_type():
+    """Unknown content types fail with a ValueError so the consumer dead-letters them"""
+    with pytest.raises(UnsupportedContentType):
+        decode(b'<xml/>', 'application/xml')
+
+def test_missing_library_falls_back_to_json(monkeypatch):
+    """Asking for msgpack without the package publishes JSON instead of failing"""
+    monkeypatch.setattr(message_codec, 'msgpack', None)
+    assert get_codec('msgpack').content_type == 'application/json; charset=utf-8'
@@ -0,0 +1,160 @@
+"""Unit tests for the cross-process metrics registry and the /metrics endpoint.
+
+Process files live in pytest's temporary directory instead of /dev/shm.
+"""
+
+import os
+
+import pytest
+from flask import Flask
+
+from core.metrics.middleware import RequestMetrics
+from core.metrics.registry import MetricsRegistry, metrics
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return MetricsRegistry(directory=str(tmp_path))
+
+
+def samples(registry):
+    """Rendered sample lines as {series: value}"""
+    return {
+        line.rpartition(' ')[0]: float(line.rpartition(' ')[2])
+        for line in registry.render().splitlines()
+        if not line.startswith('#')
+    }
+
+
+def test_counter_and_histogram(registry):
+    """Histogram buckets are cumulative and _count is derived from them"""
+    registry.counter('jobs_total', 'Jobs', ('queue',)).labels('mail').inc(3)
+    latency = registry.histogram('job_seconds', 'Job time', buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 7):
+        latency.observe(value)
+    text = registry.render()
+    assert '# TYPE jobs_total counter' in text
+    assert '# TYPE job_seconds histogram' in text
+    assert samples(registry) == {
+        'jobs_total{queue="mail"}': 3.0,
+        'job_seconds_bucket{le="0.1"}': 2.0,
+        'job_seconds_bucket{le="1.0"}': 3.0,
+        'job_seconds_bucket{le="+Inf"}': 4.0,
+        'job_seconds_sum': 7.65,
+        'job_seconds_count': 4.0,
+    }
+
+def test_label_values_are_escaped(registry):
+    registry.counter('paths_total', 'Paths', ('path',)).labels('a"b\\c\n').inc()
+    assert 'paths_total{path="a\\"b\\\\c\\n"} 1.0' in registry.render()
+
+def test_label_count_is_checked(registry):
+    counter = registry.counter('jobs_total', 'Jobs', ('queue',))
+    with pytest.raises(ValueError):
+        counter.labels('mail', 'extra')
+
+def test_forked_workers_are_summed(registry):
+    """Children write their own files; a scrape from any process sees the total"""
+    counter = registry.counter('jobs_total', 'Jobs', ('queue',))
+    child = counter.labels('mail')
+    child.inc()
+    pids = []
+    for _ in range(2):
+        pid = os.fork()
+        if pid == 0:
+            # The child object was bound before fork and must rebind to the child's file
+            child.inc(10)
+            os._exit(0)
+        pids.append(pid)
+    for pid in pids:
+        assert os.waitpid(pid, 0)[1] == 0
+    assert samples(registry) == {'jobs_total{queue="mail"}': 21.0}
+    assert len(os.listdir(registry.directory)) == 3
+
+def test_restarted_pid_keeps_adding(registry, tmp_path):
+    """A process reopening its own file continues from the stored values"""
+    registry.counter('jobs_total', 'Jobs').inc(2)
+    reopened = MetricsRegistry(directory=str(tmp_path))
+    reopened.counter('jobs_total', 'Jobs').inc(3)
+    assert samples(reopened) == {'jobs_total': 5.0}
+
+def test_gauge_levels_of_live_processes(registry):
+    """Gauges sum live processes; a dead worker's level is dropped, its counters are not"""
+    depth = registry.gauge('buffer_depth', 'Depth')
+    jobs = registry.counter('jobs_total', 'Jobs')
+    depth.set(5)
+    depth.dec(2)
+    pid = os.fork()
+    if pid == 0:
+        depth.inc(4)
+        jobs.inc()
+        os._exit(0)
+    assert os.waitpid(pid, 0)[1] == 0
+    text = registry.render()
+    assert '# TYPE buffer_depth gauge' in text
+    assert samples(registry) == {'buffer_depth': 3.0, 'jobs_total': 1.0}
+
+def test_gauge_function(registry):
+    """Functions are called at scrape time and replace stored values"""
+    backlog = registry.gauge('backlog', 'Backlog', ('spool',))
+    level = [7]
+    backlog.labels('outbox').set_function(lambda: level[0])
+    backlog.labels('broken').set_function(lambda: 1 / 0)
+    assert samples(registry) == {'backlog{spool="outbox"}': 7.0}
+    level[0] = 2
+    assert samples(registry) == {'backlog{spool="outbox"}': 2.0}
+
+def test_clear(registry):
+    counter = registry.counter('jobs_total', 'Jobs')
+    counter.inc()
+    registry.clear()
+    assert samples(registry) == {}
+    counter.inc()
+    assert samples(registry) == {'jobs_total': 1.0}
+
+def test_full_table_drops_new_series(tmp_path):
+    registry = MetricsRegistry(directory=str(tmp_path), size=128)
+    counter = registry.counter('jobs_total', 'Jobs', ('queue',))
+    for i in range(10):
+        counter.labels(f'queue-{i}').inc()
+    exported = samples(registry)
+    assert 0 < len(exported) < 10
+    assert set(exported.values()) == {1.0}
+
+@pytest.fixture
+def global_registry(tmp_path):
+    """The process-wide registry, writing to a temporary directory"""
+    directory = metrics.directory
+    metrics.configure({'directory': str(tmp_path)})
+    metrics.clear()
+    yield metrics
+    metrics.clear()
+    metrics.directory = directory
+
+def test_request_metrics_endpoint(global_registry):
+    """Request latency is labelled by route template, not the raw path"""
+    app = Flask(__name__)
+    RequestMetrics(app)
+
+    @app.route('/items/<int:item_id>')
+    def item(item_id):
+        return 'ok'
+
+    client = app.test_client()
+    client.get('/items/1')
+    client.get('/items/2')
+    client.get('/missing')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    body = response.get_data(as_text=True)
+    assert 'http_request_duration_seconds_count{blueprint="",route="/items/<int:item_id>",method="GET",status="200"} 2.0' in body
+    assert 'route="<unmatched>",method="GET",status="404"} 1.0' in body
+
+def test_scrape_allowlist(global_registry):
+    """Peers outside the allowlist get the same 404 as at nginx"""
+    app = Flask(__name__)
+    RequestMetrics(app, allow=('10.0.0.0/8',))
+    client = app.test_client()
+    assert client.get('/metrics').status_code == 404
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '10.1.2.3'}).status_code == 200
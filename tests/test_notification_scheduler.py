@@ -0,0 +1,99 @@
+"""NotificationSchedulerService: the last failed attempt commits 'failed' and NOTIFYs.
+
+Runs in a subprocess from the notification_service directory against a
+throwaway settings module and a SQLite database, like test_supervisor.py.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = '''
+import asyncio, json, sys
+from contextlib import asynccontextmanager
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from core.db.models import Base, CopyShared, Notifications, Statuses, UserData
+from notification_scheduler import NotificationSchedulerService
+
+out = sys.argv[1]
+engine = create_async_engine(sys.argv[2])
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+
+class SessionFactory:
+    @asynccontextmanager
+    async def get_async_db(self):
+        async with Session() as session:
+            yield session
+            await session.commit()
+
+
+class FailingSender:
+    def send_registration_email(self, email, name_file_uuid):
+        return False
+
+
+notified = []
+
+async def record_notify(session, notification, status):
+    notified.append([notification.id, status])
+
+
+async def main():
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    async with Session() as session:
+        statuses = {name: Statuses(name=name) for name in ('pending', 'success', 'failed')}
+        user = UserData(email='a@example.com', nickname='a')
+        copy = CopyShared(user=user, name_file_uuid='file')
+        notification = Notifications(copy=copy, status=statuses['pending'], attempts=2, max_attempts=3)
+        session.add_all([*statuses.values(), user, copy, notification])
+        await session.commit()
+
+    scheduler = NotificationSchedulerService(FailingSender(), session_factory=SessionFactory(), config={'listen': False})
+    scheduler.notify_status = record_notify
+    await scheduler.process_pending_notifications()
+    tasks = set().union(*scheduler.scheduled_tasks.values())
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    async with Session() as session:
+        row = (await session.execute(
+            select(Notifications.attempts, Statuses.name).join(Statuses, Notifications.status)
+        )).one()
+    with open(out, 'w') as f:
+        json.dump({
+            'results': [repr(result) for result in results],
+            'row': list(row),
+            'notified': notified,
+            'scheduled': list(scheduler.scheduled_tasks),
+        }, f)
+
+asyncio.run(main())
+'''
+
+
+def test_last_attempt_commits_failed_status(tmp_path):
+    database = tmp_path / 'scheduler.db'
+    (tmp_path / 'settings.py').write_text(
+        f"DATABASE_URL = 'sqlite:///{database}'\n"
+        f"ASYNC_DATABASE_URL = 'sqlite+aiosqlite:///{database}'\n"
+    )
+    out = tmp_path / 'out.json'
+    result = subprocess.run(
+        [sys.executable, '-c', SCRIPT, str(out), f'sqlite+aiosqlite:///{database}'],
+        cwd=os.path.join(ROOT, 'notification_service'),
+        env={**os.environ, 'PYTHONPATH': str(tmp_path)},
+        capture_output=True, text=True, timeout=30,
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+
+    report = json.loads(out.read_text())
+    # The task that gives up is not cancelled by its own cleanup
+    assert report['results'] == ['False']
+    assert report['row'] == [3, 'failed']
+    assert report['notified'] == [[1, 'failed']]
+    assert report['scheduled'] == []
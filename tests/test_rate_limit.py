@@ -0,0 +1,49 @@
+"""Unit tests for the shared-memory token-bucket rate limiter."""
+
+import os
+
+import pytest
+
+from core.guard.rate_limit import RateLimiter, TokenBucket
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    """Limiter allowing a burst of 3 requests per IP, refilling 1 per second"""
+    return RateLimiter(
+        {'/api/v1/register': {'ip': {'rate': 1, 'burst': 3}}},
+        capacity=64,
+        directory=str(tmp_path)
+    )
+
+def test_burst_then_limited(limiter):
+    """Requests beyond the burst are refused with a positive retry delay"""
+    results = [limiter.check('/api/v1/register', 'ip', '10.0.0.1') for _ in range(4)]
+    assert results[:3] == [0.0, 0.0, 0.0]
+    assert 0 < results[3] <= 1
+    assert limiter.stats() == {'allowed': 3, 'limited': 1}
+
+def test_keys_and_routes_are_independent(limiter):
+    """Each IP has its own bucket, and unconfigured routes are never limited"""
+    for _ in range(3):
+        limiter.check('/api/v1/register', 'ip', '10.0.0.1')
+    assert limiter.check('/api/v1/register', 'ip', '10.0.0.2') == 0.0
+    assert limiter.check('/api/v1/other', 'ip', '10.0.0.1') == 0.0
+
+def test_buckets_are_shared_across_workers(limiter):
+    """Tokens taken in a forked worker are gone for the parent as well"""
+    pid = os.fork()
+    if pid == 0:
+        for _ in range(3):
+            limiter.check('/api/v1/register', 'ip', '10.0.0.1')
+        os._exit(0)
+    os.waitpid(pid, 0)
+    assert limiter.check('/api/v1/register', 'ip', '10.0.0.1') > 0
+
+def test_token_bucket_refill():
+    """An empty bucket refills at the configured rate up to the burst size"""
+    bucket = TokenBucket(rate=2, burst=4)
+    tokens, retry_after = bucket.take(0.0, touched_at=100.0, now=100.25)
+    assert retry_after == pytest.approx(0.25)
+    tokens, retry_after = bucket.take(0.0, touched_at=100.0, now=110.0)
+    assert (tokens, retry_after) == (3.0, 0.0)
@@ -0,0 +1,42 @@
+"""Unit tests for the declarative request schema used by the registration API."""
+
+import pytest
+
+from core.validation.schema import REQUIRED, Boolean, Email, Schema, String
+
+
+@pytest.fixture
+def schema():
+    """Registration-shaped schema with the UserData column limits"""
+    return Schema({
+        'full_name': String(max_length=100),
+        'email': Email(max_length=255),
+        'accept_license': Boolean(accept=True),
+    })
+
+def test_valid_payload_is_cleaned(schema):
+    """Strings are stripped and form-style booleans coerced"""
+    data, errors = schema.validate({'full_name': ' John ', 'email': 'john@example.com', 'accept_license': 'on'})
+    assert errors is None
+    assert data == {'full_name': 'John', 'email': 'john@example.com', 'accept_license': True}
+
+def test_errors_are_reported_per_field(schema):
+    """Every failing field is reported at once"""
+    data, errors = schema.validate({'full_name': 'x' * 101, 'email': 'john@@example', 'accept_license': False})
+    assert data is None
+    assert errors == {
+        'full_name': 'Must be at most 100 characters',
+        'email': 'Invalid email address',
+        'accept_license': REQUIRED,
+    }
+
+@pytest.mark.parametrize('email', ['john', 'john@', '.john@example.com', 'jo..hn@example.com',
+                                   'john@-example.com', 'john@example', f"{'a' * 65}@example.com"])
+def test_invalid_emails(email):
+    """Malformed addresses never reach the broker"""
+    assert Schema({'email': Email(255)}).validate({'email': email})[1] == {'email': 'Invalid email address'}
+
+def test_non_object_payload(schema):
+    """Arrays, strings and undecodable bodies are rejected as a whole"""
+    assert schema.validate(['john@example.com'])[1] == {'payload': 'Expected a JSON object'}
+    assert schema.validate(None)[1] == {'payload': 'Expected a JSON object'}
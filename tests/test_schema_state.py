@@ -0,0 +1,54 @@
+"""Unit tests for the versioned schema bootstrap, run against a temporary SQLite file."""
+
+import pytest
+from sqlalchemy import create_engine, insert, select, text
+
+from core.db.models import CopyShared, Notifications, Statuses, UserData
+from core.db.schema_state import (
+    SCHEMA_VERSION, SchemaOutdated, current_version, ensure_schema, migrate, schema_state
+)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """Engine on an empty database"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'schema.sqlite'}")
+    yield engine
+    engine.dispose()
+
+def test_migrate_is_one_shot(engine):
+    """Migrations apply once, record the version and seed the statuses"""
+    assert current_version(engine) == 0
+    assert migrate(engine) == list(range(1, SCHEMA_VERSION + 1))
+    assert migrate(engine) == []
+    assert current_version(engine) == SCHEMA_VERSION
+    with engine.connect() as connection:
+        assert set(connection.scalars(select(Statuses.name))) == {'pending', 'failed', 'success'}
+
+def test_startup_check_without_auto_migrate(engine):
+    """A behind schema fails fast instead of running DDL in a worker"""
+    with pytest.raises(SchemaOutdated):
+        ensure_schema(engine, auto_migrate=False)
+    migrate(engine)
+    assert ensure_schema(engine, auto_migrate=False) == SCHEMA_VERSION
+
+def test_duplicate_copies_are_folded(engine):
+    """Version 3 keeps each user's oldest copy and moves notifications onto it"""
+    migrate(engine)
+    with engine.begin() as connection:
+        # Back to a version 2 database, where a user could have several copies
+        connection.execute(text('DROP INDEX ix_copyshared_id_user'))
+        connection.execute(schema_state.delete().where(schema_state.c.version == 3))
+        connection.execute(insert(UserData), [{'email': 'a@example.com', 'nickname': 'A'}])
+        connection.execute(insert(CopyShared), [
+            {'id': 1, 'id_user': 1, 'name_file_uuid': 'first'},
+            {'id': 2, 'id_user': 1, 'name_file_uuid': 'second'},
+        ])
+        connection.execute(insert(Notifications), [
+            {'id_copy_shared': 1, 'id_status_sending': 1, 'registration_id': 'r1'},
+            {'id_copy_shared': 2, 'id_status_sending': 1, 'registration_id': 'r2'},
+        ])
+    assert migrate(engine) == [3]
+    with engine.connect() as connection:
+        assert connection.execute(select(CopyShared.id, CopyShared.name_file_uuid)).all() == [(1, 'first')]
+        assert set(connection.scalars(select(Notifications.id_copy_shared))) == {1}
@@ -0,0 +1,45 @@
+"""Code kept as identical copies in web_flask and notification_service.
+
+The services are built into separate images, each with its own top-level
+``core`` package, so they cannot import from each other. A change to one
+copy fails here until the other copy gets it too.
+"""
+
+import ast
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COPIED_MODULES = [
+    'core/shared/shm.py',
+    'core/metrics/registry.py',
+    'core/connector/message_codec.py',
+]
+# (function, file defining it in each service)
+COPIED_FUNCTIONS = [
+    ('available_cpus', 'web_flask/gunicorn.conf.py', 'notification_service/supervisor.py'),
+]
+
+
+def read(path):
+    with open(os.path.join(ROOT, path), encoding='utf-8') as f:
+        return f.read()
+
+
+def function_source(path, name):
+    source = read(path)
+    for node in ast.parse(source).body:
+        if isinstance(node, ast.FunctionDef) and node.name == name:
+            return ast.get_source_segment(source, node)
+    raise AssertionError(f"{name} not found in {path}")
+
+
+@pytest.mark.parametrize('module', COPIED_MODULES)
+def test_modules_match(module):
+    assert read(f'web_flask/{module}') == read(f'notification_service/{module}')
+
+@pytest.mark.parametrize('name, first, second', COPIED_FUNCTIONS)
+def test_functions_match(name, first, second):
+    assert function_source(first, name) == function_source(second, name)
@@ -0,0 +1,69 @@
+"""notification_service Supervisor: restarts with backoff and drains on SIGTERM.
+
+The supervisor forks, so it runs in a subprocess from the notification_service
+directory against a throwaway settings module, with stand-in worker targets.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = '''
+import json, logging, os, signal, sys, threading, time
+from core.metrics.registry import metrics
+from supervisor import Supervisor
+
+out = sys.argv[1]
+metrics.configure({'directory': out})
+
+def steady(index, count, drain_timeout):
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    stopping.wait()
+    time.sleep(0.2)  # finishing in-flight work
+    open(os.path.join(out, f'drained-{index}'), 'w').close()
+
+def crashing(index, count, drain_timeout):
+    raise RuntimeError('boom')
+
+supervisor = Supervisor(
+    {'backoff_initial': 0.1, 'backoff_max': 0.4, 'stop_timeout': 5},
+    roles={'steady': (steady, 2), 'crashing': (crashing, 1)},
+)
+def report():
+    time.sleep(1.5)
+    with open(os.path.join(out, 'health.json'), 'w') as f:
+        json.dump(supervisor.health(), f)
+    os.kill(os.getpid(), signal.SIGTERM)
+threading.Thread(target=report, daemon=True).start()
+supervisor.run()
+'''
+
+
+def test_supervisor_restarts_and_drains(tmp_path):
+    (tmp_path / 'settings.py').write_text(f"METRICS_CONFIG = {{'directory': {str(tmp_path)!r}}}\n")
+    started = time.monotonic()
+    result = subprocess.run(
+        [sys.executable, '-c', SCRIPT, str(tmp_path)],
+        cwd=os.path.join(ROOT, 'notification_service'),
+        env={**os.environ, 'PYTHONPATH': str(tmp_path)},
+        capture_output=True, text=True, timeout=30,
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    assert time.monotonic() - started < 10
+
+    healthy, details = json.loads((tmp_path / 'health.json').read_text())
+    assert details['status'] == ('ok' if healthy else 'degraded')
+    workers = {(worker['role'], worker['index']): worker for worker in details['workers']}
+    assert workers[('steady', 0)]['alive'] and workers[('steady', 1)]['alive']
+    assert workers[('steady', 0)]['restarts'] == 0
+    # 0.1 + 0.2 + 0.4 + 0.4 ... within 1.5 s: a few restarts, not a tight loop
+    assert 2 <= workers[('crashing', 0)]['restarts'] <= 6
+
+    # Both steady workers finished their work before the supervisor exited
+    assert (tmp_path / 'drained-0').exists() and (tmp_path / 'drained-1').exists()
+    assert 'restarting in 0.4s' in result.stderr
@@ -0,0 +1,157 @@
+"""ASGI entry point serving the same blueprints as run.py.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 2
+
+POST /api/v1/register is handled natively on the event loop and published
+through AsyncRabbitMQClient, so a worker can keep thousands of
+registrations in flight. Every other route is passed to the Flask app
+through a WSGI adapter running on a thread pool.
+"""
+import asyncio
+import json
+import logging
+import time
+
+from a2wsgi import WSGIMiddleware
+
+import settings
+from main import app as flask_app
+from core.connector.async_rmq_connector import AsyncRabbitMQClient
+from core.db.session import RequestSessions
+from core.db.utils import init_db
+from core.metrics.middleware import request_latency
+from blueprints.api_bluep.endpoint import (
+    MAX_REGISTER_BODY_SIZE,
+    REGISTER_PATH,
+    check_registration,
+    limit_answer,
+    outbox,
+    outbox_replayer,
+    registration_answer,
+    resolve_client_ip,
+)
+
+logger = logging.getLogger(__name__)
+
+# The session setup of run.py, without the rest of the gunicorn entry point
+Session = init_db(settings.DATABASE_URL, auto_migrate=getattr(settings, 'AUTO_MIGRATE', True))
+request_sessions = RequestSessions(Session, flask_app)
+
+
+class RegistrationASGI:
+    """ASGI app with a native async registration handler in front of Flask"""
+
+    def __init__(self, wsgi_app, rabbitmq_config):
+        self.wsgi = WSGIMiddleware(wsgi_app)
+        self.publisher = AsyncRabbitMQClient(rabbitmq_config)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http' and scope['method'] == 'POST' and scope['path'] == REGISTER_PATH:
+            await self._timed(scope, receive, send)
+        else:
+            await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.publisher.connect()
+                except Exception as e:
+                    # Publishing reconnects lazily, so a broker outage must not block startup
+                    logger.warning(f"RabbitMQ unavailable at startup: {str(e)}")
+                if outbox_replayer:
+                    outbox_replayer.ensure_started()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.publisher.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def _respond(send, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode('latin-1')),
+                *((name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in (headers or {}).items()),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    async def _read_body(receive):
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_REGISTER_BODY_SIZE:
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    async def _timed(self, scope, receive, send):
+        """Record the native handler under the same series Flask would use"""
+        started = time.perf_counter()
+        status = []
+
+        async def send_and_record(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            await send(message)
+
+        await self._register(scope, receive, send_and_record)
+        request_latency.labels('api_bluep', REGISTER_PATH, 'POST', status[0] if status else 500) \
+            .observe(time.perf_counter() - started)
+
+    async def _register(self, scope, receive, send):
+        """api_bluep.register on the event loop: same checks and answers, async publish
+
+        The checks only hold their shared-memory locks (rate limiter, dedup)
+        for a table lookup, so they run inline; a thread hop would cost more
+        and cap the loop at the thread pool size.
+        """
+        headers = dict(scope['headers'])
+        client_ip = resolve_client_ip(
+            (scope.get('client') or ('',))[0],
+            headers.get(b'x-real-ip', b'').decode('latin-1')
+        )
+        limited = limit_answer(REGISTER_PATH, 'ip', client_ip)
+        if limited:
+            await self._respond(send, *limited)
+            return
+
+        body = await self._read_body(receive)
+        if body is None:
+            await self._respond(send, 413, {'success': False, 'message': 'Request body too large'})
+            return
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            # As request.get_json(silent=True) in the Flask view
+            payload = None
+
+        data, answer = check_registration(payload)
+        if answer:
+            await self._respond(send, *answer)
+            return
+
+        if outbox:
+            # The spool fsyncs, so keep it off the event loop
+            await asyncio.to_thread(outbox.append, data)
+            outbox_replayer.wake()
+            published = True
+        else:
+            published = await self.publisher.publish(data)
+
+        await self._respond(send, *registration_answer(data, published))
+
+
+app = RegistrationASGI(flask_app, settings.RABBITMQ_CONFIG)
@@ -1,52 +1,394 @@
-from flask import Blueprint, request, jsonify
-from pika import BlockingConnection, ConnectionParameters, PlainCredentials
+from flask import Blueprint, Response, g, request, jsonify, stream_with_context
+import atexit
+import functools
+import ipaddress
 import json
+import queue
 import threading
 import time
 import uuid
 from datetime import datetime
 import settings
-from core.connector.rmq_connector import RabbitMQClient
+from core.connector.rmq_connector import RabbitMQClient, BufferFull
+from core.outbox.spool import OutboxSpool, OutboxReplayer
+from core.guard.dedup import RegistrationDeduplicator, normalize_email
+from core.guard.rate_limit import RateLimiter
+from core.cache.ttl_cache import TTLCache
+from core.db.models import UserData
+from core.db.utils import get_registration_status
+from core.validation.schema import REQUIRED, Boolean, Email, Schema, String
+from core.events.status_events import StatusEventHub
 
 endpoint = Blueprint('api_bluep', __name__)
 
 # RabbitMQ configuration
 RABBITMQ_CONFIG = settings.RABBITMQ_CONFIG
 
-# Create instance
+# Upper bound on records per /api/v1/register/batch call, and how many
+# records of a streamed NDJSON body are validated and published together
+REGISTER_BATCH_LIMIT = getattr(settings, 'REGISTER_BATCH_LIMIT', 1000)
+REGISTER_BATCH_CHUNK = getattr(settings, 'REGISTER_BATCH_CHUNK', 200)
+
+# Limits come from the UserData columns the consumer writes, so bad input
+# is rejected here instead of failing (or truncating) after the broker
+REGISTRATION_SCHEMA = Schema({
+    'full_name': String(max_length=UserData.__table__.c.nickname.type.length),
+    'email': Email(max_length=UserData.__table__.c.email.type.length),
+    'accept_license': Boolean(accept=True),
+    'accept_age': Boolean(accept=True),
+})
+MAX_REGISTER_BODY_SIZE = getattr(settings, 'MAX_REGISTER_BODY_SIZE', 64 * 1024)
+REGISTER_PATH = '/api/v1/register'
+SUCCESS_MESSAGE = 'Registration submitted successfully! Check your email for further instructions.'
+
+# Create instance; publishes reuse its pooled connections across requests
 rabbitmq_client = RabbitMQClient(RABBITMQ_CONFIG)
+atexit.register(rabbitmq_client.close)
+
+# Optional write-ahead outbox: registrations are spooled to disk and replayed
+# into RabbitMQ in the background, so broker outages never reach the client
+OUTBOX_CONFIG = getattr(settings, 'OUTBOX_CONFIG', None)
+outbox = OutboxSpool(OUTBOX_CONFIG) if OUTBOX_CONFIG else None
+outbox_replayer = OutboxReplayer(outbox, rabbitmq_client, OUTBOX_CONFIG) if outbox else None
+if outbox_replayer:
+    atexit.register(outbox_replayer.stop)
+    outbox.export_metrics()
+
+# Repeated submissions of the same email within the window are answered
+# without publishing; shared across workers through /dev/shm
+DEDUP_CONFIG = getattr(settings, 'DEDUP_CONFIG', {})
+dedup = RegistrationDeduplicator(DEDUP_CONFIG) if DEDUP_CONFIG.get('enabled', True) else None
+if dedup:
+    dedup.export_metrics()
+
+# Token buckets per route and scope (requests per second, burst), shared by
+# all workers; the client IP comes from nginx's X-Real-IP header
+RATE_LIMITS = getattr(settings, 'RATE_LIMITS', {
+    '/api/v1/register': {
+        'ip': {'rate': 10 / 60, 'burst': 10},
+        'email_domain': {'rate': 10, 'burst': 300},
+    },
+    '/api/v1/register/batch': {
+        'ip': {'rate': 1 / 60, 'burst': 5},
+    },
+})
+rate_limiter = RateLimiter(RATE_LIMITS) if RATE_LIMITS else None
+
+
+# Peers whose X-Real-IP header is believed. nginx reaches the app over the
+# compose network; from anyone else the header could be forged to dodge
+# the per-IP rate limits
+TRUSTED_PROXIES = tuple(ipaddress.ip_network(network) for network in getattr(settings, 'TRUSTED_PROXIES', (
+    '127.0.0.0/8', '::1/128', '10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16',
+)))
+
+
+@functools.lru_cache(maxsize=1024)
+def trusted_proxy(remote_addr):
+    try:
+        address = ipaddress.ip_address(remote_addr)
+    except ValueError:
+        return False
+    return any(address in network for network in TRUSTED_PROXIES)
+
+
+def resolve_client_ip(remote_addr, real_ip):
+    """X-Real-IP when the peer is a trusted proxy, else the peer's own address"""
+    if real_ip and remote_addr and trusted_proxy(remote_addr):
+        return real_ip
+    return remote_addr
+
+
+def client_ip():
+    return resolve_client_ip(request.remote_addr, request.headers.get('X-Real-IP'))
+
+
+def limit_answer(route, scope, key):
+    """(status, payload, headers) when key is over its limit for route, else None"""
+    if not rate_limiter:
+        return None
+    retry_after = rate_limiter.check(route, scope, key)
+    if not retry_after:
+        return None
+    return 429, {
+        'success': False,
+        'message': 'Too many requests, please try again later'
+    }, {'Retry-After': RateLimiter.retry_after_header(retry_after)}
+
+
+def json_answer(status, payload, headers):
+    """Flask response for a (status, payload, headers) answer"""
+    response = jsonify(payload)
+    response.headers.update(headers)
+    return response, status
+
+
+def rate_limited(scope, key):
+    """Return a 429 response when key is over its limit for this route, else None"""
+    if request.url_rule is None:
+        return None
+    limited = limit_answer(request.url_rule.rule, scope, key)
+    return json_answer(*limited) if limited else None
+
+# Statuses a registration does not leave; cached longer and end status streams
+FINAL_STATUSES = frozenset({'success', 'failed'})
+
+# Read-through cache for /api/v1/check-status: final states are kept longer,
+# and ids the consumer has not written yet are negatively cached
+STATUS_CACHE_CONFIG = getattr(settings, 'STATUS_CACHE_CONFIG', {})
+status_cache = TTLCache(
+    maxsize=STATUS_CACHE_CONFIG.get('maxsize', 100000),
+    ttl=lambda status: STATUS_CACHE_CONFIG.get('final_ttl', 60) if status['status'] in FINAL_STATUSES
+        else STATUS_CACHE_CONFIG.get('ttl', 2),
+    negative_ttl=STATUS_CACHE_CONFIG.get('negative_ttl', 1)
+)
+
+STATUS_MESSAGES = {
+    'pending': 'Registration is being processed',
+    'success': 'Registration email has been sent',
+    'failed': 'Registration email could not be sent',
+}
+
+# Status pushes for /api/v1/check-status/<id>/events come from a single
+# LISTEN connection per worker rather than per-stream polling
+status_events = StatusEventHub(settings.DATABASE_URL)
+SSE_HEARTBEAT = getattr(settings, 'SSE_HEARTBEAT', 15)
+SSE_MAX_DURATION = getattr(settings, 'SSE_MAX_DURATION', 300)
+# An open stream holds a gthread thread for up to SSE_MAX_DURATION, so each
+# worker serves at most this many and answers 503 above it; clients fall
+# back to polling /api/v1/check-status/<id>
+SSE_MAX_STREAMS = getattr(settings, 'SSE_MAX_STREAMS', 2)
+sse_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
 
-@endpoint.route('/api/v1/register', methods=['POST'])
+@endpoint.before_app_request
+def start_outbox_replayer():
+    # Threads do not survive fork, so every worker starts its own on first request
+    if outbox_replayer:
+        outbox_replayer.ensure_started()
+
+
+def build_registration(payload):
+    """Return (data, error) for a single registration payload.
+
+    error is a dict with a summary ``message`` and per-field ``errors``.
+    """
+    data, errors = REGISTRATION_SCHEMA.validate(payload)
+    if errors:
+        message = 'All fields are required' if REQUIRED in errors.values() else 'Invalid registration data'
+        return None, {'message': message, 'errors': errors}
+    data['timestamp'] = datetime.utcnow().isoformat()
+    data['registration_id'] = str(uuid.uuid4())
+    return data, None
+
+
+def duplicate_result(registration_id, **extra):
+    """Response for an address registered within the dedup window.
+
+    Still a success for the client; registration_id is the one issued for
+    the original registration, omitted if this worker no longer knows it.
+    """
+    result = {**extra, 'success': True, 'duplicate': True}
+    if registration_id:
+        result['registration_id'] = registration_id
+    return result
+
+
+def submit_registration_batch(records):
+    """Validate records in one pass and publish the valid ones together.
+
+    Returns per-record results in input order. Valid records go to the
+    outbox in one commit, or to the broker in one AMQP transaction. A
+    duplicate, of an earlier registration or of a record earlier in the
+    same batch, is not published and reports the original registration_id
+    when it is still known.
+    """
+    results, valid = [], []
+    # Normalized email -> result of the record accepted for it in this batch
+    accepted, repeats = {}, []
+    for index, payload in records:
+        data, error = build_registration(payload)
+        if error:
+            results.append({'index': index, 'success': False, **error})
+            continue
+        if dedup:
+            key = normalize_email(data['email'])
+            original = accepted.get(key)
+            if original is not None:
+                result = duplicate_result(original['registration_id'], index=index)
+                results.append(result)
+                repeats.append((result, original))
+                continue
+            seen, registration_id = dedup.lookup(data['email'])
+            if seen:
+                results.append(duplicate_result(registration_id, index=index))
+                continue
+        result = {'index': index, 'success': True, 'registration_id': data['registration_id']}
+        results.append(result)
+        valid.append((result, data))
+        if dedup:
+            accepted[key] = result
+
+    if valid:
+        try:
+            messages = [data for _, data in valid]
+            if outbox:
+                outbox.append_many(messages)
+                outbox_replayer.wake()
+            else:
+                rabbitmq_client.publish_batch(messages)
+        except Exception as e:
+            for result, _ in valid:
+                result['success'] = False
+                result.pop('registration_id')
+                result['message'] = f'Error processing registration: {str(e)}'
+            # Repeats within the batch share the fate of the record they repeat
+            for result, original in repeats:
+                index = result['index']
+                result.clear()
+                result.update(original, index=index)
+        else:
+            if dedup:
+                for _, data in valid:
+                    dedup.remember(data['email'], data['registration_id'])
+    return results
+
+
+def _iter_ndjson(stream):
+    """Yield (index, payload) per line without reading the whole body"""
+    index = 0
+    for line in iter(stream.readline, b''):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            payload = json.loads(line)
+        except ValueError:
+            payload = None
+        yield index, payload
+        index += 1
+
+
+def check_registration(payload):
+    """Validation, domain rate limit and dedup of one /api/v1/register payload.
+
+    Shared by the Flask view and the ASGI handler, which only differ in how
+    they publish. Returns (data, None) when data should be published, or
+    (None, (status, payload, headers)) to answer without publishing.
+    """
+    data, error = build_registration(payload)
+    if error:
+        return None, (400, {'success': False, **error}, {})
+    limited = limit_answer(REGISTER_PATH, 'email_domain', data['email'].rpartition('@')[2].strip().lower())
+    if limited:
+        return None, limited
+    if dedup:
+        seen, registration_id = dedup.lookup(data['email'])
+        if seen:
+            return None, (200, duplicate_result(registration_id, message=SUCCESS_MESSAGE), {})
+    return data, None
+
+
+def registration_answer(data, published):
+    """(status, payload, headers) once the publish step for data returned"""
+    if not published:
+        return 500, {'success': False, 'message': 'Error processing registration'}, {}
+    if dedup:
+        dedup.remember(data['email'], data['registration_id'])
+    return 200, {
+        'success': True,
+        'registration_id': data['registration_id'],
+        'message': SUCCESS_MESSAGE
+    }, {}
+
+
+def submit_registration(data):
+    """Hand a validated registration to the outbox, async buffer or broker.
+
+    Raises BufferFull when the async publish buffer is saturated.
+    """
+    if outbox:
+        outbox.append(data)
+        outbox_replayer.wake()
+        return True
+    if rabbitmq_client.async_mode:
+        return rabbitmq_client.publish_nowait(data)
+    return rabbitmq_client.publish(data)
+
+
+@endpoint.route(REGISTER_PATH, methods=['POST'])
 def register():
     """Handle registration form submission"""
+    limited = rate_limited('ip', client_ip())
+    if limited:
+        return limited
+    if request.content_length and request.content_length > MAX_REGISTER_BODY_SIZE:
+        return jsonify({
+            'success': False,
+            'message': 'Request body too large'
+        }), 413
     try:
-        data = {
-            'full_name': request.json.get('full_name'),
-            'email': request.json.get('email'),
-            'accept_license': request.json.get('accept_license'),
-            'accept_age': request.json.get('accept_age'),
-            'timestamp': datetime.utcnow().isoformat()
-        }
-        
-        # Validate required fields
-        if not all([data['full_name'], data['email'], 
-                   data['accept_license'], data['accept_age']]):
-            return jsonify({
+        data, answer = check_registration(request.get_json(silent=True))
+        if answer:
+            return json_answer(*answer)
+
+        try:
+            published = submit_registration(data)
+        except BufferFull as e:
+            response = jsonify({
                 'success': False,
-                'message': 'All fields are required'
-            }), 400
+                'message': 'Service is busy, please try again later'
+            })
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response, 503
+
+        return json_answer(*registration_answer(data, published))
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
 
-        # Send to RabbitMQ queue
-        if rabbitmq_client.publish(data):
+@endpoint.route('/api/v1/register/batch', methods=['POST'])
+def register_batch():
+    """Handle bulk registration imports.
+
+    Accepts a JSON array of registration records, or an NDJSON body
+    (``Content-Type: application/x-ndjson``) that is processed in chunks as
+    it streams in and answered with one NDJSON result line per record.
+    """
+    limited = rate_limited('ip', client_ip())
+    if limited:
+        return limited
+
+    if request.mimetype == 'application/x-ndjson':
+        return Response(
+            stream_with_context(_stream_batch_results(request.stream)),
+            mimetype='application/x-ndjson'
+        )
+
+    try:
+        records = request.json
+        if not isinstance(records, list):
             return jsonify({
-                'success': True,
-                'message': 'Registration submitted successfully! Check your email for further instructions.'
-            })
-        else:
+                'success': False,
+                'message': 'Expected a JSON array of registrations'
+            }), 400
+        if len(records) > REGISTER_BATCH_LIMIT:
             return jsonify({
                 'success': False,
-                'message': 'Error processing registration'
-            }), 500
+                'message': f'At most {REGISTER_BATCH_LIMIT} registrations per batch'
+            }), 413
+
+        results = submit_registration_batch(enumerate(records))
+        accepted = sum(result['success'] for result in results)
+        return jsonify({
+            'success': accepted == len(results),
+            'accepted': accepted,
+            'rejected': len(results) - accepted,
+            'results': results
+        })
 
     except Exception as e:
         return jsonify({
@@ -54,19 +396,123 @@ def register():
             'message': str(e)
         }), 500
 
+
+def _stream_batch_results(stream):
+    chunk = []
+    for index, payload in _iter_ndjson(stream):
+        if index >= REGISTER_BATCH_LIMIT:
+            yield json.dumps({
+                'index': index,
+                'success': False,
+                'message': f'At most {REGISTER_BATCH_LIMIT} registrations per batch'
+            }) + '\n'
+            return
+        chunk.append((index, payload))
+        if len(chunk) >= REGISTER_BATCH_CHUNK:
+            for result in submit_registration_batch(chunk):
+                yield json.dumps(result) + '\n'
+            chunk = []
+    for result in submit_registration_batch(chunk):
+        yield json.dumps(result) + '\n'
+
+
 @endpoint.route('/api/v1/check-status/<registration_id>', methods=['GET'])
 def check_status(registration_id):
-    """Check registration status IGNORE THAT METHOD LEGACY"""
+    """Check registration status through the read-through status cache"""
+    try:
+        uuid.UUID(registration_id)
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'message': 'Invalid registration id'
+        }), 400
+
     try:
-        
+        status = status_cache.get_or_load(
+            registration_id,
+            lambda key: get_registration_status(g.db, key)
+        )
+        # Not written by the consumer yet
+        status = status or {'status': 'pending'}
         return jsonify({
             'success': True,
             'registration_id': registration_id,
-            'status': 'pending',
-            'message': 'Registration is being processed'
+            **status,
+            'message': STATUS_MESSAGES.get(status['status'], 'Registration is being processed')
         })
     except Exception as e:
         return jsonify({
             'success': False,
             'message': str(e)
-        }), 500
\ No newline at end of file
+        }), 500
+
+
+def _sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def _stream_status(registration_id, status, events):
+    """Yield the current status, then pushed changes until a final status or timeout"""
+    yield _sse('status', {'registration_id': registration_id, **status})
+    if status['status'] in FINAL_STATUSES:
+        return
+    deadline = time.monotonic() + SSE_MAX_DURATION
+    while time.monotonic() < deadline:
+        try:
+            event = events.get(timeout=SSE_HEARTBEAT)
+        except queue.Empty:
+            # Comment line keeps proxies from closing an idle stream
+            yield ': heartbeat\n\n'
+            continue
+        status_cache.invalidate(registration_id)
+        yield _sse('status', event)
+        if event.get('status') in FINAL_STATUSES:
+            return
+
+
+@endpoint.route('/api/v1/check-status/<registration_id>/events', methods=['GET'])
+def status_stream(registration_id):
+    """Server-Sent Events stream of status changes for a registration"""
+    try:
+        uuid.UUID(registration_id)
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'message': 'Invalid registration id'
+        }), 400
+
+    if not sse_slots.acquire(blocking=False):
+        response = jsonify({
+            'success': False,
+            'message': 'Too many open status streams, poll /api/v1/check-status instead'
+        })
+        response.headers['Retry-After'] = str(SSE_HEARTBEAT)
+        return response, 503
+
+    def close():
+        status_events.unsubscribe(registration_id, events)
+        sse_slots.release()
+
+    # Subscribe before reading the current state so no transition is missed
+    events = status_events.subscribe(registration_id)
+    try:
+        # Straight from the DB: a cached 'pending' may predate the final event
+        status = get_registration_status(g.db, registration_id) or {'status': 'pending'}
+    except Exception:
+        close()
+        raise
+    finally:
+        # The stream outlives the view; don't hold a pooled connection for it
+        session = g.pop('db', None)
+        if session is not None:
+            session.close()
+
+    response = Response(
+        stream_with_context(_stream_status(registration_id, status, events)),
+        mimetype='text/event-stream'
+    )
+    response.call_on_close(close)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Let nginx pass events through instead of buffering the response
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,11 +1,22 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, request
+import settings
+from core.cache.page_cache import PageCache
 
 endpoint = Blueprint('web_bluep', __name__)
 
+# Locales the landing page can be rendered in; the first one is the default
+PAGE_LOCALES = getattr(settings, 'PAGE_LOCALES', ['ru'])
+
+page_cache = PageCache(
+    deploy_id=getattr(settings, 'DEPLOY_ID', ''),
+    microcache_seconds=getattr(settings, 'PAGE_MICROCACHE_SECONDS', 0)
+)
+
 @endpoint.route('/')
 def index():
-    """Render the main index page"""
-    return render_template('index.html')
+    """Render the main index page, served from the rendered-page cache"""
+    locale = request.accept_languages.best_match(PAGE_LOCALES, default=PAGE_LOCALES[0])
+    return page_cache.respond('index.html', locale, render_template)
 
 
 # LEGACY
@@ -0,0 +1,131 @@
+"""Build fingerprinted, precompressed static assets.
+
+Copies every file under ``static/`` to ``static/dist/`` with a content hash
+in its name, writes gzip (and brotli, when the ``brotli`` package is
+installed) variants for compressible types and records everything in
+``static/dist/manifest.json`` for core.static.assets.AssetManifest.
+
+    python build_assets.py
+"""
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import shutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = 'dist'
+HASH_LENGTH = 10
+
+# Text and font formats worth precompressing; images and video already are
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.ttf', '.otf', '.woff', '.txt'}
+
+CSS_URL = re.compile(r"url\(\s*(['\"]?)([^'\")]+)\1\s*\)")
+
+
+def iter_sources(static_dir):
+    """Yield logical names of source assets, skipping the build output and scratch copies"""
+    for root, dirs, files in os.walk(static_dir):
+        rel_root = os.path.relpath(root, static_dir)
+        dirs[:] = sorted(d for d in dirs if d != DIST_DIR and not d.endswith(' copy'))
+        for name in sorted(files):
+            yield os.path.normpath(os.path.join(rel_root, name)).replace(os.sep, '/')
+
+
+def fingerprint(logical, content):
+    digest = hashlib.sha256(content).hexdigest()
+    stem, ext = os.path.splitext(logical)
+    return f'{DIST_DIR}/{stem}.{digest[:HASH_LENGTH]}{ext}', digest
+
+
+def rewrite_css(logical, content, assets):
+    """Point url() references inside a stylesheet at fingerprinted files"""
+    css_dir = os.path.dirname(logical)
+
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith(('data:', 'http:', 'https:', '//')):
+            return match.group(0)
+        if url.startswith('/static/'):
+            target = url[len('/static/'):]
+            entry = assets.get(target)
+            return f"url({quote}/static/{entry['path']}{quote})" if entry else match.group(0)
+        target = os.path.normpath(os.path.join(css_dir, url)).replace(os.sep, '/')
+        entry = assets.get(target)
+        if not entry:
+            return match.group(0)
+        relative = os.path.relpath(entry['path'], os.path.join(DIST_DIR, css_dir)).replace(os.sep, '/')
+        return f'url({quote}{relative}{quote})'
+
+    return CSS_URL.sub(replace, content.decode('utf-8')).encode('utf-8')
+
+
+def write_asset(static_dir, path, content):
+    target = os.path.join(static_dir, path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'wb') as f:
+        f.write(content)
+
+
+def compress(static_dir, path, content):
+    """Write precompressed variants next to path; only keep ones that are smaller"""
+    encodings = {}
+    variants = [('gzip', '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.insert(0, ('br', '.br', lambda data: brotli.compress(data, quality=11)))
+    for encoding, suffix, compressor in variants:
+        compressed = compressor(content)
+        if len(compressed) < len(content):
+            write_asset(static_dir, path + suffix, compressed)
+            encodings[encoding] = path + suffix
+    return encodings
+
+
+def build(static_dir=STATIC_DIR):
+    dist = os.path.join(static_dir, DIST_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+
+    sources = list(iter_sources(static_dir))
+    # Stylesheets reference other assets, so fingerprint them last
+    sources.sort(key=lambda name: name.endswith('.css'))
+
+    assets = {}
+    for logical in sources:
+        with open(os.path.join(static_dir, logical), 'rb') as f:
+            content = f.read()
+        if logical.endswith('.css'):
+            content = rewrite_css(logical, content, assets)
+        path, digest = fingerprint(logical, content)
+        write_asset(static_dir, path, content)
+        entry = {
+            'path': path,
+            'etag': digest,
+            'size': len(content),
+            'mimetype': mimetypes.guess_type(logical)[0] or 'application/octet-stream'
+        }
+        if os.path.splitext(logical)[1].lower() in COMPRESSIBLE:
+            entry['encodings'] = compress(static_dir, path, content)
+        assets[logical] = entry
+
+    with open(os.path.join(dist, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump({'assets': assets}, f, indent=2, sort_keys=True)
+
+    if brotli is None:
+        logger.warning("brotli is not installed, only gzip variants were written")
+    logger.info(f"Built {len(assets)} assets into {dist}")
+    return assets
+
+
+if __name__ == '__main__':
+    build()
@@ -0,0 +1,89 @@
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from flask import current_app, make_response, request
+
+
+class CachedPage:
+    __slots__ = ('body', 'etag', 'last_modified', 'mtime', 'checked_at')
+
+    def __init__(self, body, mtime, deploy_id):
+        self.body = body
+        self.etag = hashlib.sha256(body + deploy_id.encode('utf-8')).hexdigest()
+        self.last_modified = datetime.fromtimestamp(int(mtime), tz=timezone.utc)
+        self.mtime = mtime
+        self.checked_at = time.monotonic()
+
+
+class PageCache:
+    """
+    In-process cache of rendered, context-free pages keyed by template and locale
+
+    Entries are re-rendered when the template file's mtime changes (checked
+    at most every ``check_interval`` seconds) or when the deploy id changes.
+    Responses carry a strong ETag and Last-Modified, and conditional
+    requests are answered with 304. With ``microcache_seconds`` set, an
+    ``X-Accel-Expires`` header lets nginx cache the page for that long.
+
+    >>> page_cache = PageCache(deploy_id=settings.DEPLOY_ID, microcache_seconds=5)
+    >>> page_cache.respond('index.html', 'ru', render_template)
+    <Response 28650 bytes [200 OK]>
+
+    """
+    def __init__(self, deploy_id='', check_interval=1.0, microcache_seconds=0):
+        self.deploy_id = deploy_id
+        self.check_interval = check_interval
+        self.microcache_seconds = microcache_seconds
+        self._lock = threading.Lock()
+        self._pages = {}
+        self.stats = {'hits': 0, 'misses': 0, 'not_modified': 0}
+
+    @staticmethod
+    def _template_mtime(template):
+        source = current_app.jinja_env.get_template(template).filename
+        return os.path.getmtime(source) if source else 0.0
+
+    def _get(self, template, locale, render):
+        key = (template, locale)
+        page = self._pages.get(key)
+        now = time.monotonic()
+        if page is not None:
+            if now - page.checked_at < self.check_interval:
+                return page, True
+            if self._template_mtime(template) == page.mtime:
+                page.checked_at = now
+                return page, True
+
+        mtime = self._template_mtime(template)
+        body = render(template).encode('utf-8')
+        page = CachedPage(body, mtime, self.deploy_id)
+        with self._lock:
+            self._pages[key] = page
+        return page, False
+
+    def respond(self, template, locale, render):
+        """Serve template from cache, rendering with render(template) on a miss"""
+        page, hit = self._get(template, locale, render)
+        response = make_response(page.body)
+        response.mimetype = 'text/html'
+        response.set_etag(page.etag)
+        response.last_modified = page.last_modified
+        response.cache_control.public = True
+        response.cache_control.max_age = 0
+        response.cache_control.must_revalidate = True
+        response.vary.add('Accept-Language')
+        if self.microcache_seconds:
+            response.headers['X-Accel-Expires'] = str(self.microcache_seconds)
+        response = response.make_conditional(request)
+
+        with self._lock:
+            self.stats['hits' if hit else 'misses'] += 1
+            if response.status_code == 304:
+                self.stats['not_modified'] += 1
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
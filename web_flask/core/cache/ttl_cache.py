@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded read-through cache with per-entry TTLs and negative caching
+
+    ``loader(key)`` runs on a miss; a ``None`` result is cached for
+    ``negative_ttl`` so lookups of unknown keys are cheap as well.
+    ``ttl`` may be a number or a callable returning the TTL for a value.
+
+    >>> cache = TTLCache(maxsize=10000, ttl=2, negative_ttl=1)
+    >>> cache.get_or_load(registration_id, load_status)
+    {'status': 'pending', ...}
+    >>> cache.stats()
+    {'hits': 0, 'misses': 1, 'negative_hits': 0, 'size': 1}
+
+    """
+    def __init__(self, maxsize, ttl, negative_ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self._counters = {'hits': 0, 'misses': 0, 'negative_hits': 0}
+
+    def _ttl_for(self, value):
+        if value is None:
+            return self.negative_ttl
+        return self.ttl(value) if callable(self.ttl) else self.ttl
+
+    def _lookup(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return _MISSING
+            expires_at, value = item
+            if expires_at <= now:
+                del self._items[key]
+                return _MISSING
+            self._items.move_to_end(key)
+            self._counters['negative_hits' if value is None else 'hits'] += 1
+            return value
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self._ttl_for(value)
+        with self._lock:
+            self._items[key] = (expires_at, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def get_or_load(self, key, loader):
+        value = self._lookup(key)
+        if value is not _MISSING:
+            return value
+        with self._lock:
+            self._counters['misses'] += 1
+        value = loader(key)
+        self.set(key, value)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, 'size': len(self._items)}
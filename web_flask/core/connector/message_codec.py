@@ -0,0 +1,109 @@
+# Identical copy in web_flask/ and notification_service/: the services are built
+# and deployed separately, each with its own core package. Change both;
+# tests/test_shared_copies.py fails while they differ.
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+JSON_CONTENT_TYPE = 'application/json'
+MSGPACK_CONTENT_TYPE = 'application/msgpack'
+
+
+class UnsupportedContentType(ValueError):
+    """Raised when a message body carries a content type no codec can decode"""
+
+
+class JsonCodec:
+    """Standard library JSON; also what pre-codec publishers sent without headers"""
+    name = 'json'
+    content_type = f'{JSON_CONTENT_TYPE}; charset=utf-8'
+
+    @staticmethod
+    def encode(message):
+        return json.dumps(message).encode('utf-8')
+
+    @staticmethod
+    def decode(body):
+        return json.loads(body)
+
+
+class OrjsonCodec(JsonCodec):
+    """Same wire format as JsonCodec, several times faster"""
+    name = 'orjson'
+
+    @staticmethod
+    def encode(message):
+        return orjson.dumps(message)
+
+    @staticmethod
+    def decode(body):
+        return orjson.loads(body)
+
+
+class MsgpackCodec:
+    """Compact binary encoding for publishers and consumers that both support it"""
+    name = 'msgpack'
+    content_type = MSGPACK_CONTENT_TYPE
+
+    @staticmethod
+    def encode(message):
+        return msgpack.packb(message, use_bin_type=True)
+
+    @staticmethod
+    def decode(body):
+        return msgpack.unpackb(body, raw=False)
+
+
+def available_codecs():
+    codecs = {'json': JsonCodec}
+    if orjson is not None:
+        codecs['orjson'] = OrjsonCodec
+    if msgpack is not None:
+        codecs['msgpack'] = MsgpackCodec
+    return codecs
+
+
+def get_codec(name=None):
+    """
+    Codec used to publish, falling back to JSON when its library is missing
+
+    With no name the fastest JSON implementation is picked, so consumers
+    that only understand JSON keep working.
+
+    >>> codec = get_codec(RABBITMQ_CONFIG.get('codec'))
+    >>> body = codec.encode({'email': 'john@example.com'})
+    >>> decode(body, codec.content_type)
+    {'email': 'john@example.com'}
+
+    """
+    codecs = available_codecs()
+    if name is None:
+        return codecs.get('orjson', JsonCodec)
+    codec = codecs.get(name)
+    if codec is None:
+        logger.warning(f"Message codec {name!r} is not available, publishing JSON instead")
+        return codecs.get('orjson', JsonCodec)
+    return codec
+
+
+def decode(body, content_type=None):
+    """Decode body by its content_type header; messages without one are legacy JSON"""
+    content_type = (content_type or JSON_CONTENT_TYPE).split(';', 1)[0].strip().lower()
+    if content_type in (JSON_CONTENT_TYPE, 'text/json'):
+        return (OrjsonCodec if orjson is not None else JsonCodec).decode(body)
+    if content_type in (MSGPACK_CONTENT_TYPE, 'application/x-msgpack'):
+        if msgpack is None:
+            raise UnsupportedContentType(f"msgpack is not installed, cannot decode {content_type}")
+        return MsgpackCodec.decode(body)
+    raise UnsupportedContentType(f"Unsupported message content type: {content_type}")
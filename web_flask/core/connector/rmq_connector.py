@@ -1,15 +1,126 @@
-import json
+import logging
+import os
+import queue
+import threading
+import time
 import uuid
-from pika import PlainCredentials, BlockingConnection, ConnectionParameters, BasicProperties
-from pika.exchange_type import ExchangeType
+import weakref
+from contextlib import contextmanager
+from core.connector.message_codec import get_codec
+from core.metrics.registry import metrics
+
+# pika is imported inside the methods that talk to the broker, so processes
+# that never publish (migrations, ASGI workers using aio-pika) skip loading it
+
+logger = logging.getLogger(__name__)
+
+# mode: sync (publish), batch (publish_batch, per message), async (buffered,
+# per message until its batch was committed, excluding the time spent in the
+# buffer) or aio (AsyncRabbitMQClient)
+publish_latency = metrics.histogram(
+    'rabbitmq_publish_duration_seconds',
+    'Time from publish call until the broker accepted the message',
+    ('mode',)
+)
+publish_failures = metrics.counter(
+    'rabbitmq_publish_failures_total',
+    'Failed publishes; for async, each failed flush of the buffer',
+    ('mode',)
+)
+publish_buffer_depth = metrics.gauge(
+    'rabbitmq_publish_buffer_depth',
+    'Messages accepted by publish_nowait and not yet committed to the broker'
+)
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled channel becomes available in time"""
+
+
+class BufferFull(Exception):
+    """Raised by publish_nowait when the in-memory publish buffer is full"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Publish buffer is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+_STOP = object()
+
+# Live clients, reset by one process-wide fork hook; a bound method per
+# instance would pin every client in the interpreter's fork-hook list forever
+_clients = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    for client in list(_clients):
+        client._after_fork()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _close_quietly(connection):
+    try:
+        if connection is not None and connection.is_open:
+            connection.close()
+    except Exception as e:
+        logger.debug(f"Error closing RabbitMQ connection: {str(e)}")
+
+
+class _PooledChannel:
+    """Connection/channel pair owned by exactly one thread at a time"""
+
+    def __init__(self, connection, channel):
+        self.connection = connection
+        self.channel = channel
+        self.tx_channel = None
+        self.last_used = time.monotonic()
+
+    @property
+    def is_open(self):
+        return self.connection.is_open and self.channel.is_open
+
+    def transactional_channel(self):
+        """Second channel on the same connection, kept in AMQP tx mode for batches"""
+        if self.tx_channel is None or not self.tx_channel.is_open:
+            self.tx_channel = self.connection.channel()
+            self.tx_channel.tx_select()
+        return self.tx_channel
+
+    def close(self):
+        _close_quietly(self.connection)
+
 
 class RabbitMQClient:
     """
     RabbitMQ client for sending messages to a queue
+
+    Publishing goes through a small pool of long-lived connection/channel
+    pairs, so a request only pays for the AMQP handshake when the pool has
+    to grow or a broker connection was dropped. pika connections are not
+    thread-safe, so each pair is checked out by one thread at a time.
+
     >>> import settings
     >>> rmq_client = RabbitMQClient(settings.RABBITMQ_CONFIG)
     >>> rmq_client.publish(message)
     True
+    >>> rmq_client.stats()
+    {'pool_size': 4, 'open': 1, 'idle': 1, 'in_use': 0, ...}
+
+    With ``publish_mode: 'async'`` in the config, publish_nowait() only puts
+    the message on a bounded in-memory buffer; a background thread drains it
+    in batches over a dedicated transactional channel, one tx_commit per batch.
+    A commit acknowledges the whole batch in one round trip; publisher
+    confirms on a BlockingChannel would wait for each message in turn.
+
+    >>> rmq_client.publish_nowait(message)  # raises BufferFull when saturated
+
+    Bodies are encoded with the ``codec`` from the config (json, orjson or
+    msgpack) and stamped with its content_type so consumers can decode them.
+
+    >>> with rmq_client.acquire() as channel:
+    ...     channel.basic_publish(exchange='', routing_key=config['queue_name'], body=json.dumps(message))
 
     >>> rmq_client.connect()
     >>> rmq_client.channel.queue_declare(queue=config['queue_name'], durable=True)
@@ -22,43 +133,400 @@ class RabbitMQClient:
         self.connection = None
         self.channel = None
 
+        self.pool_size = int(config.get('pool_size', 4))
+        self.pool_timeout = float(config.get('pool_timeout', 5))
+        self.async_mode = config.get('publish_mode', 'sync') == 'async'
+        self.buffer_size = int(config.get('buffer_size', 10000))
+        self.batch_size = int(config.get('batch_size', 100))
+        self.flush_interval = float(config.get('flush_interval', 0.05))
+        self.retry_after = int(config.get('retry_after', 1))
+        self.codec = get_codec(config.get('codec'))
+        self._reset_pool()
+        self._reset_publisher()
+        _clients.add(self)
+
+    def _after_fork(self):
+        self._reset_pool()
+        self._reset_publisher()
+
+    def _reset_pool(self):
+        """(Re)initialise pool state; called on start and in forked children.
+
+        Connections inherited from the parent share its sockets, so they are
+        dropped without closing - closing would tear down the parent's session.
+        """
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        self._idle = []
+        self._open = 0
+        self._queue_declared = False
+        self._counters = {
+            'checkouts': 0,
+            'connections_created': 0,
+            'reconnects': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'published': 0,
+            'publish_failures': 0,
+        }
+        self.connection = None
+        self.channel = None
+
+    def _connection_parameters(self):
+        from pika import ConnectionParameters, PlainCredentials
+        credentials = PlainCredentials(
+            self.config['username'],
+            self.config['password']
+        )
+        return ConnectionParameters(
+            host=self.config['host'],
+            port=self.config['port'],
+            credentials=credentials,
+            heartbeat=self.config.get('heartbeat', 60),
+            blocked_connection_timeout=self.config.get('blocked_connection_timeout', 30)
+        )
+
     def connect(self):
         """Establish connection to RabbitMQ"""
+        from pika import BlockingConnection
         if not self.connection or self.connection.is_closed:
-            credentials = PlainCredentials(
-                self.config['username'], 
-                self.config['password']
-            )
-            self.connection = BlockingConnection(
-                ConnectionParameters(
-                    host=self.config['host'],
-                    port=self.config['port'],
-                    credentials=credentials
-                )
-            )
+            self.connection = BlockingConnection(self._connection_parameters())
             self.channel = self.connection.channel()
             self.channel.queue_declare(
-                queue=self.config['queue_name'], 
+                queue=self.config['queue_name'],
                 durable=True
             )
+        return self.channel
+
+    def _open_pooled(self):
+        """Open a new connection/channel pair, declaring the queue once per process"""
+        from pika import BlockingConnection
+        connection = BlockingConnection(self._connection_parameters())
+        channel = connection.channel()
+        with self._lock:
+            declare = not self._queue_declared
+        if declare:
+            channel.queue_declare(queue=self.config['queue_name'], durable=True)
+        with self._lock:
+            self._queue_declared = True
+            self._open += 1
+            self._counters['connections_created'] += 1
+        return _PooledChannel(connection, channel)
+
+    def _discard(self, pooled):
+        pooled.close()
+        with self._lock:
+            self._open -= 1
+
+    def _checkout(self):
+        if self._pid != os.getpid():
+            self._reset_pool()
+
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            with self._lock:
+                self._counters['waits'] += 1
+            if not slots.acquire(timeout=self.pool_timeout):
+                with self._lock:
+                    self._counters['timeouts'] += 1
+                raise PoolTimeout(f"No RabbitMQ channel available after {self.pool_timeout}s")
 
-    def publish(self, message):
-        """Publish message to queue"""
         try:
-            self.connect()
-            self.channel.basic_publish(
-                exchange='',
-                routing_key=self.config['queue_name'],
-                body=json.dumps(message),
-                properties=BasicProperties(
-                    delivery_mode=2,  # make message persistent
-                    message_id=str(uuid.uuid4())
-                )
+            while True:
+                with self._lock:
+                    self._counters['checkouts'] += 1
+                    pooled = self._idle.pop() if self._idle else None
+                if pooled is None:
+                    return slots, self._open_pooled()
+                if pooled.is_open:
+                    return slots, pooled
+                # Broker dropped the connection while it was idle
+                self._discard(pooled)
+                with self._lock:
+                    self._counters['reconnects'] += 1
+        except Exception:
+            slots.release()
+            raise
+
+    def _checkin(self, slots, pooled, broken=False):
+        try:
+            if broken or not pooled.is_open:
+                self._discard(pooled)
+            else:
+                pooled.last_used = time.monotonic()
+                with self._lock:
+                    self._idle.append(pooled)
+        finally:
+            slots.release()
+
+    @contextmanager
+    def _acquire_pooled(self):
+        from pika.exceptions import AMQPError
+        slots, pooled = self._checkout()
+        broken = False
+        try:
+            yield pooled
+        except AMQPError:
+            broken = True
+            raise
+        finally:
+            self._checkin(slots, pooled, broken)
+
+    @contextmanager
+    def acquire(self):
+        """Check out a pooled channel for the duration of the block"""
+        with self._acquire_pooled() as pooled:
+            yield pooled.channel
+
+    def _basic_publish(self, channel, message):
+        from pika import BasicProperties
+        channel.basic_publish(
+            exchange='',
+            routing_key=self.config['queue_name'],
+            body=self.codec.encode(message),
+            properties=BasicProperties(
+                content_type=self.codec.content_type,
+                delivery_mode=2,  # make message persistent
+                message_id=str(uuid.uuid4())
             )
-            return True
-        except Exception as e:
-            print(f"Error publishing message: {str(e)}")
+        )
+
+    def publish(self, message):
+        """Publish message to queue, reconnecting once if the broker dropped us"""
+        from pika.exceptions import AMQPError
+        started = time.perf_counter()
+        for attempt in range(2):
+            try:
+                with self.acquire() as channel:
+                    self._basic_publish(channel, message)
+                with self._lock:
+                    self._counters['published'] += 1
+                publish_latency.labels('sync').observe(time.perf_counter() - started)
+                return True
+            except AMQPError as e:
+                if attempt == 0:
+                    logger.warning(f"RabbitMQ connection lost, reconnecting: {str(e)}")
+                    with self._lock:
+                        self._counters['reconnects'] += 1
+                    continue
+                logger.error(f"Error publishing message: {str(e)}")
+            except Exception as e:
+                logger.error(f"Error publishing message: {str(e)}")
+            break
+        with self._lock:
+            self._counters['publish_failures'] += 1
+        publish_failures.labels('sync').inc()
+        return False
+
+    def publish_batch(self, messages):
+        """Publish messages in one AMQP transaction on a single pooled connection.
+
+        The tx_commit round trip is the only wait for the whole batch; it
+        raises on failure, in which case none of the messages were enqueued.
+        """
+        from pika.exceptions import AMQPError
+        messages = list(messages)
+        if not messages:
+            return 0
+        started = time.perf_counter()
+        with self._acquire_pooled() as pooled:
+            channel = pooled.transactional_channel()
+            try:
+                for message in messages:
+                    self._basic_publish(channel, message)
+                channel.tx_commit()
+            except Exception:
+                with self._lock:
+                    self._counters['publish_failures'] += 1
+                publish_failures.labels('batch').inc()
+                if channel.is_open:
+                    try:
+                        channel.tx_rollback()
+                    except AMQPError:
+                        pass
+                raise
+        with self._lock:
+            self._counters['published'] += len(messages)
+        publish_latency.labels('batch').observe((time.perf_counter() - started) / len(messages))
+        return len(messages)
+
+    def _reset_publisher(self):
+        """(Re)initialise the async publish buffer; the thread does not survive fork"""
+        self._buffer = queue.Queue(maxsize=self.buffer_size)
+        self._publisher_lock = threading.Lock()
+        self._publisher_thread = None
+        self._async_connection = None
+        self._async_channel = None
+        self._async_stats = {
+            'async_accepted': 0,
+            'async_rejected': 0,
+            'async_committed': 0,
+            'async_retries': 0,
+            'batches_flushed': 0,
+            'commit_latency_last': 0.0,
+            'commit_latency_avg': 0.0,
+            'commit_latency_max': 0.0,
+        }
+
+    def _ensure_publisher(self):
+        thread = self._publisher_thread
+        if thread is not None and thread.is_alive():
+            return
+        with self._publisher_lock:
+            if self._publisher_thread is None or not self._publisher_thread.is_alive():
+                self._publisher_thread = threading.Thread(
+                    target=self._publisher_loop,
+                    name='rmq-async-publisher',
+                    daemon=True
+                )
+                self._publisher_thread.start()
+
+    def publish_nowait(self, message):
+        """Buffer message for the background publisher and return immediately"""
+        if self._pid != os.getpid():
+            self._after_fork()
+        self._ensure_publisher()
+        try:
+            self._buffer.put_nowait(message)
+        except queue.Full:
+            with self._publisher_lock:
+                self._async_stats['async_rejected'] += 1
+            raise BufferFull(self.retry_after)
+        with self._publisher_lock:
+            self._async_stats['async_accepted'] += 1
+        publish_buffer_depth.inc()
+        return True
+
+    def _next_batch(self, pending):
+        """Block for the first message, then gather more until batch_size or flush_interval.
+
+        Returns False once the stop sentinel has been seen.
+        """
+        item = self._buffer.get()
+        if item is _STOP:
             return False
-        finally:
-            if self.connection and not self.connection.is_closed:
-                self.connection.close()
\ No newline at end of file
+        pending.append(item)
+        deadline = time.monotonic() + self.flush_interval
+        while len(pending) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._buffer.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return False
+            pending.append(item)
+        return True
+
+    def _async_channel_open(self):
+        from pika import BlockingConnection
+        if self._async_channel is None or not self._async_channel.is_open \
+                or not self._async_connection.is_open:
+            _close_quietly(self._async_connection)
+            self._async_connection = BlockingConnection(self._connection_parameters())
+            self._async_channel = self._async_connection.channel()
+            self._async_channel.queue_declare(queue=self.config['queue_name'], durable=True)
+            self._async_channel.tx_select()
+        return self._async_channel
+
+    def _flush(self, pending):
+        """Publish pending messages in one AMQP transaction, dropping them once committed.
+
+        As in publish_batch, tx_commit is the only wait for the broker; on
+        failure the transaction is rolled back and the whole batch stays
+        pending for the retry.
+        """
+        from pika.exceptions import AMQPError
+        channel = self._async_channel_open()
+        sent = []
+        try:
+            for message in pending:
+                self._basic_publish(channel, message)
+                sent.append(time.perf_counter())
+            channel.tx_commit()
+        except Exception:
+            if channel.is_open:
+                try:
+                    channel.tx_rollback()
+                except AMQPError:
+                    pass
+            raise
+        committed = time.perf_counter()
+        latency = publish_latency.labels('async')
+        for at in sent:
+            latency.observe(committed - at)
+        publish_buffer_depth.dec(len(pending))
+        batch_latency = committed - sent[0]
+        with self._publisher_lock:
+            stats = self._async_stats
+            stats['async_committed'] += len(pending)
+            stats['batches_flushed'] += 1
+            stats['commit_latency_last'] = batch_latency
+            stats['commit_latency_max'] = max(stats['commit_latency_max'], batch_latency)
+            stats['commit_latency_avg'] = batch_latency if stats['batches_flushed'] == 1 \
+                else 0.9 * stats['commit_latency_avg'] + 0.1 * batch_latency
+        pending.clear()
+
+    def _publisher_loop(self):
+        """Drain the buffer until close() posts the stop sentinel"""
+        pending = []
+        running = True
+        delay = 0.5
+        while running or pending:
+            if not pending:
+                running = self._next_batch(pending)
+                if not pending:
+                    continue
+            try:
+                self._flush(pending)
+                delay = 0.5
+            except Exception as e:
+                logger.warning(f"Async publish failed, {len(pending)} message(s) kept for retry: {str(e)}")
+                with self._publisher_lock:
+                    self._async_stats['async_retries'] += 1
+                publish_failures.labels('async').inc()
+                self._async_channel = None
+                if not running:
+                    logger.error(f"Dropping {len(pending)} buffered message(s) on shutdown")
+                    publish_buffer_depth.dec(len(pending))
+                    break
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+        _close_quietly(self._async_connection)
+
+    def stats(self):
+        """Pool size, usage and async buffer counters for the current process"""
+        with self._lock:
+            idle = len(self._idle)
+            stats = {
+                'pool_size': self.pool_size,
+                'open': self._open,
+                'idle': idle,
+                'in_use': self._open - idle,
+                **self._counters,
+            }
+        with self._publisher_lock:
+            stats.update(self._async_stats)
+        stats['buffer_depth'] = self._buffer.qsize()
+        stats['buffer_capacity'] = self.buffer_size
+        return stats
+
+    def close(self, timeout=5):
+        """Flush the async buffer, then close pooled and legacy connections"""
+        thread = self._publisher_thread
+        if thread is not None and thread.is_alive():
+            try:
+                self._buffer.put(_STOP, timeout=timeout)
+            except queue.Full:
+                logger.error("Publish buffer still full on close, pending messages are lost")
+            thread.join(timeout)
+
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._discard(pooled)
+        if self.connection and not self.connection.is_closed:
+            self.connection.close()
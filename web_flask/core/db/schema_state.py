@@ -0,0 +1,153 @@
+import logging
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, insert, select, text
+from sqlalchemy.exc import DBAPIError
+from core.db.models import Base, Statuses
+
+logger = logging.getLogger(__name__)
+
+# Serialises concurrent migrators (several containers starting at once) on Postgres
+MIGRATION_LOCK_ID = 0x0b0_5ace
+
+schema_metadata = MetaData()
+schema_state = Table(
+    'schema_state', schema_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(255), nullable=False),
+    Column('applied_at', DateTime, nullable=False, default=datetime.utcnow),
+)
+
+
+class SchemaOutdated(RuntimeError):
+    """Raised at startup when the database is behind and auto-migration is off"""
+
+
+def _create_tables(connection):
+    Base.metadata.create_all(connection)
+
+
+def _seed_statuses(connection):
+    existing = set(connection.scalars(select(Statuses.name)))
+    defaults = [
+        {'name': 'pending', 'description': 'Notification is pending'},
+        {'name': 'failed', 'description': 'Notification failed to send'},
+        {'name': 'success', 'description': 'Notification was sent successfully'},
+    ]
+    missing = [status for status in defaults if status['name'] not in existing]
+    if missing:
+        connection.execute(insert(Statuses), missing)
+
+
+def _add_registration_id(connection):
+    # Databases created before the column existed; create_all skips those
+    columns = {column['name'] for column in inspect(connection).get_columns('notifications')}
+    if 'registration_id' not in columns:
+        connection.execute(text('ALTER TABLE notifications ADD COLUMN registration_id VARCHAR(36)'))
+    connection.execute(text(
+        'CREATE UNIQUE INDEX IF NOT EXISTS ix_notifications_registration_id '
+        'ON notifications (registration_id)'
+    ))
+
+
+def _unique_copy_per_user(connection):
+    # The consumer upserts copies with ON CONFLICT (id_user), which needs a
+    # unique index; fold duplicate copies into each user's oldest one first
+    keep = 'SELECT MIN(id) FROM copyshared GROUP BY id_user'
+    connection.execute(text(
+        'UPDATE notifications SET id_copy_shared = ('
+        ' SELECT MIN(kept.id) FROM copyshared kept JOIN copyshared dup ON dup.id_user = kept.id_user'
+        ' WHERE dup.id = notifications.id_copy_shared'
+        f') WHERE id_copy_shared NOT IN ({keep})'
+    ))
+    connection.execute(text(f'DELETE FROM copyshared WHERE id NOT IN ({keep})'))
+    connection.execute(text(
+        'CREATE UNIQUE INDEX IF NOT EXISTS ix_copyshared_id_user ON copyshared (id_user)'
+    ))
+
+
+# The notification scheduler LISTENs on this channel to pick up new rows at once
+PENDING_CHANNEL = 'notifications_pending'
+
+
+def _notify_on_new_notifications(connection):
+    # Statement-level with a constant payload: a multi-row insert sends one
+    # NOTIFY, and Postgres folds identical ones within a transaction
+    if connection.dialect.name != 'postgresql':
+        return
+    connection.execute(text(
+        'CREATE OR REPLACE FUNCTION notify_notifications_pending() RETURNS trigger '
+        f"LANGUAGE plpgsql AS $$ BEGIN PERFORM pg_notify('{PENDING_CHANNEL}', ''); RETURN NULL; END $$"
+    ))
+    connection.execute(text('DROP TRIGGER IF EXISTS notifications_pending_notify ON notifications'))
+    connection.execute(text(
+        'CREATE TRIGGER notifications_pending_notify AFTER INSERT ON notifications '
+        'FOR EACH STATEMENT EXECUTE FUNCTION notify_notifications_pending()'
+    ))
+
+
+# Append only: (version, description, steps). Every step must be safe to run
+# against a database that was bootstrapped by create_all before versioning.
+MIGRATIONS = [
+    (1, 'Create tables and default statuses', [_create_tables, _seed_statuses]),
+    (2, 'Add notifications.registration_id', [_add_registration_id]),
+    (3, 'Make copyshared.id_user unique', [_unique_copy_per_user]),
+    (4, 'NOTIFY the scheduler on new notifications', [_notify_on_new_notifications]),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(engine):
+    """Version recorded in schema_state, or 0 for an unversioned database; one query"""
+    try:
+        with engine.connect() as connection:
+            return connection.execute(select(func.max(schema_state.c.version))).scalar() or 0
+    except DBAPIError:
+        # schema_state does not exist yet
+        return 0
+
+
+def migrate(engine):
+    """
+    Apply pending migrations in order, each in its own transaction
+
+    Returns the list of versions applied. Safe to run from several
+    processes at once: on Postgres they queue on an advisory lock and
+    re-read the version before doing anything.
+
+    >>> migrate(engines.get_engine(DATABASE_URL))
+    [1, 2]
+    >>> migrate(engines.get_engine(DATABASE_URL))
+    []
+
+    """
+    schema_metadata.create_all(engine)
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        with engine.begin() as connection:
+            if connection.dialect.name == 'postgresql':
+                connection.execute(text('SELECT pg_advisory_xact_lock(:id)'), {'id': MIGRATION_LOCK_ID})
+            done = connection.execute(
+                select(schema_state.c.version).where(schema_state.c.version == version)
+            ).first()
+            if done:
+                continue
+            logger.info(f"Applying schema migration {version}: {description}")
+            for step in steps:
+                step(connection)
+            connection.execute(insert(schema_state), {'version': version, 'description': description})
+            applied.append(version)
+    return applied
+
+
+def ensure_schema(engine, auto_migrate=True):
+    """Startup check: one query when the schema is current, migrations only when it is behind"""
+    version = current_version(engine)
+    if version >= SCHEMA_VERSION:
+        return version
+    if not auto_migrate:
+        raise SchemaOutdated(
+            f"Database schema is at version {version}, expected {SCHEMA_VERSION}; run `python migration.py`"
+        )
+    logger.warning(f"Database schema is at version {version}, migrating to {SCHEMA_VERSION}")
+    migrate(engine)
+    return SCHEMA_VERSION
@@ -0,0 +1,104 @@
+import threading
+import time
+from flask import g, has_request_context, request
+from flask.ctx import _AppCtxGlobals
+from core.metrics.registry import metrics
+
+checkout_latency = metrics.histogram(
+    'db_session_checkout_seconds',
+    'Time to open a request session and check out its pooled connection',
+    ('route',)
+)
+
+
+class LazySessionGlobals(_AppCtxGlobals):
+    """Flask ``g`` whose ``db`` attribute opens a session on first access"""
+
+    def __getattr__(self, name):
+        if name == 'db':
+            from flask import current_app
+            sessions = current_app.extensions.get('request_sessions')
+            if sessions is not None:
+                session = sessions.open()
+                self.__dict__['db'] = session
+                return session
+        return super().__getattr__(name)
+
+
+class RequestSessions:
+    """
+    Per-request SQLAlchemy sessions that are only checked out when used
+
+    Requests that never touch ``g.db`` skip session creation, commit and
+    close entirely. Per-route counters show how many requests actually
+    needed a session.
+
+    >>> request_sessions = RequestSessions(Session)
+    >>> request_sessions.init_app(app)
+    >>> g.db.query(UserData).first()  # inside a request, opens the session
+    >>> request_sessions.stats()
+    {'/': {'requests': 10, 'sessions': 0}, ...}
+
+    """
+    def __init__(self, session_factory, app=None):
+        self.session_factory = session_factory
+        self._lock = threading.Lock()
+        self._counters = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['request_sessions'] = self
+        app.app_ctx_globals_class = LazySessionGlobals
+        app.before_request(self._count_request)
+        app.after_request(self._commit)
+        # App-context teardown also closes sessions opened outside a request
+        # (CLI commands, `with app.app_context()`); those commit themselves
+        app.teardown_appcontext(self._close)
+
+    @staticmethod
+    def _route():
+        if not has_request_context():
+            return '<no request>'
+        rule = request.url_rule
+        return rule.rule if rule is not None else '<unmatched>'
+
+    def _bump(self, key):
+        route = self._route()
+        with self._lock:
+            counters = self._counters.get(route)
+            if counters is None:
+                counters = self._counters[route] = {'requests': 0, 'sessions': 0}
+            counters[key] += 1
+
+    def _count_request(self):
+        self._bump('requests')
+
+    def open(self):
+        """Create the session for the current request and check out its connection"""
+        self._bump('sessions')
+        started = time.perf_counter()
+        session = self.session_factory()
+        # The first query would check one out right away anyway; doing it
+        # here lets the pool wait be measured apart from query time
+        session.connection()
+        checkout_latency.labels(self._route()).observe(time.perf_counter() - started)
+        return session
+
+    def _commit(self, response):
+        # `'db' in g` does not trigger the lazy accessor, unlike hasattr
+        if 'db' in g:
+            g.db.commit()
+        return response
+
+    def _close(self, exc):
+        session = g.pop('db', None)
+        if session is not None:
+            if exc:
+                session.rollback()
+            session.close()
+
+    def stats(self):
+        """Per-route request and session checkout counts for this process"""
+        with self._lock:
+            return {route: dict(counters) for route, counters in self._counters.items()}
@@ -1,52 +1,31 @@
+from typing import TYPE_CHECKING
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, scoped_session, Session
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy import select
-from core.db.models import UserData, Base, Statuses
+from core.db.models import UserData, Base, Statuses, Notifications
 from settings import DATABASE_URL, ASYNC_DATABASE_URL
-from core.connector.postgresql_connector import PostgreSQLConnector, db_operation
+from core.connector.postgresql_connector import PostgreSQLConnector, db_operation, engines
+from core.db.schema_state import ensure_schema
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
 
 
 def create_database(engine_url):
-    """Create the database and tables based on the models."""
-    engine = create_engine(engine_url)
-    # Create all tables
-    Base.metadata.create_all(engine)
-    
-    # Create session factory
+    """Return a session factory on the registry engine; the schema is handled by init_db/migrate."""
+    # Registry engine: its pool is dropped in forked workers instead of shared
+    engine = engines.get_engine(engine_url)
     session_factory = sessionmaker(bind=engine)
-    Session = scoped_session(session_factory)
-    
-    return Session
+    return scoped_session(session_factory)
 
-def init_db(database_url):
-    """Initialize database and return session"""
-    Session = create_database(database_url)
-    
-    # Create default statuses if they don't exist
-    session = Session()
-    try:
-        default_statuses = [
-            {'name': 'pending', 'description': 'Notification is pending'},
-            # {'name': 'sent', 'description': 'Notification was sent successfully'},
-            {'name': 'failed', 'description': 'Notification failed to send'},
-            {'name': 'success', 'description': 'Notification was sent successfully'}
-        ]
-        
-        for status in default_statuses:
-            existing = session.query(Statuses).filter_by(name=status['name']).first()
-            if not existing:
-                session.add(Statuses(**status))
-        
-        session.commit()
-    except Exception as e:
-        session.rollback()
-        raise e
-    finally:
-        session.close()
-        
-    return Session
+def init_db(database_url, auto_migrate=True):
+    """Check the schema version with one query and return the session factory.
+
+    DDL only runs when the stored version is behind SCHEMA_VERSION, and with
+    auto_migrate=False that is an error instead (use ``python migration.py``).
+    """
+    ensure_schema(engines.get_engine(database_url), auto_migrate=auto_migrate)
+    return create_database(database_url)
 
 def get_session(engine_url):
     """Get a new session for the database."""
@@ -55,6 +34,22 @@ def get_session(engine_url):
     return Session()
 
 
+def get_registration_status(session: Session, registration_id: str):
+    """Current notification state for a registration, or None if not consumed yet"""
+    row = session.execute(
+        select(Statuses.name, Notifications.attempts, Notifications.max_attempts, Notifications.dt_sent)
+        .join(Statuses, Statuses.id == Notifications.id_status_sending)
+        .where(Notifications.registration_id == registration_id)
+    ).first()
+    if row is None:
+        return None
+    return {
+        'status': row.name,
+        'attempts': row.attempts,
+        'max_attempts': row.max_attempts,
+        'sent_at': row.dt_sent.isoformat() if row.name == 'success' else None,
+    }
+
 # Synchronous usage
 @db_operation(is_async=False)
 def create_user(user_data: dict, session: Session):
@@ -64,7 +59,7 @@ def create_user(user_data: dict, session: Session):
 
 # Asynchronous usage
 @db_operation(is_async=True)
-async def get_users_by_status(status: str, session: AsyncSession):
+async def get_users_by_status(status: str, session: 'AsyncSession'):
     result = await session.execute(
         select(UserData).filter(UserData.status == status)
     )
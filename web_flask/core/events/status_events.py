@@ -0,0 +1,118 @@
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
+# Channel the notification service NOTIFYs on when a status is recorded
+STATUS_CHANNEL = 'registration_status'
+
+
+class StatusEventHub:
+    """
+    Fan-out of registration status changes from one LISTEN connection per worker
+
+    A single daemon thread holds a dedicated psycopg2 connection that
+    LISTENs on ``registration_status`` and hands every notification to the
+    queues subscribed for that registration id, so open SSE streams cost
+    no database queries of their own.
+
+    >>> hub = StatusEventHub(settings.DATABASE_URL)
+    >>> events = hub.subscribe(registration_id)
+    >>> events.get(timeout=15)
+    {'registration_id': '...', 'status': 'success'}
+    >>> hub.unsubscribe(registration_id, events)
+
+    """
+    def __init__(self, database_url, reconnect_delay=2):
+        self.database_url = database_url
+        self.reconnect_delay = reconnect_delay
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._thread = None
+        self._stats = {'notifications': 0, 'delivered': 0, 'reconnects': 0}
+
+    def subscribe(self, registration_id):
+        if self._pid != os.getpid():
+            self._reset()
+        events = queue.Queue()
+        with self._lock:
+            self._subscribers.setdefault(registration_id, set()).add(events)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='status-listener', daemon=True)
+                self._thread.start()
+        return events
+
+    def unsubscribe(self, registration_id, events):
+        with self._lock:
+            subscribers = self._subscribers.get(registration_id)
+            if subscribers is not None:
+                subscribers.discard(events)
+                if not subscribers:
+                    del self._subscribers[registration_id]
+
+    def publish(self, event):
+        """Deliver an event to every stream waiting on its registration id"""
+        with self._lock:
+            self._stats['notifications'] += 1
+            subscribers = list(self._subscribers.get(event.get('registration_id'), ()))
+            self._stats['delivered'] += len(subscribers)
+        for events in subscribers:
+            events.put(event)
+
+    def _connect(self):
+        import psycopg2
+
+        url = make_url(self.database_url)
+        connection = psycopg2.connect(**url.translate_connect_args(username='user', database='dbname'))
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {STATUS_CHANNEL}')
+        return connection
+
+    def _run(self):
+        while True:
+            connection = None
+            try:
+                connection = self._connect()
+                while True:
+                    # Wake up periodically so a dead socket is noticed on poll()
+                    if select.select([connection], [], [], 30) == ([], [], []):
+                        with connection.cursor() as cursor:
+                            cursor.execute('SELECT 1')
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        try:
+                            self.publish(json.loads(notify.payload))
+                        except ValueError:
+                            logger.error(f"Invalid status notification: {notify.payload}")
+            except Exception as e:
+                logger.warning(f"Status listener disconnected, reconnecting: {str(e)}")
+                with self._lock:
+                    self._stats['reconnects'] += 1
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+            time.sleep(self.reconnect_delay)
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                'streams': sum(len(subscribers) for subscribers in self._subscribers.values()),
+            }
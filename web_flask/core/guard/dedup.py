@@ -0,0 +1,315 @@
+import hashlib
+import math
+import struct
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from core.metrics.registry import metrics
+from core.shared.shm import SharedMemoryFile
+
+_MISSING = object()
+
+dedup_lookups = metrics.counter(
+    'registration_dedup_lookups_total',
+    'Dedup lookups by outcome: lru_hits and bloom_hits are repeats, misses are new addresses',
+    ('result',)
+)
+dedup_false_positive_rate = metrics.gauge(
+    'registration_dedup_false_positive_rate',
+    'Estimated false-positive rate of the shared Bloom filter'
+)
+
+
+def normalize_email(email):
+    """Lower-case, trimmed address; +tags stay, the database stores them as distinct users"""
+    return email.strip().lower()
+
+
+class TimedLRU:
+    """Per-process LRU of keys (with an optional value) remembered for ``window`` seconds"""
+
+    def __init__(self, maxsize, window):
+        self.maxsize = maxsize
+        self.window = window
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return default
+            seen, value = item
+            if time.monotonic() - seen > self.window:
+                del self._items[key]
+                return default
+            return value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def add(self, key, value=None):
+        with self._lock:
+            self._items[key] = (time.monotonic(), value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class ScalableBloomFilter:
+    """
+    Time-windowed scalable Bloom filter living in shared memory
+
+    Two generations are kept; the active one is cleared and swapped in
+    once it is older than ``window``, so a key is remembered for between
+    one and two windows. Each generation is a series of slices whose
+    capacity doubles and whose error rate halves, keeping the compound
+    false-positive rate under ``error_rate`` until every slice is full.
+
+    Region layout: the active generation and its start time, per-slice
+    counts for both generations, then the bit arrays of generations 0 and 1.
+
+    >>> bloom = ScalableBloomFilter('obo-dedup', window=300)
+    >>> bloom.add('john@example.com')
+    >>> 'john@example.com' in bloom
+    True
+
+    """
+    _HEADER = struct.Struct('<Qd')  # active generation, its start time
+
+    def __init__(self, name, window, initial_capacity=65536, error_rate=1e-6, max_slices=4, directory=None):
+        self.window = window
+        self.slices = []
+        offset = 0
+        for i in range(max_slices):
+            capacity = initial_capacity * 2 ** i
+            # Halving per slice: sum of p0 * 0.5**i stays below error_rate
+            p = error_rate * 0.5 * 0.5 ** i
+            bits = int(math.ceil(-capacity * math.log(p) / math.log(2) ** 2))
+            bits = (bits + 7) // 8 * 8
+            hashes = int(math.ceil(-math.log2(p)))
+            self.slices.append((offset, bits, hashes, capacity))
+            offset += bits // 8
+        self.generation_bytes = offset
+        self.counts_offset = self._HEADER.size
+        self.bits_offset = self.counts_offset + 8 * max_slices * 2
+        size = self.bits_offset + 2 * self.generation_bytes
+        self.region = SharedMemoryFile(name, size, directory)
+
+    @staticmethod
+    def _hashes(key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        return h1, h2 | 1
+
+    def _count_at(self, generation, index):
+        return self.counts_offset + 8 * (generation * len(self.slices) + index)
+
+    def _read_header(self, buf):
+        return self._HEADER.unpack_from(buf, 0)
+
+    def _rotate(self, buf, now):
+        """Swap generations and clear the new active one; caller holds the lock"""
+        active, started = self._read_header(buf)
+        if started and now - started < self.window:
+            return active
+        active = (active + 1) % 2 if started else active
+        base = self.bits_offset + active * self.generation_bytes
+        buf[base:base + self.generation_bytes] = bytes(self.generation_bytes)
+        for index in range(len(self.slices)):
+            struct.pack_into('<Q', buf, self._count_at(active, index), 0)
+        self._HEADER.pack_into(buf, 0, active, now)
+        return active
+
+    def _slice_contains(self, buf, generation, index, h1, h2):
+        offset, bits, hashes, _ = self.slices[index]
+        base = self.bits_offset + generation * self.generation_bytes + offset
+        for j in range(hashes):
+            bit = (h1 + j * h2) % bits
+            if not buf[base + (bit >> 3)] & (1 << (bit & 7)):
+                return False
+        return True
+
+    def __contains__(self, key):
+        # Bits are only ever set between rotations, so reads need no lock
+        buf = self.region.buf
+        active, started = self._read_header(buf)
+        age = time.time() - started
+        # The active generation holds keys for up to two windows, the
+        # previous one only until the active generation is a window old
+        generations = [g for g, valid in ((active, age < 2 * self.window), (1 - active, age < self.window)) if valid]
+        h1, h2 = self._hashes(key)
+        for generation in generations:
+            for index in range(len(self.slices)):
+                count = struct.unpack_from('<Q', buf, self._count_at(generation, index))[0]
+                if count == 0:
+                    break
+                if self._slice_contains(buf, generation, index, h1, h2):
+                    return True
+        return False
+
+    def add(self, key):
+        h1, h2 = self._hashes(key)
+        with self.region.locked() as buf:
+            generation = self._rotate(buf, time.time())
+            for index, (offset, bits, hashes, capacity) in enumerate(self.slices):
+                count_at = self._count_at(generation, index)
+                count = struct.unpack_from('<Q', buf, count_at)[0]
+                if count < capacity or index == len(self.slices) - 1:
+                    break
+            base = self.bits_offset + generation * self.generation_bytes + offset
+            for j in range(hashes):
+                bit = (h1 + j * h2) % bits
+                buf[base + (bit >> 3)] |= 1 << (bit & 7)
+            struct.pack_into('<Q', buf, count_at, count + 1)
+
+    def error_rate_estimate(self):
+        """Current false-positive probability estimated from slice fill levels"""
+        buf = self.region.buf
+        miss = 1.0
+        for generation in (0, 1):
+            for index, (_, bits, hashes, _) in enumerate(self.slices):
+                count = struct.unpack_from('<Q', buf, self._count_at(generation, index))[0]
+                if count:
+                    miss *= 1 - (1 - math.exp(-hashes * count / bits)) ** hashes
+        return 1 - miss
+
+    def fill(self):
+        buf = self.region.buf
+        active, _ = self._read_header(buf)
+        return [
+            struct.unpack_from('<Q', buf, self._count_at(active, index))[0]
+            for index in range(len(self.slices))
+        ]
+
+
+class SharedIdTable:
+    """
+    Direct-mapped ``key -> registration id`` table in shared memory
+
+    Each slot holds a key hash, the 16-byte id and when it was stored. A
+    newer key hashing to the same slot replaces the old one, so a lookup
+    may miss but never returns another key's id.
+
+    >>> ids = SharedIdTable('obo-dedup-ids', capacity=65536, window=300)
+    >>> ids.put('john@example.com', registration_id)
+    >>> ids.get('john@example.com') == registration_id
+    True
+
+    """
+    _SLOT = struct.Struct('<Q16sd')
+
+    def __init__(self, name, capacity, window, directory=None):
+        self.capacity = capacity
+        self.window = window
+        self.region = SharedMemoryFile(name, capacity * self._SLOT.size, directory)
+
+    @staticmethod
+    def _hash(key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8, person=b'dedup-ids').digest()
+        # 0 marks an empty slot
+        return int.from_bytes(digest, 'little') or 1
+
+    def put(self, key, registration_id):
+        h = self._hash(key)
+        with self.region.locked() as buf:
+            self._SLOT.pack_into(buf, (h % self.capacity) * self._SLOT.size,
+                                 h, uuid.UUID(registration_id).bytes, time.time())
+
+    def get(self, key):
+        h = self._hash(key)
+        with self.region.locked() as buf:
+            key_hash, id_bytes, stored_at = self._SLOT.unpack_from(buf, (h % self.capacity) * self._SLOT.size)
+        # Kept as long as the Bloom filter may still remember the key
+        if key_hash != h or time.time() - stored_at > 2 * self.window:
+            return None
+        return str(uuid.UUID(bytes=id_bytes))
+
+
+class RegistrationDeduplicator:
+    """
+    Pre-publish filter for repeated registrations of the same email
+
+    A per-worker time-windowed LRU answers repeats from the same worker;
+    the shared Bloom filter catches repeats that landed on other gunicorn
+    workers. Addresses are only remembered after they were accepted, so a
+    failed publish can be retried. The registration id accepted for an
+    address is kept too (in the LRU, and in a shared table for other
+    workers), so a repeat can be answered with the original id.
+
+    >>> dedup = RegistrationDeduplicator({'window': 300})
+    >>> dedup.lookup('John@Example.com')
+    (False, None)
+    >>> dedup.remember('John@Example.com', registration_id)
+    >>> dedup.lookup(' john@example.com')
+    (True, registration_id)
+
+    """
+    def __init__(self, config=None):
+        config = config or {}
+        window = float(config.get('window', 300))
+        self.lru = TimedLRU(int(config.get('lru_size', 10000)), window)
+        self.bloom = ScalableBloomFilter(
+            config.get('name', 'obo-registration-dedup'),
+            window,
+            initial_capacity=int(config.get('initial_capacity', 65536)),
+            error_rate=float(config.get('error_rate', 1e-6)),
+            max_slices=int(config.get('max_slices', 4)),
+            directory=config.get('directory')
+        )
+        self.ids = SharedIdTable(
+            f"{config.get('name', 'obo-registration-dedup')}-ids",
+            int(config.get('id_slots', 65536)),
+            window,
+            directory=config.get('directory')
+        )
+        self._lock = threading.Lock()
+        self._counters = {'lru_hits': 0, 'bloom_hits': 0, 'misses': 0}
+        self._lookups = {key: dedup_lookups.labels(key) for key in self._counters}
+
+    def _count(self, key):
+        with self._lock:
+            self._counters[key] += 1
+        self._lookups[key].inc()
+
+    def lookup(self, email):
+        """(seen, registration id accepted for it if still known)"""
+        key = normalize_email(email)
+        registration_id = self.lru.get(key, _MISSING)
+        if registration_id is not _MISSING:
+            self._count('lru_hits')
+            return True, registration_id
+        if key in self.bloom:
+            self._count('bloom_hits')
+            registration_id = self.ids.get(key)
+            # Keep later repeats on this worker off the shared filter
+            self.lru.add(key, registration_id)
+            return True, registration_id
+        self._count('misses')
+        return False, None
+
+    def seen(self, email):
+        return self.lookup(email)[0]
+
+    def remember(self, email, registration_id=None):
+        key = normalize_email(email)
+        self.lru.add(key, registration_id)
+        self.bloom.add(key)
+        if registration_id is not None:
+            self.ids.put(key, registration_id)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats['lru_size'] = len(self.lru)
+        stats['bloom_fill'] = self.bloom.fill()
+        stats['false_positive_rate'] = self.bloom.error_rate_estimate()
+        return stats
+
+    def export_metrics(self):
+        """Report the shared filter's false-positive estimate on /metrics"""
+        dedup_false_positive_rate.set_function(self.bloom.error_rate_estimate)
@@ -0,0 +1,432 @@
+# Identical copy in web_flask/ and notification_service/: the services are built
+# and deployed separately, each with its own core package. Change both;
+# tests/test_shared_copies.py fails while they differ.
+import glob
+import json
+import logging
+import os
+import struct
+import threading
+from bisect import bisect_left
+from core.shared.shm import SharedMemoryFile, shared_state_dir
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers sub-millisecond cache hits up to requests near the gunicorn timeout
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_USED = struct.Struct('<Q')
+_KEY_LEN = struct.Struct('<I')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if value == float('-inf'):
+        return '-Inf'
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _process_alive(path, prefix):
+    """False only if the file's pid is known to have exited"""
+    pid = os.path.basename(path)[len(prefix) + 1:-len('.shm')]
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (ValueError, PermissionError):
+        pass
+    return True
+
+
+def _read_samples(path):
+    """Yield (key, value) from one process's metrics file"""
+    try:
+        with open(path, 'rb') as f:
+            used = _USED.unpack(f.read(_USED.size))[0]
+            data = f.read(used - _USED.size) if used > _USED.size else b''
+    except (OSError, struct.error):
+        return
+    offset = 0
+    while offset + _KEY_LEN.size <= len(data):
+        key_len = _KEY_LEN.unpack_from(data, offset)[0]
+        value_at = (offset + _KEY_LEN.size + key_len + 7) // 8 * 8
+        if value_at + 8 > len(data):
+            break
+        key = data[offset + _KEY_LEN.size:offset + _KEY_LEN.size + key_len].decode('utf-8')
+        yield key, struct.unpack_from('<d', data, value_at)[0]
+        offset = value_at + 8
+
+
+class MetricsRegistry:
+    """
+    Prometheus-compatible counters, gauges and histograms aggregated across processes
+
+    Every process writes its samples to its own append-only table in a
+    file under /dev/shm (``<prefix>-<pid>.shm``), so an observation is a
+    float update on an mmap with no cross-process locking. A
+    scrape reads and sums the files of all processes, so /metrics served by
+    any gunicorn worker reports totals for the whole server. Files of dead
+    workers are kept so counters never go backwards; clear() removes them
+    when the master starts. Gauges only sum processes that are still
+    alive, or are computed at scrape time by a function.
+
+    >>> metrics = MetricsRegistry()
+    >>> requests = metrics.counter('app_requests_total', 'Requests handled', ('route',))
+    >>> requests.labels('/').inc()
+    >>> latency = metrics.histogram('app_request_duration_seconds', 'Request latency')
+    >>> latency.observe(0.012)
+    >>> print(metrics.render())
+    # HELP app_requests_total Requests handled
+    ...
+
+    """
+    def __init__(self, directory=None, prefix='obo-metrics', size=1 << 20):
+        self.directory = directory
+        self.prefix = prefix
+        self.size = size
+        self.generation = 0
+        self._metrics = {}
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def configure(self, config):
+        """Apply METRICS_CONFIG; must run before the first observation"""
+        self.directory = config.get('directory', self.directory)
+        self.prefix = config.get('prefix', self.prefix)
+        self.size = int(config.get('size', self.size))
+
+    def _reset(self):
+        """Start a fresh table; in a forked child, samples go to the child's own file"""
+        self.lock = threading.Lock()
+        self.generation += 1
+        self._region = None
+        self._values = None
+        self._used = _USED.size
+        self._slots = {}
+        self._overflow = None
+
+    def _path_pattern(self):
+        # Pids only, so 'obo-metrics' does not also match 'obo-metrics-web-<pid>'
+        return os.path.join(self.directory or shared_state_dir(), f'{self.prefix}-[0-9]*.shm')
+
+    def _open(self):
+        self._region = SharedMemoryFile(f'{self.prefix}-{os.getpid()}', self.size, self.directory)
+        buf = self._region.buf
+        self._values = memoryview(buf).cast('d')
+        # A recycled pid finds its predecessor's samples and keeps adding to them
+        used = _USED.unpack_from(buf, 0)[0]
+        if used:
+            offset = _USED.size
+            while offset < used:
+                key_len = _KEY_LEN.unpack_from(buf, offset)[0]
+                value_at = (offset + _KEY_LEN.size + key_len + 7) // 8 * 8
+                key = bytes(buf[offset + _KEY_LEN.size:offset + _KEY_LEN.size + key_len]).decode('utf-8')
+                self._slots[key] = value_at // 8
+                offset = value_at + 8
+            self._used = used
+
+    def slot(self, key):
+        """Return (values, index) of key in this process's table, adding it if new"""
+        with self.lock:
+            if self._values is None:
+                self._open()
+            index = self._slots.get(key)
+            if index is None:
+                encoded = key.encode('utf-8')
+                value_at = (self._used + _KEY_LEN.size + len(encoded) + 7) // 8 * 8
+                if value_at + 8 > self.size:
+                    if self._overflow is None:
+                        logger.warning(f"Metrics table {self._region.path} is full, new series are not exported")
+                        self._overflow = memoryview(bytearray(8)).cast('d')
+                    return self._overflow, 0
+                buf = self._region.buf
+                _KEY_LEN.pack_into(buf, self._used, len(encoded))
+                buf[self._used + _KEY_LEN.size:self._used + _KEY_LEN.size + len(encoded)] = encoded
+                index = value_at // 8
+                self._values[index] = 0.0
+                # Publish the entry only once it is complete, readers stop at `used`
+                self._used = value_at + 8
+                _USED.pack_into(buf, 0, self._used)
+                self._slots[key] = index
+            return self._values, index
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(self, name, documentation, labelnames))
+
+    def collect(self):
+        """Sum the samples of every process: {key: value}"""
+        totals = {}
+        gauges = None
+        for path in glob.glob(self._path_pattern()):
+            live = _process_alive(path, self.prefix)
+            if not live and gauges is None:
+                # Key prefixes of gauge series, a dead worker's level no longer applies
+                gauges = tuple(f'["{name}",' for name, metric in self._metrics.items() if metric.type == 'gauge')
+            for key, value in _read_samples(path):
+                if not live and gauges and key.startswith(gauges):
+                    continue
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+    def render(self):
+        """Text exposition format (version 0.0.4) of all registered metrics"""
+        grouped = {}
+        for key, value in self.collect().items():
+            name, suffix, labelvalues, le = json.loads(key)
+            grouped.setdefault(name, {}).setdefault(tuple(labelvalues), {})[(suffix, le)] = value
+        for name, metric in self._metrics.items():
+            for labelvalues, value in metric.sample_functions():
+                grouped.setdefault(name, {})[labelvalues] = {('', None): value}
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f'# HELP {name} {_escape(metric.documentation)}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            for labelvalues, samples in sorted(grouped.get(name, {}).items()):
+                lines.extend(metric.expose(labelvalues, samples))
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        """Remove every process's samples; run in the master before workers start"""
+        for path in glob.glob(self._path_pattern()):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        with self.lock:
+            if self._region is not None:
+                self._values.release()
+                self._region.close()
+        self._reset()
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, registry, name, documentation, labelnames):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *labelvalues):
+        """Child for one label combination; cache it, lookups are not free"""
+        child = self._children.get(labelvalues)
+        if child is None:
+            if len(labelvalues) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(
+                    labelvalues, self._child([str(value) for value in labelvalues])
+                )
+        return child
+
+    def sample_functions(self):
+        """(labelvalues, value) of series computed at scrape time"""
+        return ()
+
+    def _key(self, suffix, labelvalues, le=None):
+        return json.dumps([self.name, suffix, labelvalues, le], separators=(',', ':'))
+
+    def _labels(self, labelvalues, extra=()):
+        pairs = [*zip(self.labelnames, labelvalues), *extra]
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _CounterChild:
+    __slots__ = ('_registry', '_key', '_generation', '_values', '_index')
+
+    def __init__(self, registry, key):
+        self._registry = registry
+        self._key = key
+        self._generation = None
+
+    def inc(self, amount=1):
+        registry = self._registry
+        if self._generation != registry.generation:
+            self._values, self._index = registry.slot(self._key)
+            self._generation = registry.generation
+        # acquire/release is measurably cheaper than `with` on this hot path
+        lock = registry.lock
+        lock.acquire()
+        self._values[self._index] += amount
+        lock.release()
+
+
+class Counter(_Metric):
+    """Monotonic total; the name should end in ``_total``"""
+    type = 'counter'
+
+    def _child(self, labelvalues):
+        return _CounterChild(self.registry, self._key('', labelvalues))
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def expose(self, labelvalues, samples):
+        yield f'{self.name}{self._labels(labelvalues)} {_format_value(samples.get(("", None), 0.0))}'
+
+
+class _GaugeChild:
+    __slots__ = ('_registry', '_key', '_labelvalues', '_generation', '_values', '_index', 'function')
+
+    def __init__(self, registry, key, labelvalues):
+        self._registry = registry
+        self._key = key
+        self._labelvalues = tuple(labelvalues)
+        self._generation = None
+        self.function = None
+
+    def _update(self, amount, absolute=False):
+        registry = self._registry
+        if self._generation != registry.generation:
+            self._values, self._index = registry.slot(self._key)
+            self._generation = registry.generation
+        lock = registry.lock
+        lock.acquire()
+        if absolute:
+            self._values[self._index] = amount
+        else:
+            self._values[self._index] += amount
+        lock.release()
+
+    def set(self, value):
+        self._update(value, absolute=True)
+
+    def inc(self, amount=1):
+        self._update(amount)
+
+    def dec(self, amount=1):
+        self._update(-amount)
+
+    def set_function(self, function):
+        """Report function() at scrape time, from the scraping process, instead of the stored value"""
+        self.function = function
+
+
+class Gauge(_Metric):
+    """
+    Level that goes up and down, summed over live processes
+
+    Per-process levels (a buffer's depth) are set(), inc() and dec()
+    where they change. Shared state every process can read (a spool's
+    backlog) is better reported by set_function(), which is called by
+    whichever process serves the scrape.
+
+    >>> depth = metrics.gauge('app_buffer_depth', 'Messages waiting in the buffer')
+    >>> depth.inc()
+    >>> backlog = metrics.gauge('app_backlog', 'Pending rows')
+    >>> backlog.set_function(lambda: spool.stats()['backlog'])
+
+    """
+    type = 'gauge'
+
+    def _child(self, labelvalues):
+        return _GaugeChild(self.registry, self._key('', labelvalues), labelvalues)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set_function(self, function):
+        self.labels().set_function(function)
+
+    def sample_functions(self):
+        for child in list(self._children.values()):
+            if child.function is None:
+                continue
+            try:
+                yield child._labelvalues, float(child.function())
+            except Exception as e:
+                logger.warning(f"Gauge {self.name} function failed: {str(e)}")
+
+    def expose(self, labelvalues, samples):
+        yield f'{self.name}{self._labels(labelvalues)} {_format_value(samples.get(("", None), 0.0))}'
+
+
+class _HistogramChild:
+    __slots__ = ('_registry', '_keys', '_bounds', '_generation', '_values', '_buckets', '_sum')
+
+    def __init__(self, registry, keys, bounds):
+        self._registry = registry
+        self._keys = keys
+        self._bounds = bounds
+        self._generation = None
+
+    def _bind(self):
+        slots = [self._registry.slot(key) for key in self._keys]
+        self._values = slots[0][0]
+        self._buckets = [index for _, index in slots[:-1]]
+        self._sum = slots[-1][1]
+        self._generation = self._registry.generation
+
+    def observe(self, value):
+        registry = self._registry
+        if self._generation != registry.generation:
+            self._bind()
+        # Buckets are stored per bucket; render() makes them cumulative and
+        # derives _count from them, so an observation is two float updates
+        bucket = self._buckets[bisect_left(self._bounds, value)]
+        values = self._values
+        lock = registry.lock
+        lock.acquire()
+        values[bucket] += 1
+        values[self._sum] += value
+        lock.release()
+
+
+class Histogram(_Metric):
+    """Latency-style distribution with fixed upper bounds, in seconds by convention"""
+    type = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.bounds = tuple(sorted(float(bound) for bound in buckets))
+        if self.bounds[-1] != float('inf'):
+            self.bounds += (float('inf'),)
+
+    def _child(self, labelvalues):
+        keys = [self._key('_bucket', labelvalues, _format_value(bound)) for bound in self.bounds]
+        keys.append(self._key('_sum', labelvalues))
+        return _HistogramChild(self.registry, keys, self.bounds)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def expose(self, labelvalues, samples):
+        cumulative = 0.0
+        for bound in self.bounds:
+            le = _format_value(bound)
+            cumulative += samples.get(('_bucket', le), 0.0)
+            yield f'{self.name}_bucket{self._labels(labelvalues, [("le", le)])} {_format_value(cumulative)}'
+        yield f'{self.name}_sum{self._labels(labelvalues)} {_format_value(samples.get(("_sum", None), 0.0))}'
+        yield f'{self.name}_count{self._labels(labelvalues)} {_format_value(cumulative)}'
+
+
+# Process-wide registry; the service entry point applies METRICS_CONFIG to it
+metrics = MetricsRegistry()
@@ -0,0 +1,348 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+import weakref
+from core.metrics.registry import metrics
+from core.shared.shm import SharedMemoryFile
+
+logger = logging.getLogger(__name__)
+
+# Read from the spool file by whichever worker serves the scrape, see
+# OutboxSpool.export_metrics()
+outbox_backlog = metrics.gauge(
+    'registration_outbox_backlog',
+    'Spooled messages not yet confirmed by the broker'
+)
+outbox_oldest_pending = metrics.gauge(
+    'registration_outbox_oldest_pending_seconds',
+    'Age of the oldest spooled message not yet confirmed by the broker'
+)
+
+
+_WAKE_COUNTER = struct.Struct('<Q')
+
+# Live spools and replayers, reset by one process-wide fork hook as in
+# rmq_connector; the _pid checks cover processes created without fork hooks
+_instances = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    for instance in list(_instances):
+        instance._reset()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+class _PendingAppend:
+    __slots__ = ('body', 'done', 'error', 'id')
+
+    def __init__(self, body):
+        self.body = body
+        self.done = False
+        self.error = None
+        self.id = None
+
+
+class OutboxSpool:
+    """
+    Write-ahead outbox for messages bound to RabbitMQ
+
+    Messages are appended to a SQLite file (WAL, synchronous=FULL) before the
+    client is acknowledged. Concurrent appends share one commit - and one
+    fsync - through group commit. Delivery progress is a single ``acked_upto``
+    watermark, and acknowledged rows are deleted in bulk by compact().
+
+    >>> spool = OutboxSpool({'path': '/app/spool/outbox.db'})
+    >>> spool.append({'email': 'john@example.com'})
+    1
+    >>> spool.peek(100)
+    [(1, {'email': 'john@example.com'})]
+    >>> spool.ack(1)
+    >>> spool.stats()['backlog']
+    0
+
+    """
+    def __init__(self, config):
+        self.path = config['path']
+        self.compact_threshold = int(config.get('compact_threshold', 10000))
+        self._reset()
+        _instances.add(self)
+
+    def _reset(self):
+        """SQLite connections must not cross fork, so every process opens its own"""
+        self._pid = os.getpid()
+        self._conn = None
+        self._db_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._pending = []
+        self._flushing = False
+        self._stats = {'appended': 0, 'commits': 0, 'compacted': 0}
+
+    def _connection(self):
+        if self._pid != os.getpid():
+            self._reset()
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=FULL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS outbox ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, body TEXT NOT NULL, created REAL NOT NULL)'
+            )
+            conn.execute('CREATE TABLE IF NOT EXISTS outbox_state (id INTEGER PRIMARY KEY CHECK (id = 1), acked_upto INTEGER NOT NULL)')
+            conn.execute('INSERT OR IGNORE INTO outbox_state (id, acked_upto) VALUES (1, 0)')
+            self._conn = conn
+        return self._conn
+
+    def _write(self, bodies):
+        """Insert bodies in one transaction; returns the id of the last row"""
+        with self._db_lock:
+            conn = self._connection()
+            now = time.time()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany('INSERT INTO outbox (body, created) VALUES (?, ?)', [(body, now) for body in bodies])
+                last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return last_id
+
+    def append(self, message):
+        """Durably record message and return its id once it is committed to disk.
+
+        The first waiting thread becomes the flush leader and commits every
+        append queued so far in one transaction, the others wait for it.
+        """
+        entry = _PendingAppend(json.dumps(message))
+        with self._cond:
+            self._pending.append(entry)
+            while not entry.done:
+                if self._flushing:
+                    self._cond.wait()
+                    continue
+                batch, self._pending = self._pending, []
+                self._flushing = True
+                self._cond.release()
+                error, last_id = None, 0
+                try:
+                    last_id = self._write([pending.body for pending in batch])
+                except Exception as e:
+                    error = e
+                finally:
+                    self._cond.acquire()
+                first_id = last_id - len(batch) + 1
+                for index, pending in enumerate(batch):
+                    pending.done = True
+                    pending.error = error
+                    pending.id = first_id + index
+                if error is None:
+                    self._stats['appended'] += len(batch)
+                    self._stats['commits'] += 1
+                self._flushing = False
+                self._cond.notify_all()
+        if entry.error is not None:
+            raise entry.error
+        return entry.id
+
+    def append_many(self, messages):
+        """Durably record messages in a single transaction; returns their ids"""
+        bodies = [json.dumps(message) for message in messages]
+        if not bodies:
+            return []
+        last_id = self._write(bodies)
+        with self._cond:
+            self._stats['appended'] += len(bodies)
+            self._stats['commits'] += 1
+        return list(range(last_id - len(bodies) + 1, last_id + 1))
+
+    def peek(self, limit):
+        """Oldest unacknowledged messages as (id, message) pairs"""
+        with self._db_lock:
+            conn = self._connection()
+            rows = conn.execute(
+                'SELECT id, body FROM outbox WHERE id > (SELECT acked_upto FROM outbox_state) ORDER BY id LIMIT ?',
+                (limit,)
+            ).fetchall()
+        return [(row_id, json.loads(body)) for row_id, body in rows]
+
+    def ack(self, upto_id):
+        """Mark every message with id <= upto_id as delivered"""
+        with self._db_lock:
+            conn = self._connection()
+            conn.execute('UPDATE outbox_state SET acked_upto = MAX(acked_upto, ?) WHERE id = 1', (upto_id,))
+
+    def compact(self, force=False):
+        """Delete acknowledged rows once enough have piled up, then truncate the WAL"""
+        with self._db_lock:
+            conn = self._connection()
+            acked_upto = conn.execute('SELECT acked_upto FROM outbox_state').fetchone()[0]
+            oldest = conn.execute('SELECT MIN(id) FROM outbox').fetchone()[0]
+            if oldest is None or oldest > acked_upto:
+                return 0
+            if not force and acked_upto - oldest + 1 < self.compact_threshold:
+                return 0
+            deleted = conn.execute('DELETE FROM outbox WHERE id <= ?', (acked_upto,)).rowcount
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        with self._cond:
+            self._stats['compacted'] += deleted
+        return deleted
+
+    def stats(self):
+        """Spool backlog and write counters for the current process"""
+        with self._db_lock:
+            conn = self._connection()
+            acked_upto = conn.execute('SELECT acked_upto FROM outbox_state').fetchone()[0]
+            last_id = conn.execute('SELECT MAX(id) FROM outbox').fetchone()[0] or 0
+            oldest = conn.execute(
+                'SELECT created FROM outbox WHERE id > ? ORDER BY id LIMIT 1', (acked_upto,)
+            ).fetchone()
+        with self._cond:
+            stats = dict(self._stats)
+        stats['backlog'] = max(last_id - acked_upto, 0)
+        stats['oldest_pending_age'] = time.time() - oldest[0] if oldest else 0.0
+        return stats
+
+    def export_metrics(self):
+        """Report backlog and oldest pending age on /metrics, read at scrape time"""
+        outbox_backlog.set_function(lambda: self.stats()['backlog'])
+        outbox_oldest_pending.set_function(lambda: self.stats()['oldest_pending_age'])
+
+
+class OutboxReplayer:
+    """
+    Background thread draining an OutboxSpool into RabbitMQ in bulk
+
+    Only one process per spool replays at a time: the thread holds an
+    exclusive flock on ``<path>.lock`` while it is the leader, so gunicorn
+    workers sharing a spool never publish the same rows twice. wake() bumps
+    a counter in shared memory that the idle leader polls every
+    ``wake_poll_interval`` seconds, so an append in any worker is picked up
+    without waiting out ``idle_interval``.
+
+    >>> replayer = OutboxReplayer(spool, rabbitmq_client, {'batch_size': 500})
+    >>> replayer.ensure_started()
+    >>> replayer.wake()  # after an append, to skip the idle wait
+
+    """
+    def __init__(self, spool, client, config=None):
+        config = config or {}
+        self.spool = spool
+        self.client = client
+        self.batch_size = int(config.get('batch_size', 500))
+        self.idle_interval = float(config.get('idle_interval', 1))
+        self.max_backoff = float(config.get('max_backoff', 30))
+        self.wake_poll_interval = float(config.get('wake_poll_interval', 0.01))
+        digest = hashlib.blake2b(os.path.abspath(spool.path).encode('utf-8'), digest_size=8).hexdigest()
+        self._wake_counter = SharedMemoryFile(f'obo-outbox-wake-{digest}', _WAKE_COUNTER.size)
+        self._reset()
+        _instances.add(self)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._lock_file = None
+        self.broker_healthy = True
+        self._stats = {'replayed': 0, 'replay_batches': 0, 'replay_failures': 0}
+
+    def ensure_started(self):
+        """Start the replay thread in this process if it is not running yet"""
+        if self._pid != os.getpid():
+            self._reset()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='outbox-replayer', daemon=True)
+                self._thread.start()
+
+    def _wake_count(self):
+        return _WAKE_COUNTER.unpack_from(self._wake_counter.buf, 0)[0]
+
+    def wake(self):
+        """End the leader's idle wait, whichever worker it runs in"""
+        # Unlocked: racing wakers may lose an increment, but the value still changes
+        _WAKE_COUNTER.pack_into(self._wake_counter.buf, 0, (self._wake_count() + 1) % (1 << 64))
+        self._wakeup.set()
+
+    def _wait_for_work(self, seen):
+        """Sleep up to idle_interval, or until wake() ran in any process since the count was seen"""
+        deadline = time.monotonic() + self.idle_interval
+        while not self._stop.is_set() and self._wake_count() == seen:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if self._wakeup.wait(min(self.wake_poll_interval, remaining)):
+                break
+        self._wakeup.clear()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _try_lead(self):
+        if self._lock_file is None:
+            self._lock_file = open(self.spool.path + '.lock', 'a')
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def replay_once(self):
+        """Publish one batch of pending messages; returns how many were delivered"""
+        rows = self.spool.peek(self.batch_size)
+        if not rows:
+            return 0
+        self.client.publish_batch(message for _, message in rows)
+        self.spool.ack(rows[-1][0])
+        with self._lock:
+            self._stats['replayed'] += len(rows)
+            self._stats['replay_batches'] += 1
+        return len(rows)
+
+    def _run(self):
+        delay = 0.5
+        while not self._stop.is_set():
+            if not self._try_lead():
+                self._stop.wait(self.idle_interval * 5)
+                continue
+            try:
+                # Read before peeking, so a wake() for rows this batch misses is not lost
+                seen = self._wake_count()
+                delivered = self.replay_once()
+                self.broker_healthy = True
+                delay = 0.5
+                if delivered < self.batch_size:
+                    self.spool.compact(force=delivered == 0)
+                    self._wait_for_work(seen)
+            except Exception as e:
+                self.broker_healthy = False
+                with self._lock:
+                    self._stats['replay_failures'] += 1
+                logger.warning(f"Outbox replay failed, retrying in {delay}s: {str(e)}")
+                self._stop.wait(delay)
+                delay = min(delay * 2, self.max_backoff)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['broker_healthy'] = self.broker_healthy
+        return stats
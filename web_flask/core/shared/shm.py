@@ -0,0 +1,128 @@
+# Identical copy in web_flask/ and notification_service/: the services are built
+# and deployed separately, each with its own core package. Change both;
+# tests/test_shared_copies.py fails while they differ.
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+
+def shared_state_dir():
+    """tmpfs when available, so shared files never touch a disk"""
+    return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+class SharedMemoryFile:
+    """
+    Fixed-size, zero-initialised memory region shared by every process that opens it
+
+    Backed by an mmap of a file under /dev/shm, so gunicorn workers (forked
+    or started independently) see the same bytes. locked() excludes other
+    threads via a threading.Lock and other processes via a POSIX record
+    lock, which unlike flock is not shared with forked children.
+
+    >>> region = SharedMemoryFile('obo-dedup', 1 << 20)
+    >>> with region.locked():
+    ...     region.buf[0] = 1
+
+    """
+    def __init__(self, name, size, directory=None):
+        self.path = os.path.join(directory or shared_state_dir(), f'{name}.shm')
+        self.size = size
+        self._open()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _open(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        # Only grows the file, so processes opening an existing region agree on it
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < self.size:
+                os.ftruncate(self._fd, self.size)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        self.buf = mmap.mmap(self._fd, self.size)
+
+    def _after_fork(self):
+        # The mapping itself is inherited; only the thread lock must be fresh
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    @contextmanager
+    def locked(self):
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                yield self.buf
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def close(self):
+        self.buf.close()
+        os.close(self._fd)
+
+
+class SharedHashTable:
+    """
+    Fixed-capacity hash table of ``key -> (value, touched_at)`` in shared memory
+
+    Slots are probed linearly within a small window, so every operation is
+    O(1). Slots not touched for ``idle_after`` seconds count as free and are
+    reused lazily; when a window has no free slot, its least recently
+    touched entry is evicted.
+
+    >>> table = SharedHashTable('obo-rate-limit', capacity=65536)
+    >>> table.transact('ip|10.0.0.1', lambda value, touched_at: ((value or 0) + 1, True), idle_after=60)
+    True
+
+    """
+    _SLOT = struct.Struct('<Qdd')
+
+    def __init__(self, name, capacity=65536, max_probe=8, directory=None):
+        self.capacity = capacity
+        self.max_probe = max_probe
+        self.region = SharedMemoryFile(name, capacity * self._SLOT.size, directory)
+
+    @staticmethod
+    def _hash(key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+        # 0 marks a never-used slot
+        return int.from_bytes(digest, 'little') or 1
+
+    def transact(self, key, fn, idle_after, now=None):
+        """Atomically replace the entry for key with fn(value, touched_at).
+
+        fn receives ``(None, None)`` for a missing or idle key and returns
+        ``(new_value, result)``; the entry is stamped with now and result
+        is returned.
+        """
+        now = time.time() if now is None else now
+        h = self._hash(key)
+        slot_size = self._SLOT.size
+        with self.region.locked() as buf:
+            target, found = None, None
+            oldest, oldest_at = None, float('inf')
+            for probe in range(self.max_probe):
+                offset = ((h + probe) % self.capacity) * slot_size
+                key_hash, value, touched_at = self._SLOT.unpack_from(buf, offset)
+                if key_hash == h:
+                    target = offset
+                    if now - touched_at <= idle_after:
+                        found = (value, touched_at)
+                    break
+                if target is None and (key_hash == 0 or now - touched_at > idle_after):
+                    target = offset
+                elif touched_at < oldest_at:
+                    oldest, oldest_at = offset, touched_at
+            if target is None:
+                target = oldest
+            new_value, result = fn(*(found or (None, None)))
+            self._SLOT.pack_into(buf, target, h, new_value, now)
+        return result
@@ -0,0 +1,64 @@
+import json
+import os
+from flask import url_for
+
+# Hashed files never change content, so clients may cache them forever
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Preferred order when the client accepts several precompressed variants
+ENCODINGS = ('br', 'gzip')
+
+
+class AssetManifest:
+    """
+    Lookup of fingerprinted static assets produced by build_assets.py
+
+    The manifest maps logical names (``css/main.css``) to content-hashed
+    copies under ``static/dist`` plus their precompressed variants. Without
+    a manifest every lookup falls back to the logical name, so development
+    checkouts keep working unbuilt.
+
+    >>> assets = AssetManifest(app.static_folder)
+    >>> assets.resolve('css/main.css')
+    'dist/css/main.3f2a9c1b0d.css'
+    >>> assets.lookup('dist/css/main.3f2a9c1b0d.css')['encodings']
+    {'br': 'dist/css/main.3f2a9c1b0d.css.br', 'gzip': 'dist/css/main.3f2a9c1b0d.css.gz'}
+
+    """
+    def __init__(self, static_folder, manifest_path='dist/manifest.json'):
+        self.static_folder = static_folder
+        self.manifest_path = os.path.join(static_folder, manifest_path)
+        self.assets = {}
+        self.by_path = {}
+        self.load()
+
+    def load(self):
+        """(Re)read the manifest; a missing manifest means unbuilt assets"""
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {'assets': {}}
+        self.assets = manifest['assets']
+        self.by_path = {entry['path']: entry for entry in self.assets.values()}
+
+    def resolve(self, filename):
+        """Fingerprinted path for a logical asset name, or the name itself"""
+        entry = self.assets.get(filename)
+        return entry['path'] if entry else filename
+
+    def lookup(self, path):
+        """Manifest entry for a fingerprinted path, or None"""
+        return self.by_path.get(path)
+
+    def url_for(self, filename):
+        """Jinja helper: ``{{ asset_url('css/main.css') }}``"""
+        return url_for('static', filename=self.resolve(filename))
+
+    @staticmethod
+    def negotiate(entry, accept_encodings):
+        """Pick the best precompressed variant the client accepts"""
+        for encoding in ENCODINGS:
+            if encoding in entry.get('encodings', {}) and accept_encodings[encoding]:
+                return encoding, entry['encodings'][encoding]
+        return None, entry['path']
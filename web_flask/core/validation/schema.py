@@ -0,0 +1,127 @@
+import re
+
+REQUIRED = 'This field is required'
+
+# Printable text only; control characters never belong in names or addresses
+_CONTROL_CHARS = re.compile(r'[\x00-\x1f\x7f]')
+_EMAIL = re.compile(
+    r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*"
+    r"@(?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+[A-Za-z][A-Za-z0-9-]{0,61}[A-Za-z0-9]"
+)
+_TRUE = {'true', '1', 'yes', 'on'}
+_FALSE = {'false', '0', 'no', 'off', ''}
+
+
+class ValidationError(ValueError):
+    """Raised by a field check; the message is reported for that field"""
+
+
+class Field:
+    """Base field: a required value passed through unchanged"""
+
+    def __init__(self, required=True):
+        self.required = required
+
+    def is_blank(self, value):
+        return value is None or value == ''
+
+    def clean(self, value):
+        return value
+
+
+class String(Field):
+    """Text stripped of surrounding whitespace, at most max_length characters"""
+
+    def __init__(self, max_length, required=True):
+        super().__init__(required)
+        self.max_length = max_length
+
+    def is_blank(self, value):
+        return value is None or (isinstance(value, str) and not value.strip())
+
+    def clean(self, value):
+        if not isinstance(value, str):
+            raise ValidationError('Must be a string')
+        value = value.strip()
+        if len(value) > self.max_length:
+            raise ValidationError(f'Must be at most {self.max_length} characters')
+        if _CONTROL_CHARS.search(value):
+            raise ValidationError('Must not contain control characters')
+        return value
+
+
+class Email(String):
+    """Syntactically valid address (dot-atom local part, hostname domain)"""
+
+    def clean(self, value):
+        value = super().clean(value)
+        local, _, _ = value.rpartition('@')
+        if len(local) > 64 or not _EMAIL.fullmatch(value):
+            raise ValidationError('Invalid email address')
+        return value
+
+
+class Boolean(Field):
+    """Coerces JSON booleans, 0/1 and common form strings; accept=True requires True"""
+
+    def __init__(self, required=True, accept=False):
+        super().__init__(required)
+        self.accept = accept
+
+    def clean(self, value):
+        if isinstance(value, bool):
+            coerced = value
+        elif isinstance(value, int) and value in (0, 1):
+            coerced = bool(value)
+        elif isinstance(value, str) and value.strip().lower() in _TRUE | _FALSE:
+            coerced = value.strip().lower() in _TRUE
+        else:
+            raise ValidationError('Must be a boolean')
+        if self.accept and not coerced:
+            raise ValidationError(REQUIRED)
+        return coerced
+
+
+class Schema:
+    """
+    Declarative payload schema compiled once into a flat list of checks
+
+    validate() never raises: it returns the cleaned data, or every failing
+    field with its message, so clients can fix a form in one round trip.
+
+    >>> schema = Schema({'email': Email(255), 'accept_age': Boolean(accept=True)})
+    >>> schema.validate({'email': ' john@example.com ', 'accept_age': 'true'})
+    ({'email': 'john@example.com', 'accept_age': True}, None)
+    >>> schema.validate({'email': 'john@'})
+    (None, {'email': 'Invalid email address', 'accept_age': 'This field is required'})
+
+    """
+    def __init__(self, fields):
+        self.fields = dict(fields)
+        # Bound methods resolved up front keep per-request work to plain calls
+        self._checks = tuple(
+            (name, field.required, field.is_blank, field.clean)
+            for name, field in self.fields.items()
+        )
+
+    def validate(self, payload):
+        if not isinstance(payload, dict):
+            return None, {'payload': 'Expected a JSON object'}
+        data, errors = {}, None
+        for name, required, is_blank, clean in self._checks:
+            value = payload.get(name)
+            if is_blank(value):
+                if required:
+                    errors = errors or {}
+                    errors[name] = REQUIRED
+                else:
+                    data[name] = None
+                continue
+            try:
+                data[name] = clean(value)
+            except ValidationError as e:
+                errors = errors or {}
+                errors[name] = str(e)
+        if errors:
+            return None, errors
+        return data, None
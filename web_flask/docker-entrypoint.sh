@@ -0,0 +1,8 @@
+#!/bin/sh
+set -e
+
+# Rebuild static/dist on start: docker-compose bind-mounts the source over
+# /app, which hides the copy built into the image
+python build_assets.py
+
+exec "$@"
@@ -0,0 +1,119 @@
+"""Gunicorn configuration for web_flask.
+
+    gunicorn --config gunicorn.conf.py run:app
+
+The app is imported once in the master (preload_app) and forked into the
+workers. Connection pools and broker clients reset themselves in the child
+via os.register_at_fork; post_fork then opens each worker's own database
+and RabbitMQ connections before it accepts requests.
+
+Environment:
+    GUNICORN_BIND          listen address (0.0.0.0:5000)
+    GUNICORN_WORKER_CLASS  gthread or gevent, which needs psycogreen (gthread)
+    GUNICORN_WORKERS       worker processes (derived from the CPU limit)
+    GUNICORN_THREADS       threads per gthread worker (8)
+    GUNICORN_CONNECTIONS   concurrent greenlets per gevent worker (1000)
+"""
+import logging
+import math
+import os
+
+logger = logging.getLogger('gunicorn.error')
+
+
+# Same function as notification_service/supervisor.py; the services do not share code, and
+# tests/test_shared_copies.py keeps the two copies identical
+def available_cpus():
+    """CPUs this container may use: affinity mask capped by the cgroup CPU quota"""
+    try:
+        cpus = float(len(os.sched_getaffinity(0)))
+    except AttributeError:
+        cpus = float(os.cpu_count() or 1)
+
+    quota = None
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            limit, period = f.read().split()
+        if limit != 'max':
+            quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+                limit = int(f.read())
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+                period = int(f.read())
+            if limit > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+    return min(cpus, quota) if quota else cpus
+
+
+def default_workers(cpus):
+    # 2 * cores + 1 on real hosts; a fractional quota (compose pins 0.1 CPU)
+    # gets a single worker, since extra processes would only fight over it
+    return max(1, math.floor(2 * cpus) + 1) if cpus >= 1 else 1
+
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+preload_app = True
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_class == 'gevent':
+    try:
+        from gevent import monkey
+        # psycopg2 waits for the server in C, blocking every greenlet of the
+        # worker, unless its wait callback yields to gevent
+        from psycogreen.gevent import patch_psycopg
+    except ImportError as e:
+        logger.warning(f"{e.name} is not installed, falling back to gthread workers")
+        worker_class = 'gthread'
+    else:
+        # Must patch before the preloaded app creates locks and sockets
+        monkey.patch_all()
+        patch_psycopg()
+
+workers = int(os.environ.get('GUNICORN_WORKERS') or default_workers(available_cpus()))
+# Threads also carry the long-lived SSE status streams
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+worker_connections = int(os.environ.get('GUNICORN_CONNECTIONS', 1000))
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+
+def when_ready(server):
+    # The master only touched the database while preloading; it serves no
+    # requests, so close its pooled connections instead of keeping them open
+    from core.connector.postgresql_connector import engines
+    from core.metrics.registry import metrics
+    engines.dispose()
+    # Start counters from zero; files of workers from a previous run would
+    # otherwise be summed into the new totals forever
+    metrics.clear()
+    server.log.info(f"Starting {workers} {worker_class} worker(s)")
+
+
+def post_fork(server, worker):
+    """Open this worker's own connections so the first request does not pay for them"""
+    from core.connector.postgresql_connector import engines
+    from blueprints.api_bluep.endpoint import rabbitmq_client
+
+    try:
+        with engines.get_engine().connect():
+            pass
+    except Exception as e:
+        worker.log.warning(f"Worker {worker.pid}: database not reachable yet: {str(e)}")
+    try:
+        with rabbitmq_client.acquire():
+            pass
+    except Exception as e:
+        worker.log.warning(f"Worker {worker.pid}: RabbitMQ not reachable yet: {str(e)}")
+
+
+def worker_exit(server, worker):
+    from blueprints.api_bluep.endpoint import rabbitmq_client
+    rabbitmq_client.close()
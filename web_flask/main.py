@@ -1,6 +1,8 @@
 import os
 from flask import Flask, send_from_directory, abort, request
-import migration
+from core.static.assets import AssetManifest, IMMUTABLE_CACHE_CONTROL
+from core.metrics.registry import metrics
+from core.metrics.middleware import DEFAULT_ALLOW, RequestMetrics
 from blueprints.api_bluep.endpoint import endpoint as api_bluep
 from blueprints.web_bluep.endpoint import endpoint as web_bluep
 import settings
@@ -12,15 +14,68 @@ app.config['SECRET_KEY'] = settings.SECRET_KEY
 # app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'webm'}
 
-@app.route('/static/<path:filename>')
+# Prometheus metrics summed over all workers via /dev/shm. Set up before the
+# blueprints so request latency includes every other hook
+METRICS_CONFIG = getattr(settings, 'METRICS_CONFIG', {})
+# Own file prefix, so clearing one service's samples never unlinks the other's
+metrics.configure({'prefix': 'obo-metrics-web', **METRICS_CONFIG})
+if METRICS_CONFIG.get('enabled', True):
+    RequestMetrics(
+        app,
+        path=METRICS_CONFIG.get('path', '/metrics'),
+        allow=METRICS_CONFIG.get('allow', DEFAULT_ALLOW)
+    )
+
+static_bytes = metrics.counter(
+    'static_bytes_served_total',
+    'Static file body bytes sent, by content encoding',
+    ('encoding',)
+)
+
+assets = AssetManifest(app.static_folder)
+app.jinja_env.globals['asset_url'] = assets.url_for
+
 def serve_static(filename):
-    """Serve static files securely."""
-    safe_path = os.path.join(app.static_folder, filename)
-    if os.path.isfile(safe_path):
-        return send_from_directory(app.static_folder, filename)
-    else:
+    """Serve static files securely.
+
+    Fingerprinted files from the asset manifest are served without touching
+    the filesystem index, with immutable caching, strong ETags, 304s, Range
+    support and precompressed variants. Anything else falls back to a
+    plain, revalidated send.
+    """
+    entry = assets.lookup(filename)
+    if entry is None:
+        safe_path = os.path.join(app.static_folder, filename)
+        if os.path.isfile(safe_path):
+            return _count_static(send_from_directory(app.static_folder, filename), None)
         abort(404)
 
+    encoding, path = AssetManifest.negotiate(entry, request.accept_encodings)
+    response = send_from_directory(
+        app.static_folder,
+        path,
+        mimetype=entry.get('mimetype'),
+        download_name=os.path.basename(entry['path']),
+        etag=entry['etag'] + (f'-{encoding}' if encoding else ''),
+        conditional=True,
+        max_age=31536000
+    )
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    if entry.get('encodings'):
+        response.vary.add('Accept-Encoding')
+    if encoding:
+        response.content_encoding = encoding
+    return _count_static(response, encoding)
+
+def _count_static(response, encoding):
+    # content_length is the range length for 206 and unset for 304
+    if response.content_length:
+        static_bytes.labels(encoding or 'identity').inc(response.content_length)
+    return response
+
+# Replace Flask's built-in static view, which would otherwise shadow ours
+app.view_functions['static'] = serve_static
+
 app.register_blueprint(api_bluep)
 app.register_blueprint(web_bluep)
 
@@ -1,14 +1,41 @@
+"""Bring the database schema up to date.
+
+Workers only compare the stored schema version at startup; run this once
+per deploy (before starting them) to apply pending migrations explicitly.
+
+    python migration.py            # apply pending migrations
+    python migration.py --check    # exit 1 if migrations are pending
+"""
+import argparse
 import logging
-from core.db.utils import init_db
+import sys
+from core.connector.postgresql_connector import engines
+from core.db.schema_state import SCHEMA_VERSION, current_version, migrate
 from settings import DATABASE_URL
-from main import app
-from flask import request, g
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize database and get session factory
-Session = init_db(DATABASE_URL)
-Session.commit()
-Session.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply pending database schema migrations')
+    parser.add_argument('--check', action='store_true', help='only report whether migrations are pending')
+    args = parser.parse_args()
+
+    engine = engines.get_engine(DATABASE_URL)
+    version = current_version(engine)
+    if args.check:
+        logger.info(f"Schema version {version}, latest {SCHEMA_VERSION}")
+        return 0 if version >= SCHEMA_VERSION else 1
+
+    applied = migrate(engine)
+    if applied:
+        logger.info(f"Applied migrations {applied}, schema is at version {SCHEMA_VERSION}")
+    else:
+        logger.info(f"Schema already at version {version}, nothing to do")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,33 +1,21 @@
 import logging
 from core.db.utils import init_db
+from core.db.session import RequestSessions
+import settings
 from settings import DATABASE_URL
 from main import app
-from flask import request, g
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize database and get session factory
-Session = init_db(DATABASE_URL)
+# One schema-version query per start; migrations only run when it is behind,
+# or fail fast with AUTO_MIGRATE = False when `python migration.py` owns them
+Session = init_db(DATABASE_URL, auto_migrate=getattr(settings, 'AUTO_MIGRATE', True))
 
-# Add session middleware to app context
-@app.before_request
-def db_session_middleware():
-    g.db = Session()
-
-@app.after_request
-def close_db_session(response):
-    if hasattr(g, 'db'):
-        g.db.commit()
-        g.db.close()
-    return response
-
-@app.teardown_request
-def handle_exception(exc):
-    if exc and hasattr(g, 'db'):
-        g.db.rollback()
-    return exc
+# Sessions are opened lazily on first access to g.db, so requests that never
+# touch the database skip checkout and commit entirely
+request_sessions = RequestSessions(Session, app)
 
 if __name__ == '__main__':
     logger.info("Starting server...")